@@ -0,0 +1,241 @@
+"""
+Persistent assistant registry.
+
+The example scripts used to create an assistant at start-up and delete it on
+exit. That costs a blocking round trip at both ends and leaks an assistant
+every time a script is killed. The registry instead keeps the assistant ID in
+a small JSON file, keyed by a hash of the assistant definition, and only
+creates a new assistant when the definition changes.
+
+Scripts started at the same time share the file: it is only read and
+written under an exclusive lock (fcntl.flock on .assistants.lock), and
+rewritten atomically. Assistants whose entries have not been used for
+STALE_AFTER are deleted in the background; run this module to prune them
+by hand.
+
+Usage:
+    from assistant_registry import get_assistant
+
+    assistant = get_assistant(
+        client,
+        name="BOT",
+        instructions="You are a chat bot ...",
+        model="gpt-4-1106-preview",
+    )
+
+    python3 assistant_registry.py prune --days 7
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, the registry is then only locked within the process
+    fcntl = None
+
+from startup import lazy_import
+
+openai = lazy_import("openai")
+
+REGISTRY_FILE = Path(__file__).parent / ".assistants.json"
+STALE_AFTER = 30 * 24 * 3600  # seconds an entry may stay unused before it is deleted
+
+_lock = threading.Lock()
+_gc_started = False
+
+
+def definition_hash(name, instructions, model, tools=None, **kwargs):
+    """
+    Hash everything that defines an assistant, so that any change in the
+    name, instructions, model or tools yields a new registry key.
+    """
+    definition = dict(kwargs, name=name, instructions=instructions, model=model, tools=tools or [])
+    raw = json.dumps(definition, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+@contextlib.contextmanager
+def _locked():
+    """ Hold the registry lock of this process and, where fcntl exists, of all processes. """
+    with _lock:
+        if fcntl is None:
+            yield
+            return
+        with open(REGISTRY_FILE.with_suffix(".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _load():
+    try:
+        with open(REGISTRY_FILE, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save(entries):
+    # write to a temporary file first so a killed process never leaves a half-written registry
+    fd, tmp_path = tempfile.mkstemp(prefix=".assistants.", suffix=".tmp", dir=REGISTRY_FILE.parent)
+    try:
+        with os.fdopen(fd, "w") as file:
+            json.dump(entries, file, indent=2)
+        os.replace(tmp_path, REGISTRY_FILE)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class AssistantRef:
+    """ The assistant of a registry entry; its ``id`` changes if the assistant had to be recreated. """
+
+    def __init__(self, id, name, model):
+        self._id = id
+        self._lock = threading.Lock()
+        self.name = name
+        self.model = model
+
+    @property
+    def id(self):
+        with self._lock:
+            return self._id
+
+    def replace(self, old_id, new_id):
+        """ Switch to ``new_id`` unless the ID has changed from ``old_id`` in the meantime. """
+        with self._lock:
+            if self._id == old_id:
+                self._id = new_id
+
+
+def _create(client, name, instructions, model, tools, kwargs):
+    params = dict(kwargs, name=name, instructions=instructions, model=model)
+    if tools:
+        params["tools"] = tools
+    return client.beta.assistants.create(**params)
+
+
+def get_assistant(client, name, instructions, model, tools=None, assistant_id=None, **kwargs):
+    """
+    Return an assistant matching the given definition.
+
+    :param client: The openai.OpenAI client.
+    :param assistant_id: Optional pinned assistant ID (e.g. OPENAI_ASSISTANT_ID
+        from keys.py). A real ID ("asst_...") bypasses the registry.
+    :param kwargs: Extra arguments for client.beta.assistants.create.
+    :return: An object with ``id``, ``name`` and ``model`` attributes.
+    """
+    if assistant_id and assistant_id.startswith("asst_"):
+        return client.beta.assistants.retrieve(assistant_id)
+
+    key = definition_hash(name, instructions, model, tools, **kwargs)
+    # held across the create, so two scripts starting together do not both create the assistant
+    with _locked():
+        entries = _load()
+        entry = entries.get(key)
+        created = entry is None
+        if created:
+            assistant = _create(client, name, instructions, model, tools, kwargs)
+            entry = {"id": assistant.id, "name": name, "model": model}
+        entry["last_used"] = time.time()
+        entries[key] = entry
+        _save(entries)
+
+    ref = AssistantRef(entry["id"], entry["name"], entry["model"])
+    # Check the reused ID and clean up old entries without blocking the caller
+    threading.Thread(
+        target=_background_check,
+        args=(client, key, ref, None if created else (name, instructions, model, tools, kwargs)),
+        daemon=True,
+    ).start()
+    return ref
+
+
+def _background_check(client, key, ref, definition):
+    global _gc_started
+    try:
+        if definition is not None:
+            _check(client, key, ref, definition)
+        with _lock:
+            if _gc_started:
+                return
+            _gc_started = True
+        collect_garbage(client, keep=(key,))
+    except Exception as e:
+        # nobody waits for this thread, the error would be lost otherwise
+        print(f"Error checking assistant {ref.name}: {e}")
+
+
+def _check(client, key, ref, definition):
+    old_id = ref.id
+    try:
+        client.beta.assistants.retrieve(old_id)
+        return
+    except openai.NotFoundError:
+        pass
+    # The assistant was deleted remotely, e.g. by an older script: recreate it,
+    # unless another process has already done so
+    with _locked():
+        entries = _load()
+        entry = entries.get(key)
+        if entry is not None and entry["id"] != old_id:
+            new_id = entry["id"]
+        else:
+            new_id = _create(client, *definition).id
+            if entry is None:
+                # the entry was pruned meanwhile, e.g. by collect_garbage() in another process
+                entry = entries[key] = {"id": new_id, "name": ref.name, "model": ref.model}
+            entry["id"] = new_id
+            entry["last_used"] = time.time()
+            _save(entries)
+    ref.replace(old_id, new_id)
+
+
+def collect_garbage(client, max_age=STALE_AFTER, keep=()):
+    """
+    Delete assistants whose registry entries have not been used for ``max_age`` seconds.
+
+    :return: The registry keys of the deleted entries.
+    """
+    now = time.time()
+    with _locked():
+        entries = _load()
+        stale = {
+            key: entry for key, entry in entries.items()
+            if key not in keep and now - entry.get("last_used", 0) > max_age
+        }
+    pruned = []
+    for key, entry in stale.items():
+        try:
+            client.beta.assistants.delete(entry["id"])
+        except openai.NotFoundError:
+            pass
+        except openai.OpenAIError:
+            continue  # try again on the next run
+        with _locked():
+            entries = _load()
+            entries.pop(key, None)
+            _save(entries)
+        pruned.append(key)
+    return pruned
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete assistants whose registry entries have not been used.")
+    parser.add_argument("command", choices=["prune"])
+    parser.add_argument("--days", type=float, default=STALE_AFTER / 86400, help="Unused for longer than this")
+    args = parser.parse_args()
+
+    from keys import OPENAI_API_KEY
+
+    pruned = collect_garbage(openai.OpenAI(api_key=OPENAI_API_KEY), max_age=args.days * 86400)
+    print(f"{len(pruned)} assistants deleted")
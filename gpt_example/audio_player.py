@@ -0,0 +1,631 @@
+"""
+In-process audio playback engine.
+
+Spawning mplayer for every utterance pays process start-up, codec set-up and
+ALSA device open each time. AudioPlayer opens the output device once, keeps
+it open, and plays clips from a queue on a background thread. Clips are
+decoded in memory: WAV and raw PCM (the OpenAI TTS "pcm" format: 24 kHz,
+16-bit, mono) need no extra package; MP3 needs the optional ``miniaudio``
+package.
+
+Speech can also be played while it is still downloading: open_stream()
+queues a StreamClip that is fed chunk by chunk and starts playing once a
+short jitter buffer is filled, so nothing is written to the SD card.
+
+The player is the one audio output of a script, producers only queue clips
+and never wait for the device unless they ask to:
+
+    - clips play by priority (ALARM, SPEECH, MUSIC), in order within one.
+      A more urgent clip preempts the one playing, which resumes where it
+      stopped once the urgent ones have played
+    - a clip queued with a ``key`` that is already waiting (e.g. the same
+      alert twice) is not queued again, the waiting clip is returned
+    - mix() plays short effects such as a beep over whatever is playing,
+      or over silence; longer sounds are queued like any other clip
+    - the level of what was written recently is kept as the echo reference
+      that lets the microphone listen while the speaker plays, see
+      EchoGate in vad.py; stop(SPEECH) silences a reply but not an alarm,
+      and only the clips queued before it, not the next reply
+
+Usage:
+    from audio_player import ALARM, get_player
+
+    player = get_player()
+    player.play("speech.pcm")                   # blocks until played
+    player.play("alert.pcm", wait=False, priority=ALARM, key="door")
+    player.mix_pcm(beep)                        # over whatever is playing
+
+    clip = player.open_stream(gain_db=3)
+    for chunk in response.iter_bytes():
+        clip.feed(chunk)
+    clip.end()
+
+It can also be run directly to play files:
+    python3 audio_player.py ../music/doorbell.wav
+"""
+import collections
+import heapq
+import itertools
+import os
+import queue
+import sys
+import threading
+import time
+import wave
+from pathlib import Path
+
+from startup import wait_speaker
+from vad import rms
+
+RATE = 24000        # device sample rate, the native rate of OpenAI TTS
+CHANNELS = 1
+SAMPLE_WIDTH = 2    # 16-bit
+CHUNK = 1024        # frames written per device call, about 40 ms
+PCM_RATE = 24000    # sample rate of headerless .pcm clips
+JITTER_MS = 150     # audio buffered before a stream starts playing
+ECHO_WINDOW = 0.5   # seconds of output the echo reference covers: device latency plus room reverb
+
+# clip priorities, lower plays first
+ALARM = 0
+SPEECH = 10
+MUSIC = 20
+
+
+def redirect_error_2_null():
+    # PortAudio prints a page of ALSA warnings when it starts, hide them
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    old_stderr = os.dup(2)
+    sys.stderr.flush()
+    os.dup2(devnull, 2)
+    os.close(devnull)
+    return old_stderr
+
+
+def cancel_redirect_error(old_stderr):
+    os.dup2(old_stderr, 2)
+    os.close(old_stderr)
+
+
+def convert(data, rate, channels, out_rate=RATE, out_channels=CHANNELS):
+    """
+    Convert 16-bit PCM bytes to the device format (rate and channel count).
+    """
+    if rate == out_rate and channels == out_channels:
+        return data
+    import numpy as np
+
+    samples = np.frombuffer(data, dtype=np.int16).reshape(-1, channels).astype(np.float32)
+    if channels != out_channels:
+        mono = samples.mean(axis=1, keepdims=True)
+        samples = np.repeat(mono, out_channels, axis=1)
+    if rate != out_rate:
+        n_out = int(len(samples) * out_rate / rate)
+        x_old = np.arange(len(samples))
+        x_new = np.linspace(0, len(samples) - 1, n_out)
+        samples = np.stack([np.interp(x_new, x_old, samples[:, c]) for c in range(out_channels)], axis=1)
+    return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+
+def apply_gain(data, gain_db):
+    """
+    Scale 16-bit PCM bytes by ``gain_db`` decibels, clipping at full scale.
+    """
+    if not gain_db:
+        return data
+    import numpy as np
+
+    samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+    samples *= 10 ** (gain_db / 20)
+    return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+
+def decode(path):
+    """
+    Decode an audio file into (pcm_bytes, rate, channels).
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".wav":
+        with wave.open(str(path), "rb") as wav:
+            if wav.getsampwidth() != SAMPLE_WIDTH:
+                raise ValueError(f"Unsupported sample width: {wav.getsampwidth() * 8} bit")
+            return wav.readframes(wav.getnframes()), wav.getframerate(), wav.getnchannels()
+    if suffix == ".pcm":
+        return path.read_bytes(), PCM_RATE, 1
+    if suffix == ".mp3":
+        import miniaudio  # pip install miniaudio
+
+        decoded = miniaudio.decode_file(str(path), output_format=miniaudio.SampleFormat.SIGNED16)
+        return decoded.samples.tobytes(), decoded.sample_rate, decoded.nchannels
+    raise ValueError(f"Unsupported audio file: {path}")
+
+
+def mix_into(data, effects):
+    """
+    Add the next ``len(data)`` bytes of each Effect to 16-bit PCM ``data``.
+
+    :return: The mixed bytes, and the effects that have been played to the end.
+    """
+    import numpy as np
+
+    mixed = np.frombuffer(data, dtype=np.int16).astype(np.int32)
+    finished = []
+    for effect in effects:
+        part = effect.data[effect.position:effect.position + len(data)]
+        effect.position += len(part)
+        mixed[:len(part) // SAMPLE_WIDTH] += np.frombuffer(part, dtype=np.int16)
+        if effect.position >= len(effect.data):
+            finished.append(effect)
+    return np.clip(mixed, -32768, 32767).astype(np.int16).tobytes(), finished
+
+
+class Clip:
+    """
+    A queued piece of audio in device format.
+
+    :param priority: ALARM, SPEECH or MUSIC, or any number, lower plays first.
+    :param key: Clips with the same key and priority are queued only once.
+    """
+
+    def __init__(self, data, priority=SPEECH, key=None):
+        self.data = data
+        self.priority = priority
+        self.key = key
+        self.seq = None         # order of queueing, kept when the clip is preempted
+        self.epoch = 0          # AudioPlayer.epoch when queued, a later stop() covers it
+        self.position = 0       # bytes played, a preempted clip resumes here
+        self.done = threading.Event()
+        self.started_at = None  # time.monotonic() of the first write to the device
+
+
+class Effect:
+    """ A short sound mixed over the other clips, see AudioPlayer.mix(). """
+
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+        self.done = threading.Event()
+
+
+class ClipQueue:
+    """
+    Clips waiting to be played, the most urgent first and in order within a
+    priority. Like queue.Queue, join() waits until every clip put is done.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.condition = threading.Condition()
+        self.seq = itertools.count()
+        self.unfinished = 0
+        self.woken = False
+
+    def put(self, clip, requeue=False):
+        """
+        Queue a clip, unless one with the same key and priority is waiting
+        and has not started yet. Streams are always queued, their producer
+        would feed the other one.
+
+        :param requeue: The clip was preempted and keeps its place.
+        :return: The queued clip, or the waiting one it was coalesced with.
+        """
+        with self.condition:
+            if not requeue:
+                if clip.key is not None and not isinstance(clip, StreamClip):
+                    waiting = self._waiting(clip.key, clip.priority)
+                    if waiting is not None:
+                        return waiting
+                clip.seq = next(self.seq)
+                self.unfinished += 1
+            heapq.heappush(self.heap, (clip.priority, clip.seq, clip))
+            self.condition.notify_all()
+        return clip
+
+    def waiting(self, key, priority):
+        """ The queued clip with this key and priority that has not started yet, or None. """
+        with self.condition:
+            return self._waiting(key, priority)
+
+    def _waiting(self, key, priority):
+        for _, _, clip in self.heap:
+            # a preempted clip is queued again, but a repeat of it would be cut short
+            if clip.key == key and clip.priority == priority and clip.started_at is None:
+                return clip
+        return None
+
+    def get(self, timeout=None):
+        """ The most urgent clip, None after ``timeout`` seconds or a wake(). """
+        with self.condition:
+            self.condition.wait_for(lambda: self.heap or self.woken, timeout)
+            self.woken = False
+            return heapq.heappop(self.heap)[2] if self.heap else None
+
+    def wake(self):
+        """ Make a waiting get() return. """
+        with self.condition:
+            self.woken = True
+            self.condition.notify_all()
+
+    def first_priority(self):
+        with self.condition:
+            return self.heap[0][0] if self.heap else None
+
+    def drain(self, priority=None):
+        """ Remove and return the waiting clips of ``priority`` or less urgent, all when None. """
+        with self.condition:
+            if priority is None:
+                clips = [clip for _, _, clip in self.heap]
+                self.heap.clear()
+                return clips
+            clips = [clip for _, _, clip in self.heap if clip.priority >= priority]
+            self.heap = [entry for entry in self.heap if entry[2].priority < priority]
+            heapq.heapify(self.heap)
+            return clips
+
+    def task_done(self):
+        with self.condition:
+            self.unfinished -= 1
+            self.condition.notify_all()
+
+    def join(self):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.unfinished)
+
+    def empty(self):
+        with self.condition:
+            return not self.heap
+
+
+class StreamClip:
+    """
+    A queued piece of audio whose data is still arriving.
+
+    Chunks may have any length: they are realigned to whole frames, converted
+    to the device format and scaled by ``gain_db`` as they are fed.
+
+    :param jitter_bytes: Device bytes buffered before playback starts, so a
+        slow chunk does not make the output underrun right away.
+    :param priority: See Clip.
+    :param key: See Clip.
+    """
+
+    def __init__(self, rate, channels, out_rate, out_channels, gain_db=0, jitter_bytes=0, priority=SPEECH, key=None):
+        self.rate = rate
+        self.channels = channels
+        self.out_rate = out_rate
+        self.out_channels = out_channels
+        self.gain_db = gain_db
+        self.jitter_bytes = jitter_bytes
+        self.frame_bytes = channels * SAMPLE_WIDTH
+        self.priority = priority
+        self.key = key
+        self.seq = None
+        self.epoch = 0
+        self.leftover = b""     # the rest of the chunk a preemption cut into
+        self.pending = b""
+        self.chunks = queue.Queue()
+        self.buffered = 0
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self.fed_at = None      # time.monotonic() of the first chunk
+        self.started_at = None  # time.monotonic() of the first write to the device
+
+    def feed(self, chunk):
+        """ Add raw 16-bit PCM bytes in the source format. """
+        if self.fed_at is None:
+            self.fed_at = time.monotonic()
+        data = self.pending + chunk
+        whole = len(data) - len(data) % self.frame_bytes
+        self.pending = data[whole:]
+        if not whole:
+            return
+        data = convert(data[:whole], self.rate, self.channels, self.out_rate, self.out_channels)
+        data = apply_gain(data, self.gain_db)
+        self.chunks.put(data)
+        self.buffered += len(data)
+        if self.buffered >= self.jitter_bytes:
+            self.ready.set()
+
+    def end(self):
+        """ Mark the stream as complete, an incomplete trailing frame is dropped. """
+        self.pending = b""
+        self.chunks.put(None)
+        self.ready.set()
+
+
+class AudioPlayer:
+    """
+    :param rate: Output sample rate.
+    :param channels: Output channel count.
+    :param device: PyAudio output device index, None for the default device.
+    :param output: An object with write(bytes) used instead of a PyAudio
+        stream, e.g. a null sink for benchmarks.
+    """
+
+    def __init__(self, rate=RATE, channels=CHANNELS, device=None, output=None):
+        self.rate = rate
+        self.channels = channels
+        self.frame_bytes = channels * SAMPLE_WIDTH
+        self.clips = ClipQueue()
+        self.current = None
+        self.effects = []
+        self.effects_lock = threading.Lock()
+        self.epoch = 0             # bumped by stop(), clips keep the one they were queued in
+        self.stopped = {}          # priority of a stop() (None for all) -> the epoch it started
+        self.reference = collections.deque(maxlen=64)  # (time.monotonic(), rms) of the chunks written
+        self.pa = None
+        self.stream = output
+        if output is None:
+            self._open(device)
+
+        self.thread = threading.Thread(target=self._play_loop, daemon=True)
+        self.thread.start()
+
+    def _open(self, device):
+        import pyaudio  # already required by speech_recognition.Microphone
+
+        old_stderr = redirect_error_2_null()
+        try:
+            self.pa = pyaudio.PyAudio()
+            self.stream = self.pa.open(
+                format=pyaudio.paInt16,
+                channels=self.channels,
+                rate=self.rate,
+                output=True,
+                output_device_index=device,
+                frames_per_buffer=CHUNK,
+            )
+        finally:
+            cancel_redirect_error(old_stderr)
+
+    def play(self, source, wait=True, gain_db=0, priority=SPEECH, key=None):
+        """
+        Queue an audio file for playback.
+
+        :param source: Path of a .wav, .pcm or .mp3 file.
+        :param wait: Block until the clip has been played.
+        :param gain_db: Volume change in decibels, applied in memory.
+        :param priority: ALARM, SPEECH or MUSIC, a more urgent clip preempts the one playing.
+        :param key: Not queued again while a clip with this key and priority is waiting.
+        :return: The queued Clip.
+        """
+        if key is not None:
+            waiting = self.waiting(key, priority)
+            if waiting is not None:
+                return self._wait(waiting, wait)
+        data, rate, channels = decode(source)
+        return self.play_pcm(data, rate, channels, wait, gain_db, priority, key)
+
+    def play_pcm(self, data, rate=PCM_RATE, channels=1, wait=True, gain_db=0, priority=SPEECH, key=None):
+        """ Queue 16-bit PCM bytes for playback. """
+        data = convert(data, rate, channels, out_rate=self.rate, out_channels=self.channels)
+        clip = self._queue(Clip(apply_gain(data, gain_db), priority, key))
+        return self._wait(clip, wait)
+
+    def open_stream(self, rate=PCM_RATE, channels=1, gain_db=0, jitter_ms=JITTER_MS, priority=SPEECH, key=None):
+        """
+        Queue a StreamClip and return it, the caller feeds it and ends it.
+        It plays in turn with the other clips once ``jitter_ms`` of audio is buffered.
+        Streams are not coalesced, check waiting() for ``key`` before synthesizing.
+        """
+        jitter_bytes = int(self.rate * jitter_ms / 1000) * self.frame_bytes
+        clip = StreamClip(rate, channels, self.rate, self.channels, gain_db, jitter_bytes, priority, key)
+        return self._queue(clip)
+
+    def waiting(self, key, priority=SPEECH):
+        """ The queued clip that has not started yet with this key and priority, or None. """
+        return self.clips.waiting(key, priority)
+
+    def mix(self, source, gain_db=0, wait=False):
+        """
+        Play a short file over the clips that are playing, without queueing it.
+        The whole sound is kept in memory and cannot be preempted, queue
+        anything longer than a second or so with play() instead.
+
+        :return: The Effect, its ``done`` event is set once it has been played.
+        """
+        data, rate, channels = decode(source)
+        return self.mix_pcm(data, rate, channels, gain_db, wait)
+
+    def mix_pcm(self, data, rate=PCM_RATE, channels=1, gain_db=0, wait=False):
+        """ Mix 16-bit PCM bytes over the clips that are playing. """
+        data = convert(data, rate, channels, out_rate=self.rate, out_channels=self.channels)
+        effect = Effect(apply_gain(data, gain_db))
+        with self.effects_lock:
+            self.effects.append(effect)
+        self.clips.wake()
+        return self._wait(effect, wait)
+
+    def _queue(self, clip):
+        # a more urgent clip preempts the current one at its next chunk, see _interrupted()
+        with self.clips.condition:
+            clip.epoch = self.epoch
+            return self.clips.put(clip)
+
+    @staticmethod
+    def _wait(clip, wait):
+        if wait:
+            clip.done.wait()
+        return clip
+
+    def is_playing(self):
+        return self.current is not None or not self.clips.empty() or bool(self.effects)
+
+    def wait(self):
+        """ Block until everything queued so far has been played. """
+        self.clips.join()
+        for effect in list(self.effects):
+            effect.done.wait()
+
+    def echo_reference(self, window=ECHO_WINDOW):
+        """ RMS of the loudest chunk written in the last ``window`` seconds, 0 when silent. """
+        since = time.monotonic() - window
+        return max((level for at, level in list(self.reference) if at >= since), default=0)
+
+    def stop(self, priority=None):
+        """
+        Drop queued clips and cut the current clip short. Clips queued
+        afterwards play as usual.
+
+        :param priority: Only stop clips of this priority or less urgent ones,
+            e.g. SPEECH to silence a reply but not an alarm. None stops every
+            clip and the effects.
+        """
+        with self.clips.condition:
+            self.epoch += 1
+            self.stopped[priority] = self.epoch
+            stale = self.clips.drain(priority)
+        for clip in stale:
+            clip.done.set()
+            self.clips.task_done()
+        if priority is not None:
+            return
+        with self.effects_lock:
+            effects, self.effects = self.effects, []
+        for effect in effects:
+            effect.done.set()
+
+    def close(self):
+        self.stop()
+        if self.pa is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.pa.terminate()
+
+    def _play_loop(self):
+        step = CHUNK * self.frame_bytes
+        while True:
+            # poll while effects play, they are written even when no clip is queued
+            clip = self.clips.get(timeout=0 if self.effects else None)
+            if clip is None:
+                if self.effects:
+                    self._write_effects(step)
+                continue
+            if self._stopped(clip):
+                # taken off the queue just before a stop() could drain it
+                clip.done.set()
+                self.clips.task_done()
+                continue
+            self.current = clip
+            # the speaker may still be being enabled in the background, see startup.py
+            wait_speaker()
+            complete = True
+            try:
+                if isinstance(clip, StreamClip):
+                    complete = self._play_stream(clip, step)
+                else:
+                    clip.position += self._write(clip, clip.data[clip.position:], step)
+                    complete = clip.position >= len(clip.data)
+            except Exception as e:
+                print(f"Error playing audio: {e}")
+            finally:
+                self.current = None
+            if not complete and not self._stopped(clip):
+                # resumes once the more urgent clips have played
+                self.clips.put(clip, requeue=True)
+            else:
+                clip.done.set()
+                self.clips.task_done()
+
+    def _interrupted(self, clip):
+        """ Whether the clip is stopped, or preempted by a more urgent one. """
+        if self._stopped(clip):
+            return True
+        first = self.clips.first_priority()
+        return first is not None and first < clip.priority
+
+    def _stopped(self, clip):
+        """ Whether a stop() covering the clip's priority came after it was queued. """
+        return any(
+            clip.epoch < epoch and (priority is None or clip.priority >= priority)
+            for priority, epoch in list(self.stopped.items())
+        )
+
+    def _write(self, clip, data, step):
+        """ Write ``data`` with the effects mixed in, return the bytes written before an interruption. """
+        if clip.started_at is None:
+            clip.started_at = time.monotonic()
+        for start in range(0, len(data), step):
+            if self._interrupted(clip):
+                return start
+            self._output(self._mixed(data[start:start + step]))
+        return len(data)
+
+    def _mixed(self, data):
+        if not self.effects:
+            return data
+        with self.effects_lock:
+            data, finished = mix_into(data, self.effects)
+            for effect in finished:
+                self.effects.remove(effect)
+        for effect in finished:
+            effect.done.set()
+        return data
+
+    def _write_effects(self, step):
+        """ Write one chunk of the effects over silence. """
+        self._output(self._mixed(bytes(step)))
+
+    def _output(self, data):
+        self.stream.write(data)
+        self.reference.append((time.monotonic(), rms(data)))
+
+    def _play_stream(self, clip, step):
+        """ Play a StreamClip, return whether it was played to the end. """
+        # poll so that stop() also works while the stream is starved
+        while not clip.ready.wait(0 if self.effects else 0.05):
+            if self._interrupted(clip):
+                return False
+            if self.effects:
+                self._write_effects(step)
+        while True:
+            if clip.leftover:
+                data, clip.leftover = clip.leftover, b""
+            else:
+                if self._interrupted(clip):
+                    return False
+                try:
+                    data = clip.chunks.get(timeout=0 if self.effects else 0.05)
+                except queue.Empty:
+                    if self.effects:
+                        self._write_effects(step)
+                    continue
+                if data is None:
+                    return True
+            written = self._write(clip, data, step)
+            if written < len(data):
+                clip.leftover = data[written:]
+                return False
+
+
+_player = None
+_player_lock = threading.Lock()
+
+
+def get_player():
+    """ Return the process-wide AudioPlayer, opening the device on first use. """
+    global _player
+    with _player_lock:
+        if _player is None:
+            _player = AudioPlayer()
+        return _player
+
+
+def is_busy():
+    """ Whether the shared player is playing, without opening the device. """
+    return _player is not None and _player.is_playing()
+
+
+def echo_reference():
+    """ The shared player's echo reference, 0 when there is no player. """
+    return _player.echo_reference() if _player is not None else 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} FILE [FILE ...]")
+        sys.exit(1)
+    player = get_player()
+    for file in sys.argv[1:]:
+        player.play(file, wait=False)
+    player.wait()
@@ -0,0 +1,90 @@
+"""
+Prompt tokens of the sensor context, before and after sensor_context.py.
+
+Encodes a sample payload of each script the way it used to be sent (str()
+of the data) and with its ContextEncoder, and prints the token counts and
+the compact text, so the kept fields can be checked against the assistant's
+instructions.
+
+Usage:
+    python3 benchmark_context.py
+    python3 benchmark_context.py --lifts 60
+"""
+import argparse
+import math
+import random
+
+from sensor_context import ContextEncoder
+
+# the fields gpt_fun_weather.py declares, it cannot be imported without its hardware
+WEATHER_FIELDS = {
+    "city": "name",
+    "sky": "weather.0.description",
+    "temp": "main.temp",
+    "feels_like": "main.feels_like",
+    "humidity": "main.humidity",
+    "wind": "wind.speed",
+    "rain_1h": "rain.1h",
+    "snow_1h": "snow.1h",
+}
+
+# a reply of the OpenWeather current weather API
+WEATHER = {
+    "coord": {"lon": 114.0683, "lat": 22.5455},
+    "weather": [{"id": 500, "main": "Rain", "description": "light rain", "icon": "10d"}],
+    "base": "stations",
+    "main": {
+        "temp": 27.83, "feels_like": 31.94, "temp_min": 27.83, "temp_max": 27.83,
+        "pressure": 1008, "humidity": 78, "sea_level": 1008, "grnd_level": 1006,
+    },
+    "visibility": 10000,
+    "wind": {"speed": 4.12, "deg": 153, "gust": 6.21},
+    "rain": {"1h": 0.38},
+    "clouds": {"all": 75},
+    "dt": 1729678574,
+    "sys": {"type": 1, "id": 9620, "country": "CN", "sunrise": 1729636712, "sunset": 1729678212},
+    "timezone": 28800,
+    "id": 1795565,
+    "name": "Shenzhen",
+    "cod": 200,
+}
+
+# the sensors of gpt_fun_plant.py and the fields it declares, the dht11 reads (humidity, temperature)
+PLANT = {"light": 2871, "moisture": 3012, "climate": (62.0, 25.0)}
+PLANT_FIELDS = {"light": "light", "moisture": "moisture", "temperature": "climate.1", "humidity": "climate.0"}
+
+
+def dumbbell_set(lifts, start=1729678574.123456):
+    """ (timestamp, speed) of a set that slowly gets slower, as gpt_fun_dumbbell.py records it. """
+    t = start
+    data = []
+    for i in range(lifts):
+        t += random.uniform(1.8, 2.6)
+        data.append((t, abs(0.45 - 0.004 * i + 0.05 * math.sin(i) + random.gauss(0, 0.02))))
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lifts", type=int, default=30, help="Lifts in the sample dumbbell set")
+    args = parser.parse_args()
+
+    message = "What should I wear today?"
+    cases = [
+        ("weather", ContextEncoder(WEATHER_FIELDS), WEATHER, {"message": message}),
+        ("plant", ContextEncoder(PLANT_FIELDS), PLANT, {"message": "How do you feel?"}),
+        ("dumbbell", ContextEncoder(precision=2), {"lifts": args.lifts, "speed": dumbbell_set(args.lifts)}, {}),
+    ]
+    print(f"{'payload':>10} {'before':>8} {'after':>8}   tokens")
+    texts = []
+    for name, encoder, payload, extra in cases:
+        texts.append((name, encoder.encode(payload, **extra)))
+        saved = 1 - encoder.tokens / encoder.raw_tokens
+        print(f"{name:>10} {encoder.raw_tokens:>8} {encoder.tokens:>8}   {saved:.0%} saved")
+    print()
+    for name, text in texts:
+        print(f"{name:>10}: {text}")
+
+
+if __name__ == "__main__":
+    main()
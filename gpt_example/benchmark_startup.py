@@ -0,0 +1,151 @@
+"""
+Start-up benchmark of the example scripts: time to ready, with and without
+the fast start-up of startup.py.
+
+The scripts need their hardware, so they are not run themselves. For each
+script a fresh interpreter imports the modules the script imports (those
+that are not installed, such as fusion_hat off a Pi, are skipped and listed)
+and sets up the client and an assistant against mock_openai.py, the way
+the scripts do. Measured from the start of the interpreter:
+
+    imports   until the script's imports are done
+    ready     until the first "Listening..." could be printed
+    set-up    until the client, assistant and thread are ready
+
+With FAST_STARTUP=0 everything happens in order, so ready includes the
+set-up. With fast start-up the set-up runs in the background and only ready
+counts towards the target. The microphone calibration and the hardware are
+the same in both modes and not included.
+
+Usage:
+    python3 benchmark_startup.py
+    python3 benchmark_startup.py --latency setup=0.3 gpt_fun_fan.py gpt_easy_stt.py
+    python3 benchmark_startup.py --fail-above 1.0    # exit 1 if a fast ready is above 1 s
+"""
+import argparse
+import ast
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mock_openai import MockOpenAI
+
+HERE = Path(__file__).parent
+TARGET = 1.0  # seconds, time to ready
+
+# runs in a fresh interpreter, see measure()
+CHILD = """
+import importlib, json, os, time
+for name in json.loads(os.environ["BENCH_MODULES"]):
+    importlib.import_module(name)
+t0 = float(os.environ["STARTUP_T0"])
+imported = time.time() - t0
+
+import assistant_registry
+from pathlib import Path
+assistant_registry.REGISTRY_FILE = Path(os.environ["BENCH_REGISTRY"])
+from conversation import open_conversation
+from http_pool import openai_client
+from startup import defer, ready
+
+client = defer(lambda: openai_client("mock", base_url=os.environ["BENCH_BASE_URL"], prewarm=False))
+conversation = defer(open_conversation, client, name="Startup", instructions="Be brief.", model="gpt-4o-mini")
+seconds = ready()
+conversation.name
+print(json.dumps({"imports": imported, "ready": seconds, "setup": time.time() - t0}))
+"""
+
+
+def script_imports(path):
+    """ Top-level module names a script imports, in order. """
+    tree = ast.parse(Path(path).read_text(), filename=str(path))
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules = [node.module]
+        else:
+            continue
+        for module in modules:
+            name = module.split(".")[0]
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def measure(modules, fast, base_url, registry):
+    """ One start-up in a fresh interpreter, the child's timings in seconds. """
+    env = dict(
+        os.environ,
+        FAST_STARTUP="1" if fast else "0",
+        BENCH_MODULES=json.dumps(modules),
+        BENCH_BASE_URL=base_url,
+        BENCH_REGISTRY=registry,
+        TRACE_PORT="",
+        TRACE_JSONL="",
+    )
+    env["STARTUP_T0"] = repr(time.time())
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=HERE, env=env, capture_output=True, text=True, check=False
+    )
+    lines = result.stdout.strip().splitlines()
+    if result.returncode or not lines:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "no output")
+    return json.loads(lines[-1])
+
+
+def parse_latency(text):
+    latency = {}
+    for item in filter(None, text.split(",")):
+        name, value = item.split("=")
+        latency[name.strip()] = float(value)
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scripts", nargs="*", help="Scripts to measure, all gpt_*.py by default")
+    parser.add_argument("--runs", type=int, default=3, help="Start-ups per script and mode, the median is shown")
+    parser.add_argument("--latency", default="setup=0.2", help="Mock server latencies, see mock_openai.py")
+    parser.add_argument("--fail-above", type=float, help="Exit with status 1 if a fast ready is above this many seconds")
+    args = parser.parse_args()
+
+    scripts = [Path(script) for script in args.scripts] or sorted(HERE.glob("gpt_*.py"))
+    failed = False
+    print(f"{'':28} {'FAST_STARTUP=0':^26} {'fast start-up':^26}")
+    print(f"{'script':28} {'imports':>8} {'ready':>8} {'set-up':>8} {'imports':>8} {'ready':>8} {'set-up':>8}   missing")
+    with MockOpenAI(latency=parse_latency(args.latency)) as server, tempfile.TemporaryDirectory() as tmp:
+        registry = str(Path(tmp) / "assistants.json")
+        for script in scripts:
+            modules = script_imports(script)
+            # run from HERE, so the helper modules are found like the scripts find them
+            sys.path.insert(0, str(HERE))
+            missing = [name for name in modules if importlib.util.find_spec(name) is None]
+            sys.path.pop(0)
+            present = [name for name in modules if name not in missing]
+            row = []
+            try:
+                for fast in (False, True):
+                    runs = [measure(present, fast, server.base_url, registry) for _ in range(args.runs)]
+                    row += [statistics.median(run[key] for run in runs) for key in ("imports", "ready", "setup")]
+            except RuntimeError as e:
+                print(f"{script.name:28} failed: {e}")
+                failed = True
+                continue
+            mark = "" if row[4] <= TARGET else "  (above the target)"
+            print(f"{script.name:28} " + " ".join(f"{value:>8.3f}" for value in row) + f"   {','.join(missing)}{mark}")
+            if args.fail_above is not None and row[4] > args.fail_above:
+                failed = True
+    print(f"\nseconds from interpreter start, median of {args.runs}; target time to ready: {TARGET:g} s")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Word error rate and latency of the speech-to-text backends in stt.py.
+
+Every recording in the fixture directory is transcribed by each backend and
+compared with its reference transcript, a .txt file of the same name next
+to it (e.g. fan_stop.wav and fan_stop.txt). The "auto" row combines, file by
+file, the results of the backend the routing rules pick, so the length
+threshold can be tuned without another run.
+
+Nothing needs the network: the local backend runs on the CPU (its model
+must be on the device, see stt.py), and the openai backend is timed against
+mock_openai.py with a simulated uplink and server time. The mock returns the
+reference text, so its WER is not shown; --live uses the real API instead.
+
+WER is (substitutions + deletions + insertions) / reference words over the
+whole set, after lowercasing and dropping punctuation. Chinese and Japanese
+are compared character by character.
+
+Usage:
+    python3 benchmark_stt.py fixtures/
+    python3 benchmark_stt.py fixtures/ --backends local --runs 3
+    python3 benchmark_stt.py fixtures/ --local-max 3 --live
+"""
+import argparse
+import re
+import statistics
+import time
+from pathlib import Path
+
+import speech_recognition as sr
+
+from mock_openai import MockOpenAI
+from stt import LOCAL_MAX, LOCAL_MODEL, LocalBackend, OpenAIBackend, SpeechToText, duration, shorter_than
+
+# a CJK character is a token of its own, other text is split into words
+TOKEN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff]|[^\W_]+(?:'[^\W_]+)?")
+
+
+def tokens(text):
+    return TOKEN.findall(text.lower())
+
+
+def edit_distance(reference, hypothesis):
+    """ Word-level Levenshtein distance. """
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref in enumerate(reference, 1):
+        current = [i]
+        for j, hyp in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref != hyp)))
+        previous = current
+    return previous[-1]
+
+
+def load_fixtures(directory):
+    """ (name, sr.AudioData, reference text) for every .wav with a .txt next to it. """
+    recognizer = sr.Recognizer()
+    fixtures = []
+    for path in sorted(Path(directory).glob("*.wav")):
+        reference = path.with_suffix(".txt")
+        if not reference.exists():
+            print(f"{path.name}: no {reference.name}, skipped")
+            continue
+        with sr.AudioFile(str(path)) as source:
+            audio = recognizer.record(source)
+        fixtures.append((path.stem, audio, reference.read_text().strip()))
+    return fixtures
+
+
+def summary(name, results):
+    """ One table row from [(seconds of audio, seconds taken, errors, reference words)]. """
+    latencies = sorted(taken for _, taken, _, _ in results)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    words = sum(count for _, _, _, count in results)
+    errors = [error for _, _, error, _ in results]
+    wer = f"{sum(errors) / max(1, words):>7.1%}" if None not in errors else f"{'-':>7}"
+    rtf = sum(taken for _, taken, _, _ in results) / sum(length for length, _, _, _ in results)
+    return f"{name:>8} {len(results):>6} {wer} {statistics.median(latencies):>8.3f} {p95:>8.3f} {rtf:>6.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", help="Directory of .wav recordings with .txt reference transcripts")
+    parser.add_argument("--backends", default="local,openai", help="Comma separated backends to compare")
+    parser.add_argument("--runs", type=int, default=1, help="Transcriptions per file, the median time is used")
+    parser.add_argument("--language", default="", help="Comma separated expected languages, e.g. zh,en")
+    parser.add_argument("--model", default=LOCAL_MODEL, help="faster-whisper model size or directory")
+    parser.add_argument("--local-max", type=float, default=LOCAL_MAX, help="Routing threshold of the auto row (s)")
+    parser.add_argument("--uplink-kbps", type=float, default=256, help="Simulated upload speed of the mock")
+    parser.add_argument("--cloud-latency", type=float, default=0.5, help="Simulated server time of the mock (s)")
+    parser.add_argument("--live", action="store_true", help="Use the real API (keys.py) instead of the mock")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        parser.error(f"no .wav files with a .txt transcript in {args.fixtures}")
+    language = [code for code in args.language.split(",") if code] or None
+    names = [name for name in args.backends.split(",") if name]
+    total = sum(duration(audio) for _, audio, _ in fixtures)
+    print(f"{len(fixtures)} recordings, {total:.1f} s of speech")
+
+    with MockOpenAI(uplink_kbps=args.uplink_kbps, latency={"transcription": args.cloud_latency}) as server:
+        backends = {}
+        if "openai" in names:
+            from http_pool import openai_client
+
+            if args.live:
+                from keys import OPENAI_API_KEY
+
+                backends["openai"] = OpenAIBackend(openai_client(OPENAI_API_KEY))
+            else:
+                backends["openai"] = OpenAIBackend(openai_client("mock", base_url=server.base_url))
+        if "local" in names:
+            if LocalBackend.available():
+                backends["local"] = LocalBackend(args.model)
+                backends["local"].model.result()  # load before timing
+            else:
+                print("local: faster-whisper is not installed (pip install faster-whisper), skipped")
+
+        results = {}  # backend: fixture name: (seconds of audio, seconds taken, errors or None, reference words)
+        for name, backend in backends.items():
+            results[name] = {}
+            for fixture, audio, reference in fixtures:
+                server.transcript = reference
+                times = []
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    text = backend.transcribe(audio, language=language)
+                    times.append(time.perf_counter() - start)
+                expected = tokens(reference)
+                mocked = name == "openai" and not args.live
+                errors = None if mocked else edit_distance(expected, tokens(text))
+                results[name][fixture] = (duration(audio), statistics.median(times), errors, len(expected))
+
+    print(f"{'backend':>8} {'files':>6} {'WER':>7} {'p50 s':>8} {'p95 s':>8} {'RTF':>6}")
+    for name, rows in results.items():
+        print(summary(name, list(rows.values())))
+    if len(results) > 1:
+        router = SpeechToText(backends, rules=[shorter_than(args.local_max, "local")])
+        routed = [results[router.route(audio)][fixture] for fixture, audio, _ in fixtures]
+        print(summary("auto", routed) + f"   local below {args.local_max:g} s")
+    print("\nRTF: transcription time per second of speech")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare Whisper upload codecs: bytes sent and end-to-end STT time.
+
+Each codec is run against a local mock of the transcription endpoint with a
+simulated uplink speed, so the numbers only depend on the encoder and the
+upload size, not on the real API.
+
+Usage:
+    python3 benchmark_stt_upload.py recording.wav
+    python3 benchmark_stt_upload.py recording.wav --uplink-kbps 128 --runs 10
+
+"native" is what the scripts used to send: audio.get_wav_data() at the
+recording's own sample rate.
+"""
+import argparse
+import io
+import statistics
+import time
+
+import openai
+import speech_recognition as sr
+
+from mock_openai import MockOpenAI
+from stt_upload import CODECS, encode_speech
+
+
+def native_wav(audio):
+    upload = io.BytesIO(audio.get_wav_data())
+    upload.name = "record.wav"
+    return upload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav", help="Speech recording to upload (WAV, AIFF or FLAC)")
+    parser.add_argument("--runs", type=int, default=5, help="Uploads per codec")
+    parser.add_argument("--uplink-kbps", type=float, default=256, help="Simulated upload speed, 0 for unlimited")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated server-side transcription time (s)")
+    parser.add_argument("--codecs", default=",".join(("native",) + CODECS), help="Comma separated codecs to compare")
+    args = parser.parse_args()
+
+    recognizer = sr.Recognizer()
+    with sr.AudioFile(args.wav) as source:
+        audio = recognizer.record(source)
+    duration = len(audio.frame_data) / audio.sample_rate / audio.sample_width
+    print(f"{args.wav}: {duration:.1f} s, {audio.sample_rate} Hz, uplink {args.uplink_kbps:g} kbit/s")
+    print(f"{'codec':>8} {'bytes':>10} {'ratio':>7} {'encode ms':>10} {'p50 ms':>8} {'max ms':>8}")
+
+    with MockOpenAI(uplink_kbps=args.uplink_kbps, latency={"transcription": args.latency}) as server:
+        client = openai.OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+        baseline = None
+        for codec in args.codecs.split(","):
+            encode = native_wav if codec == "native" else (lambda a, c=codec: encode_speech(a, c))
+            sizes, encode_times, totals = [], [], []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                upload = encode(audio)
+                encoded = time.perf_counter()
+                client.audio.transcriptions.create(model="whisper-1", file=upload)
+                totals.append((time.perf_counter() - start) * 1000)
+                encode_times.append((encoded - start) * 1000)
+                sizes.append(len(upload.getvalue()))
+            size = sizes[-1]
+            baseline = baseline or size
+            print(
+                f"{codec:>8} {size:>10} {size / baseline:>7.2f} {statistics.median(encode_times):>10.1f} "
+                f"{statistics.median(totals):>8.1f} {max(totals):>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
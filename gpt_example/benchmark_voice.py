@@ -0,0 +1,322 @@
+"""
+End-to-end latency benchmark of the voice pipelines.
+
+Runs full voice turns on a plain Linux box, without a microphone, speaker or
+network: a fake microphone replays WAV fixtures in real time, the OpenAI API is
+served by mock_openai.py with configurable latencies, and audio is played into
+a null sink. Three pipelines are measured:
+
+    streaming  gpt_easy_stt.py, gpt_fun_weather.py, ...: streamed run, one TTS
+               request per sentence
+    polling    gpt_fun_fan.py and the other conversation.send() scripts:
+               create_and_poll, fetch the reply, one TTS request
+    chat       the streaming scripts with CONVERSATION_BACKEND=chat: one
+               streamed Chat Completions request, one TTS request per sentence
+
+Stages, in milliseconds:
+
+    capture   end of the user's speech until listen() returns (endpointing)
+    stt       encoding and transcription
+    run       sending the message until the first sentence (streaming, chat)
+              or the completed run (polling) is available
+    fetch     listing the new messages (polling only)
+    tts       until the first audio chunk of the reply arrives
+    playback  first audio chunk until it is written to the sink
+    total     end of the user's speech until the reply is heard
+
+Every HTTP request to the mock costs the "rtt" latency, so the pipelines
+also differ by the number of round trips they make: messages.create, the
+run and the polls for the Assistants API, a single request for chat.
+
+Usage:
+    python3 benchmark_voice.py
+    python3 benchmark_voice.py --pipelines streaming,chat --latency rtt=0.15,run=1.2,chat=0.6
+    python3 benchmark_voice.py --turns 20 --latency run=1.2,speech=0.3 fixture1.wav fixture2.wav
+    python3 benchmark_voice.py --fail-above 2500     # exit 1 if a total p95 exceeds 2.5 s
+"""
+import argparse
+import collections
+import itertools
+import json
+import math
+import random
+import sys
+import threading
+import time
+import warnings
+import wave
+
+import openai
+import speech_recognition as sr
+
+from audio_player import AudioPlayer, convert
+from conversation import open_conversation
+from mic_stream import MicStream
+from mock_openai import MockOpenAI
+from reply_stream import SpeechPipeline
+from stt_upload import encode_speech
+from tts_stream import speak
+
+STAGES = ("capture", "stt", "run", "fetch", "tts", "playback", "total")
+PIPELINES = {"streaming": "assistants", "polling": "assistants", "chat": "chat"}
+MIC_RATE = 16000
+MIC_CHUNK = 1024
+
+# the example scripts still use the Assistants API, do not flood the report with its deprecation warnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+def synthetic_utterance(seconds=1.2, rate=MIC_RATE):
+    """ A speech-like test signal: a 150 Hz voice with harmonics, in 4 syllables per second. """
+    samples = []
+    for i in range(int(seconds * rate)):
+        t = i / rate
+        envelope = abs(math.sin(math.pi * 4 * t))
+        voice = sum(math.sin(2 * math.pi * 150 * h * t) / h for h in (1, 2, 3))
+        samples.append(int(6000 * envelope * voice))
+    return b"".join(s.to_bytes(2, "little", signed=True) for s in samples)
+
+
+def load_fixture(path, rate=MIC_RATE):
+    """ Read a 16-bit WAV file as mono PCM at ``rate``. """
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit WAV fixtures are supported")
+        data = wav.readframes(wav.getnframes())
+        return convert(data, wav.getframerate(), wav.getnchannels(), out_rate=rate, out_channels=1)
+
+
+class FakeMicrophone:
+    """
+    sr.Microphone stand-in for MicStream: replays fixtures in real time and
+    low background noise in between.
+    """
+
+    def __init__(self, fixtures, rate=MIC_RATE, chunk_size=MIC_CHUNK, noise=30):
+        self.SAMPLE_RATE = rate
+        self.SAMPLE_WIDTH = 2
+        self.CHUNK = chunk_size
+        self.fixtures = itertools.cycle(fixtures)
+        self.noise = b"".join(
+            max(-32768, min(32767, int(random.gauss(0, noise)))).to_bytes(2, "little", signed=True)
+            for _ in range(rate)
+        )
+        self.noise_pos = 0
+        self.pending = collections.deque()
+        self.lock = threading.Lock()
+        self.speech_end = None
+        self.stream = None
+        self.next_read = None
+
+    def __enter__(self):
+        self.stream = self
+        self.next_read = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
+
+    def say(self, delay=0.2):
+        """ Queue the next fixture, after ``delay`` seconds of background noise. """
+        silence = self._noise(int(delay * self.SAMPLE_RATE) * 2)
+        speech = next(self.fixtures)
+        with self.lock:
+            self.speech_end = None
+            self.pending.append((silence, False))
+            self.pending.append((speech, True))
+
+    def _noise(self, size):
+        out = b""
+        while len(out) < size:
+            piece = self.noise[self.noise_pos:self.noise_pos + size - len(out)]
+            self.noise_pos = (self.noise_pos + len(piece)) % len(self.noise)
+            out += piece
+        return out
+
+    def read(self, size, exception_on_overflow=False):
+        # block like a real device, one chunk per chunk duration
+        self.next_read += size / self.SAMPLE_RATE
+        delay = self.next_read - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        want = size * 2
+        out = b""
+        with self.lock:
+            while self.pending and len(out) < want:
+                data, is_speech = self.pending[0]
+                take = data[:want - len(out)]
+                out += take
+                if len(take) == len(data):
+                    self.pending.popleft()
+                    if is_speech:
+                        self.speech_end = self.next_read
+                else:
+                    self.pending[0] = (data[len(take):], is_speech)
+        return out + self._noise(want - len(out))
+
+
+class NullSink:
+    """ Output stream stand-in: discards audio, taking ``1 / speed`` of its duration. """
+
+    def __init__(self, rate=24000, channels=1, speed=10):
+        self.bytes_per_second = rate * channels * 2
+        self.speed = speed
+
+    def write(self, data):
+        if self.speed:
+            time.sleep(len(data) / self.bytes_per_second / self.speed)
+
+
+def percentile(values, p):
+    """ Nearest-rank percentile. """
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class Bench:
+
+    def __init__(self, client, mic, fake_mic, player):
+        self.client = client
+        self.mic = mic
+        self.fake_mic = fake_mic
+        self.player = player
+        self.assistant = client.beta.assistants.create(name="BOT", instructions="You are a chat bot.", model="gpt-mock")
+        self.speech = SpeechPipeline(self._synthesize, lambda clip: clip.done.wait())
+        self.clips = []
+        self.first_sentence = None
+
+    def capture(self, times):
+        self.fake_mic.say()
+        audio = self.mic.listen()
+        heard = time.monotonic()
+        speech_end = self.fake_mic.speech_end or heard
+        times["capture"] = heard - speech_end
+        text = self.client.audio.transcriptions.create(model="whisper-1", file=encode_speech(audio)).text
+        times["stt"] = time.monotonic() - heard
+        return speech_end, text
+
+    def speak(self, text, wait):
+        return speak(self.client, text, wait=wait, player=self.player, cache=None)
+
+    def _synthesize(self, sentence):
+        if self.first_sentence is None:
+            self.first_sentence = time.monotonic()
+        clip = self.speak(sentence, wait=False)
+        self.clips.append(clip)
+        return clip
+
+    def open_conversation(self, backend):
+        # a pinned ID keeps the benchmark out of the assistant registry file
+        return open_conversation(
+            self.client, name="BOT", instructions="You are a chat bot.", model="gpt-mock",
+            backend=backend, assistant_id=self.assistant.id,
+        )
+
+    def streaming_turn(self, conversation):
+        times = {}
+        speech_end, text = self.capture(times)
+        start = time.monotonic()
+        self.clips = []
+        self.first_sentence = None
+        conversation.stream(text, on_sentence=self.speech.say)
+        self.speech.wait()
+        times["run"] = self.first_sentence - start
+        self._audio_times(times, self.first_sentence, self.clips[0], speech_end)
+        return times
+
+    def polling_turn(self, conversation):
+        # conversation.send() step by step, to time the fetch separately
+        times = {}
+        speech_end, text = self.capture(times)
+        start = time.monotonic()
+        thread = conversation.thread
+        message = self.client.beta.threads.messages.create(thread_id=thread.id, role="user", content=text)
+        conversation.cursor.mark(message)
+        self.client.beta.threads.runs.create_and_poll(thread_id=thread.id, assistant_id=conversation.id)
+        fetch_start = time.monotonic()
+        times["run"] = fetch_start - start
+        replies = conversation.cursor.replies()
+        fetched = time.monotonic()
+        times["fetch"] = fetched - fetch_start
+        clip = self.speak(" ".join(replies), wait=True)
+        self._audio_times(times, fetched, clip, speech_end)
+        return times
+
+    @staticmethod
+    def _audio_times(times, requested, clip, speech_end):
+        times["tts"] = clip.fed_at - requested
+        times["playback"] = clip.started_at - clip.fed_at
+        times["total"] = clip.started_at - speech_end
+
+
+def parse_latency(text):
+    latency = {}
+    for item in filter(None, text.split(",")):
+        name, value = item.split("=")
+        latency[name.strip()] = float(value)
+    return latency
+
+
+def report(name, results):
+    print(f"\n{name} ({len(results)} turns)")
+    print(f"{'stage':>10} {'p50':>8} {'p95':>8} {'p99':>8}   ms")
+    summary = {}
+    for stage in STAGES:
+        values = [times[stage] * 1000 for times in results if stage in times]
+        if not values:
+            continue
+        summary[stage] = {p: percentile(values, p) for p in (50, 95, 99)}
+        print(f"{stage:>10} {summary[stage][50]:>8.0f} {summary[stage][95]:>8.0f} {summary[stage][99]:>8.0f}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", nargs="*", help="16-bit WAV recordings of user speech, a synthetic one by default")
+    parser.add_argument("--turns", type=int, default=10, help="Turns per pipeline")
+    parser.add_argument("--pipelines", default="streaming,polling,chat",
+                        help=f"Comma separated pipelines to run, from {', '.join(PIPELINES)}")
+    parser.add_argument("--latency", default="rtt=0.1,transcription=0.3,run=0.8,chat=0.5,token=0.02,speech=0.25",
+                        help="Mock server latencies in seconds, name=value,...")
+    parser.add_argument("--uplink-kbps", type=float, default=0, help="Simulated upload speed, 0 for unlimited")
+    parser.add_argument("--sink-speed", type=float, default=10, help="Playback speed of the null sink, 0 for instant")
+    parser.add_argument("--json", help="Also write the summary to this file")
+    parser.add_argument("--fail-above", type=float, help="Exit with status 1 if a total p95 is above this many ms")
+    args = parser.parse_args()
+
+    names = args.pipelines.split(",")
+    for name in names:
+        if name not in PIPELINES:
+            parser.error(f"Unknown pipeline: {name}")
+
+    fixtures = [load_fixture(path) for path in args.fixtures] or [synthetic_utterance()]
+    recognizer = sr.Recognizer()
+    fake_mic = FakeMicrophone(fixtures)
+    mic = MicStream(recognizer, microphone=fake_mic)
+    player = AudioPlayer(output=NullSink(speed=args.sink_speed))
+
+    summaries = {}
+    with MockOpenAI(uplink_kbps=args.uplink_kbps, latency=parse_latency(args.latency)) as server:
+        client = openai.OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+        bench = Bench(client, mic, fake_mic, player)
+        for name in names:
+            conversation = bench.open_conversation(PIPELINES[name])
+            turn = bench.polling_turn if name == "polling" else bench.streaming_turn
+            results = [turn(conversation) for _ in range(args.turns)]
+            summaries[name] = report(name, results)
+    mic.close()
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(summaries, file, indent=2)
+    if args.fail_above is not None:
+        worst = max(summary["total"][95] for summary in summaries.values())
+        if worst > args.fail_above:
+            print(f"\ntotal p95 {worst:.0f} ms is above {args.fail_above:.0f} ms")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Conversation backends.
+
+A turn on the Assistants API costs several HTTP round trips: messages.create,
+runs.create_and_poll (a POST and then GETs until the run is done) and
+messages.list. The "chat" backend keeps the history locally instead and makes
+a single streaming Chat Completions request per turn.
+
+Both backends have the same interface:
+
+    conversation.send(content)          -> (list of reply texts, run)
+    conversation.stream(content, on_sentence=speech.say)
+                                        -> (reply text, run)
+    conversation.name
+
+``run`` has ``status`` and ``usage`` in both cases. The backend is chosen with
+the ``backend`` argument or the CONVERSATION_BACKEND environment variable
+("assistants" by default). Conversations that need Assistants-only features,
+such as the code_interpreter tool, always use the Assistants API.
+
+Both backends bound the prompt with a History (see history.py): the chat
+backend sends the summary and the latest turns, the Assistants backend
+truncates the thread to the latest turns and passes the summary as
+additional instructions.
+
+Usage:
+    from conversation import open_conversation
+
+    conversation = open_conversation(client, name="BOT", instructions="...", model="gpt-4-1106-preview")
+    replies, run = conversation.send("Hello!")
+"""
+import os
+from types import SimpleNamespace
+
+from assistant_registry import get_assistant
+from history import HISTORY_BUDGET, HISTORY_TURNS, History
+from message_cursor import MessageCursor, reply_texts
+from reply_stream import SentenceSplitter, stream_reply
+from tracing import span
+
+BACKEND = os.environ.get("CONVERSATION_BACKEND", "assistants")  # "assistants" or "chat"
+BACKENDS = ("assistants", "chat")
+ASSISTANT_ONLY_OPTIONS = ("description", "metadata", "tool_resources")
+
+
+class AssistantConversation:
+    """
+    A thread on an assistant from the registry.
+
+    :param history: History that bounds the prompt, None to send the whole thread.
+    """
+
+    def __init__(self, client, name, instructions, model, tools=None, assistant_id=None, history=None, **kwargs):
+        self.client = client
+        self.assistant = get_assistant(client, name, instructions, model, tools, assistant_id, **kwargs)
+        self.name = self.assistant.name
+        self.thread = client.beta.threads.create()
+        self.cursor = MessageCursor(client, self.thread.id)
+        self.history = history
+        self.turns = []  # (ids of the thread messages of a turn, whether the history has the turn)
+
+    @property
+    def id(self):
+        return self.assistant.id
+
+    def send(self, content):
+        message = self.client.beta.threads.messages.create(
+            thread_id=self.thread.id,
+            role="user",
+            content=content,
+        )
+        self.cursor.mark(message)
+        try:
+            run = self.client.beta.threads.runs.create_and_poll(
+                thread_id=self.thread.id,
+                assistant_id=self.assistant.id,
+                **self._run_options()
+            )
+        except Exception:
+            self.turns.append(([message.id], False))
+            raise
+        # fetched even after a failed run, whatever it added to the thread is counted by _window()
+        messages = self.cursor.fetch()
+        replies = reply_texts(messages) if run.status == "completed" else []
+        self._record(message, messages, content, "\n".join(replies))
+        return replies, run
+
+    def stream(self, content, on_sentence=None, on_delta=None):
+        message = self.client.beta.threads.messages.create(
+            thread_id=self.thread.id,
+            role="user",
+            content=content,
+        )
+        self.cursor.mark(message)
+        try:
+            reply, run = stream_reply(
+                self.client, self.thread.id, self.assistant.id, on_sentence=on_sentence, on_delta=on_delta,
+                **self._run_options()
+            )
+        except Exception:
+            self.turns.append(([message.id], False))
+            raise
+        # the streamed reply is already known, skip it on the next send()
+        messages = self.cursor.fetch()
+        self._record(message, messages, content, reply)
+        return reply, run
+
+    def _record(self, message, messages, content, reply):
+        kept = bool(self.history and reply)
+        if kept:
+            self.history.add(content, reply)
+        self.turns.append(([message.id] + [m.id for m in messages], kept))
+
+    def _window(self):
+        """
+        Number of thread messages that hold the turns History sends verbatim,
+        plus the new message. Counted from the thread itself, so messages of
+        failed runs between those turns, or replies in several messages, do
+        not shift the window.
+        """
+        left = len(self.history.recent())
+        count = 1
+        for ids, kept in reversed(self.turns):
+            if not left:
+                break
+            count += len(ids)
+            left -= kept
+        return count
+
+    def _run_options(self):
+        if not self.history or not self.history.budget:
+            return {}
+        options = {"truncation_strategy": {"type": "last_messages", "last_messages": self._window()}}
+        summary = self.history.summary_instructions()
+        if summary:
+            options["additional_instructions"] = summary
+        return options
+
+
+class ChatConversation:
+    """
+    A local message history sent with every Chat Completions request.
+
+    :param history: History that bounds the prompt, None to send every turn.
+    :param kwargs: Extra arguments for client.chat.completions.create, e.g. temperature.
+        The scripts pass the options of their assistant, see chat_options().
+    """
+
+    def __init__(self, client, name, instructions, model, history=None, **kwargs):
+        self.client = client
+        self.name = name
+        self.id = None
+        self.model = model
+        self.kwargs = chat_options(kwargs)
+        self.instructions = {"role": "system", "content": instructions}
+        self.history = history or History(client, model, budget=None)
+
+    def send(self, content):
+        reply, run = self.stream(content)
+        return ([reply] if reply else []), run
+
+    @property
+    def messages(self):
+        """ The messages sent before the next user message. """
+        return [self.instructions, *self.history.messages()]
+
+    def stream(self, content, on_sentence=None, on_delta=None):
+        messages = self.messages + [{"role": "user", "content": content}]
+        splitter = SentenceSplitter()
+        parts = []
+        usage = None
+        status = "completed"
+        with span("run") as trace:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **self.kwargs
+            )
+            for chunk in response:
+                if chunk.usage:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason not in (None, "stop"):
+                    status = "incomplete"
+                delta = choice.delta.content
+                if not delta:
+                    continue
+                parts.append(delta)
+                if on_delta:
+                    on_delta(delta)
+                if on_sentence:
+                    for sentence in splitter.feed(delta):
+                        on_sentence(sentence)
+            trace.usage = usage
+        if on_sentence:
+            for sentence in splitter.flush():
+                on_sentence(sentence)
+        reply = "".join(parts)
+        if reply:
+            self.history.add(content, reply)
+        return reply, SimpleNamespace(status=status, usage=usage)
+
+
+def chat_options(options):
+    """
+    The Chat Completions equivalent of assistant options: the ones only
+    assistants have are dropped, and response_format "auto", the default of
+    both APIs but not a value Chat Completions accepts, is left out.
+    """
+    options = {key: value for key, value in options.items() if key not in ASSISTANT_ONLY_OPTIONS}
+    if options.get("response_format") == "auto":
+        del options["response_format"]
+    return options
+
+
+def open_conversation(client, name, instructions, model, backend=None, tools=None, assistant_id=None,
+                      budget=HISTORY_BUDGET, keep_turns=HISTORY_TURNS, **kwargs):
+    """
+    Start a conversation on the configured backend.
+
+    :param backend: "assistants" or "chat", BACKEND by default.
+    :param tools: Assistants tools, which require the "assistants" backend.
+    :param assistant_id: Pinned assistant ID, only used by the "assistants" backend.
+    :param budget: History token budget of this conversation, None or 0 for no limit.
+    :param keep_turns: Number of latest turns sent verbatim.
+    :param kwargs: Extra arguments for the backend.
+    """
+    backend = backend or BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown conversation backend: {backend}, expected one of {BACKENDS}")
+    history = History(client, model, budget, keep_turns)
+    if backend == "chat" and not tools:
+        return ChatConversation(client, name, instructions, model, history, **kwargs)
+    return AssistantConversation(client, name, instructions, model, tools, assistant_id, history, **kwargs)
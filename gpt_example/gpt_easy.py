@@ -1,11 +1,13 @@
 import openai
 from keys import OPENAI_API_KEY
+from assistant_registry import get_assistant
 
 
 # gets API Key from environment variable OPENAI_API_KEY
 client = openai.OpenAI(api_key=OPENAI_API_KEY)
 
-assistant = client.beta.assistants.create(
+assistant = get_assistant(
+    client,
     name="BOT",
     instructions="You are a Assistant, you answer people question to help them.",
     model="gpt-4-1106-preview",
@@ -37,8 +39,6 @@ if run.status == "completed":
         assert message.content[0].type == "text"
         print({"role": message.role, "message": message.content[0].text.value})
 
-    client.beta.assistants.delete(assistant.id)
-
 
 ####  MESSAGE 
 
@@ -1,19 +1,21 @@
-import openai
 from keys import OPENAI_API_KEY
-from pathlib import Path
+from http_pool import openai_client
+from startup import defer, enable_speaker
+from conversation import open_conversation
+from json_stream import JSONStream
+from tracing import trace_client, traced
+from tts_stream import speak
+from audio_player import get_player
 
 import readline # optimize keyboard input, only need to import
 import sys
-import os
-import subprocess
 
 from fusion_hat import RGB_LED,PWM
 
 # gets API Key from environment variable OPENAI_API_KEY
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
-os.system("fusion_hat enable_speaker")
-
-TTS_OUTPUT_FILE = 'tts_output.mp3'
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+enable_speaker()
+player = get_player()
 
 
 instructions_text = '''
@@ -37,30 +39,31 @@ The user will provide a command describing their mood or desired lighting condit
 '''
 
 
-# assistant=client.beta.assistants.retrieve(OPENAI_ASSISTANT_ID)
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="BOT",
     instructions=instructions_text,
     model="gpt-4-1106-preview",
 )
 
-thread = client.beta.threads.create()
 
 # Initialize an RGB LED.
 rgb_led = RGB_LED(PWM('P0'), PWM('P1'), PWM('P2'),common=RGB_LED.CATHODE)
 
 
 
+@traced("tts")
 def text_to_speech(text):
-    speech_file_path = Path(__file__).parent / "speech.mp3"
-    with client.audio.speech.with_streaming_response.create(
-        model="tts-1",
-        voice="alloy",
-        input=text
-    ) as response:
-        response.stream_to_file(speech_file_path)
-    p=subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    p.wait()
+    # stream the speech to the speaker, repeated phrases come from the local cache
+    speak(client, text)
+
+def set_color(color):
+    """ Light the LED with a color of three components between 0 and 255. """
+    if not isinstance(color, list) or len(color) != 3 or not all(isinstance(c, (int, float)) and 0 <= c <= 255 for c in color):
+        print(f"Not an RGB color: {color}")
+        return
+    rgb_led.color([round(c) for c in color])
 
 
 try:
@@ -71,57 +74,26 @@ try:
             print() # new line
             continue
 
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=msg,
-        )
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-        )
+        # the LED changes as soon as "color" is complete, while the message is still streaming
+        parser = JSONStream({"color": set_color})
+        reply, run = conversation.stream(msg, on_delta=parser.feed)
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-            for message in messages.data:
-                if message.role == 'user':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = message.role 
-                            value = block.text.value
-                            print(f'{label:>10} >>> {value}')
-                    break # only last reply
-
-            for message in messages.data:
-                if message.role == 'assistant':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = assistant.name
-                            value = block.text.value
-                            # print(f"Raw AI Response: {value}")
-                            try:
-                                value = eval(value)
-                            except Exception as e:
-                                value = str(value)
-                            if isinstance(value, dict):
-                                if 'color' in value:
-                                    color = list(value['color'])
-                                else:
-                                    color = [0,0,0]
-                                if 'message' in value:
-                                    text = value['message']
-                                else :
-                                    text = ''
-                            else:
-                                color = [0,0,0]
-                                text = value
-
-                            print(f'{label:>10} >>> {text} {color}')
-                            rgb_led.color = color
-                            text_to_speech(text)
-                    break # only last reply
-
-finally:
-    client.beta.assistants.delete(assistant.id)
+            print(f'{"user":>10} >>> {msg}')
+
+            label = conversation.name
+            value = parser.close() or reply
+            # print(f"Raw AI Response: {value}")
+            if isinstance(value, dict):
+                color = value.get('color', [0,0,0])
+                text = value.get('message', '')
+            else:
+                color = [0,0,0]
+                text = value
+
+            print(f'{label:>10} >>> {text} {color}')
+            set_color(color)
+            text_to_speech(text)
+
+except KeyboardInterrupt:
+    pass
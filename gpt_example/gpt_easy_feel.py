@@ -1,18 +1,21 @@
-import openai
 from keys import OPENAI_API_KEY
-from pathlib import Path
+from http_pool import openai_client
+from startup import defer, enable_speaker
+from conversation import open_conversation
+from tracing import trace_client, traced
+from tts_stream import speak
+from audio_player import get_player
+from reply_stream import SpeechPipeline
+from response_cache import ResponseCache
 
 import readline # optimize keyboard input, only need to import
 import sys
-import os
-import subprocess
 from fusion_hat import ADC
 
 # gets API Key from environment variable OPENAI_API_KEY
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
-os.system("fusion_hat enable_speaker")
-
-TTS_OUTPUT_FILE = 'tts_output.mp3'
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+enable_speaker()
+player = get_player()
 
 # Set up the photoresistor 
 photoresistor = ADC('A0')
@@ -41,25 +44,30 @@ Yes, the light is suitable for reading. A value of 150 indicates moderate bright
 '''
 
 
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="BOT",
     instructions=instructions_text,
     model="gpt-4-1106-preview",
 )
 
-thread = client.beta.threads.create()
 
-def text_to_speech(text):
-    speech_file_path = Path(__file__).parent / "speech.mp3"
-    # print(speech_file_path)
-    with client.audio.speech.with_streaming_response.create(
-        model="tts-1",
-        voice="alloy",
-        input=text
-    ) as response:
-        response.stream_to_file(speech_file_path)
-    p=subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    p.wait()
+@traced("tts")
+def synthesize_speech(text):
+    # stream the sentence into the player, it starts playing while still downloading;
+    # every sentence is kept in the TTS cache, so cached replies replay without the network
+    return speak(client, text, wait=False, cache_max_chars=None)
+
+@traced("playback")
+def play_speech(clip):
+    clip.done.wait()
+
+# speak each sentence while the rest of the reply is still being generated
+speech = SpeechPipeline(synthesize_speech, play_speech)
+
+# the same question within the same 100 ADC counts gets the same answer, without a run
+responses = ResponseCache("feel", buckets={"photoresistor": 100})
 
 
 try:
@@ -70,40 +78,17 @@ try:
             print() # new line
             continue
 
-        text_send="photoresistor:" +str(photoresistor.read()) +" , message: " + msg
-
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=text_send,
-        )
+        light = photoresistor.read()
+        text_send="photoresistor:" +str(light) +" , message: " + msg
 
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-        )
+        print(f'{"user":>10} >>> {text_send}')
+        reply, run = responses.stream(conversation, text_send, on_sentence=speech.say, text=msg, photoresistor=light)
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-            for message in messages.data:
-                if message.role == 'user':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = message.role 
-                            text = block.text.value
-                            print(f'{label:>10} >>> {text}')
-                    break # only last reply
-
-            for message in messages.data:
-                if message.role == 'assistant':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = assistant.name
-                            text = block.text.value
-                            print(f'{label:>10} >>> {text}')
-                            text_to_speech(text)
-                    break # only last reply
+            print(f'{conversation.name:>10} >>> {reply}')
+        speech.wait()
 
+except KeyboardInterrupt:
+    pass
 finally:
-    client.beta.assistants.delete(assistant.id)
+    print(responses.report())
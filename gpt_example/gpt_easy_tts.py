@@ -1,34 +1,40 @@
-import openai
-from keys import OPENAI_API_KEY
+from keys import OPENAI_API_KEY, OPENAI_ASSISTANT_ID
+from http_pool import openai_client
+from startup import defer, enable_speaker
+from conversation import open_conversation
+from tracing import trace_client, traced
+from tts_stream import speak
+from audio_player import get_player
+from reply_stream import SpeechPipeline
 import readline # optimize keyboard input, only need to import
-import sys,os
-import subprocess
-from pathlib import Path
+import sys
 
 # gets API Key from environment variable OPENAI_API_KEY
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
-os.system("fusion_hat enable_speaker")
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+enable_speaker()
+player = get_player()
 
-TTS_OUTPUT_FILE = 'tts_output.mp3'
-
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="BOT",
     instructions="You are a chat bot, you answer people question to help them. ",
     model="gpt-4-1106-preview",
+    assistant_id=OPENAI_ASSISTANT_ID,  # a real "asst_..." ID in keys.py is used as is
 )
 
-thread = client.beta.threads.create()
 
-def text_to_speech(text):
-    speech_file_path = Path(__file__).parent / "speech.mp3"
-    with client.audio.speech.with_streaming_response.create(
-        model="tts-1",  # Low-latency TTS model for real-time usage
-        voice="alloy",  # Selected voice for audio playback
-        input=text  # Text to convert to speech
-    ) as response:
-        response.stream_to_file(speech_file_path) # Save audio to the specified file
-    p=subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    p.wait()
+@traced("tts")
+def synthesize_speech(text):
+    # stream the sentence into the player, it starts playing while still downloading
+    return speak(client, text, wait=False)
+
+@traced("playback")
+def play_speech(clip):
+    clip.done.wait()
+
+# speak each sentence while the rest of the reply is still being generated
+speech = SpeechPipeline(synthesize_speech, play_speech)
 
 
 try:
@@ -39,42 +45,14 @@ try:
             print() # new line
             continue
 
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=msg,
-        )
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-        )
+        print(f'{"user":>10} >>> {msg}')
+        reply, run = conversation.stream(msg, on_sentence=speech.say)
 
         # print("Run completed with status: " + run.status)
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-            for message in messages.data:
-                if message.role == 'user':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = message.role 
-                            value = block.text.value
-                            print(f'{label:>10} >>> {value}')
-                    break # only last reply
-
-            for message in messages.data:
-                if message.role == 'assistant':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = assistant.name
-                            value = block.text.value
-                            print(f'{label:>10} >>> {value}')
-                            text_to_speech(value)
-                            
-                    break # only last reply
-
-finally:
-    client.beta.assistants.delete(assistant.id)
+            print(f'{conversation.name:>10} >>> {reply}')
+        speech.wait()
 
+except KeyboardInterrupt:
+    pass
@@ -1,32 +1,27 @@
 from fusion_hat import RC522,Pin
 import json
-import openai
 from keys import OPENAI_API_KEY
-from pathlib import Path
-import subprocess
-import os
+from http_pool import openai_client
+from startup import defer, enable_speaker
+from tracing import trace_client, traced
+from tts_cache import speech_cache
+from tts_stream import speak
+from audio_player import get_player
 import time
 
 # Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
 # thread = client.beta.threads.create()
-os.system("fusion_hat enable_speaker")
+enable_speaker()
+player = get_player()
 
 # Function for text-to-speech conversion and play the speech
+@traced("tts")
 def text_to_speech(text):
-    speech_file_path = Path(__file__).parent / "speech.mp3"
     try:
-        with client.audio.speech.with_streaming_response.create(
-            model="tts-1", voice="alloy", input=text
-        ) as response:
-            response.stream_to_file(speech_file_path)
-        # Play the generated speech file
-        subprocess.Popen(
-            ["mplayer", str(speech_file_path)],
-            shell=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        ).wait()
+        # stream the speech to the speaker, repeated phrases come from the local cache
+        # and short ones are synthesized on the device when espeak-ng or piper is installed
+        speak(client, text, local="short")
     except Exception as e:
         print(f"Error in TTS or playing the file: {e}")
 
@@ -41,6 +36,12 @@ users_db = "users.json"  # users database file
 with open(users_db, "r") as file:
     users = json.load(file)
 
+# synthesize the fixed replies now, so they play without waiting for the network
+speech_cache.prewarm(
+    client,
+    ["Access denied!"] + [f"The door is open. Access granted to {name}!" for name in users.values()],
+)
+
 def access_door():
     print("Please place your card to access the door...")
     uid,message = rc.read(2)
@@ -1,23 +1,31 @@
-import openai
 from keys import OPENAI_API_KEY
+from http_pool import openai_client
+from startup import defer, enable_speaker
+from conversation import open_conversation
+from tracing import trace_client, traced
+from tts_cache import speech_cache
+from tts_stream import speak
+from audio_player import get_player
 import time
 from fusion_hat import Pin, ADC
-import sys, os
-import subprocess
-from pathlib import Path
+import sys
 import random
 
 # Initialize the OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
 
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="BOT",
     instructions="This is a blindfolded watermelon-smashing game. A point representing a watermelon is randomly generated within a 20x20 meter area with coordinates ranging from (-10,-10) to (10,10). The player starts from the origin (0,0) and moves using a joystick. Even if the player can't see anything, they press a button to perform a smash action. After smashing, you will receive the watermelon's and player's coordinates. You need to advise the player on the direction of the watermelon, like 'The watermelon is ten meters to your northeast.' If the smash coordinates match, the game ends. Your responses will be converted into speech via TTS, so please keep them brief, ideally within two sentences.",
     model="gpt-4-1106-preview",
 )
 
-thread = client.beta.threads.create()
-os.system("fusion_hat enable_speaker")
+# synthesize the start prompt now, so it plays without waiting for the network
+speech_cache.prewarm(client, ["game start!"])
+enable_speaker()
+player = get_player()
 
 # Setup GPIO ports
 btn_pin = Pin(17, Pin.IN, Pin.PULL_UP)
@@ -30,19 +38,13 @@ def MAP(x, in_min, in_max, out_min, out_max):
     """
     return (x - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
 
+@traced("tts")
 def text_to_speech(text):
     """
     Convert text to speech and play it using an external player.
     """
-    speech_file_path = Path(__file__).parent / "speech.mp3"
-    with client.audio.speech.with_streaming_response.create(
-        model="tts-1",  # Low-latency TTS model for real-time usage
-        voice="alloy",  # Selected voice for audio playback
-        input=text  # Text to convert to speech
-    ) as response:
-        response.stream_to_file(speech_file_path)  # Save audio to the specified file
-    p = subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    p.wait()
+    # stream the speech to the speaker, repeated phrases come from the local cache
+    speak(client, text)
 
 def activate():
     global smash_tips
@@ -79,26 +81,10 @@ try:
             send_message = f"Watermelon position: ({watermelon_x}, {watermelon_y}), Player position: ({player_x}, {player_y})"
 
             try:
-                message = client.beta.threads.messages.create(
-                    thread_id=thread.id,
-                    role="user",
-                    content=send_message,
-                )
-
-                run = client.beta.threads.runs.create_and_poll(
-                    thread_id=thread.id,
-                    assistant_id=assistant.id,
-                )
+                replies, run = conversation.send(send_message)
 
                 if run.status == "completed":
-                    messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-                    for message in messages.data:
-                        if message.role == 'assistant':
-                            for block in message.content:
-                                if block.type == 'text':
-                                    decoded_message = block.text.value
-                            break  # Only take the last reply
+                    decoded_message = " ".join(replies)
 
                 print("Assistant:", decoded_message)
                 text_to_speech(decoded_message)
@@ -109,6 +95,5 @@ try:
                 print(f"Error in AI processing: {e}")
     print("Good Game. Bye!")
 
-finally:
-    client.beta.assistants.delete(assistant.id)
-    print("\n Delete Assistant ID")
\ No newline at end of file
+except KeyboardInterrupt:
+    pass
@@ -3,16 +3,19 @@ import colorsys
 from fusion_hat import Pin, RGB_LED, PWM, Rotary_Encoder
 from signal import pause
 
-import openai
 from keys import OPENAI_API_KEY
-import subprocess
-import os
-from pathlib import Path
+from http_pool import openai_client
+from startup import defer, enable_speaker
+from conversation import open_conversation
+from tracing import trace_client, traced
+from tts_stream import speak
+from audio_player import get_player
 
-os.system("fusion_hat enable_speaker")
+enable_speaker()
+player = get_player()
 
 # initialize openai client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
 
 
 instructions_text = '''
@@ -37,24 +40,19 @@ The dominant warm tones (R: 255, G: 100, B: 50) create an energetic and cozy amb
 '''
 
 
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="BOT",
     instructions=instructions_text,
     model="gpt-4-1106-preview",
 )
 
-thread = client.beta.threads.create()
 
+@traced("tts")
 def text_to_speech(text):
-    speech_file_path = Path(__file__).parent / "speech.mp3"
-    with client.audio.speech.with_streaming_response.create(
-        model="tts-1",  # Low-latency TTS model for real-time usage
-        voice="alloy",  # Selected voice for audio playback
-        input=text  # Text to convert to speech
-    ) as response:
-        response.stream_to_file(speech_file_path) # Save audio to the specified file
-    p=subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    p.wait()
+    # stream the speech to the speaker, repeated phrases come from the local cache
+    speak(client, text)
 
 def change_color(encoder, led):
     """
@@ -70,28 +68,12 @@ def send_message(message):
     global r, g, b
     events = "red: {}, green: {}, blue: {}" .format(r, g, b)
     try:
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=events,
-        )
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-       )
+        replies, run = conversation.send(events)
 
         # print("Run completed with status: " + run.status)
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-            for message in messages.data:
-                if message.role == 'assistant':
-                    for block in message.content:
-                        if block.type == 'text':
-                            decoded_message = block.text.value
-                    break # only last reply
+            decoded_message = " ".join(replies)
 
         print(f"Decoded Message: {decoded_message}")
         text_to_speech(decoded_message)
@@ -116,5 +98,5 @@ try:
     pause()  # Wait indefinitely for events
 
 
-finally:
-    client.beta.assistants.delete(assistant.id)
+except KeyboardInterrupt:
+    pass
@@ -1,12 +1,17 @@
-import openai
 from keys import OPENAI_API_KEY
+from http_pool import openai_client
+from startup import defer, enable_speaker
+from tracing import trace_client, traced
+from assistant_registry import get_assistant
+from tts_stream import speak
+from audio_player import get_player
+from message_cursor import MessageCursor
 import readline  # Optimize keyboard input, only need to import
-import sys,os
-from pathlib import Path
+import sys
 from fusion_hat import Servo, Pin
-import subprocess
 
-os.system("fusion_hat enable_speaker")
+enable_speaker()
+get_player()  # open the audio device now, not on the first reply
 
 # Initialize GPIO components
 servo = Servo('P0')
@@ -16,11 +21,13 @@ led1.off()
 led2.off()
 
 # Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
 
 # Define assistants with specific instructions
 assistants = [
-    client.beta.assistants.create(
+    defer(
+        get_assistant,
+        client,
         name="Alloy",
         instructions=(
             "You are a debate team affirmative speaker. You must agree with the "
@@ -30,7 +37,9 @@ assistants = [
         ),
         model="gpt-4-1106-preview",
     ),
-    client.beta.assistants.create(
+    defer(
+        get_assistant,
+        client,
         name="Echo",
         instructions=(
             "You are a debate team opposition speaker. You must refute the affirmative's arguments "
@@ -42,6 +51,7 @@ assistants = [
 ]
 
 # Text-to-speech function
+@traced("tts")
 def text_to_speech(text, player):
     """
     Convert text to speech using OpenAI's TTS model.
@@ -49,17 +59,12 @@ def text_to_speech(text, player):
     :param player: The speaker identifier (0 for Alloy, 1 for Echo).
     """
     voice_player = "alloy" if player == 0 else "echo"
-    speech_file_path = Path(__file__).parent / "speech.mp3"
 
     try:
-        with client.audio.speech.with_streaming_response.create(
-            model="tts-1", voice=voice_player, input=text
-        ) as response:
-            response.stream_to_file(speech_file_path)
+        # stream the speech to the speaker while it is still downloading
+        speak(client, text, voice=voice_player)
     except Exception as e:
         print(f"Error in TTS: {e}")
-        return None
-    return speech_file_path
 
 # Debate function
 def debate(player, msg):
@@ -72,24 +77,20 @@ def debate(player, msg):
     assistant = assistants[player]
 
     try:
-        client.beta.threads.messages.create(
+        message = client.beta.threads.messages.create(
             thread_id=thread.id, role="user", content=msg
         )
+        cursor.mark(message)
 
         run = client.beta.threads.runs.create_and_poll(
             thread_id=thread.id, assistant_id=assistant.id
         )
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-            for message in messages.data:
-                if message.role == "assistant" and message.assistant_id == assistant.id:
-                    for block in message.content:
-                        if block.type == "text":
-                            response = block.text.value
-                            print(f'{assistant.name} >>> {response}')
-                            play_response(response, player)
-                            return response
+            for response in cursor.replies(assistant.id):
+                print(f'{assistant.name} >>> {response}')
+                play_response(response, player)
+                return response
     except Exception as e:
         print(f"Error during debate: {e}")
         return "An error occurred. Please try again."
@@ -101,25 +102,18 @@ def play_response(response, player):
     :param response: The assistant's response text.
     :param player: The speaker identifier (0 for Alloy, 1 for Echo).
     """
-    speech_file_path = text_to_speech(response, player)
-    if speech_file_path:
-        try:
-            # Play the speech and control LEDs/Servo
-            servo.angle(45) if player == 0 else servo.angle(-45)
-            led1.on() if player == 0 else led1.off()
-            led2.on() if player == 1 else led2.off()
-            p = subprocess.Popen(
-                ["mplayer", str(speech_file_path)],
-                shell=False,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-            )
-            p.wait()
-        except Exception as e:
-            print(f"Error playing response: {e}")
+    try:
+        # Control LEDs/Servo and play the speech
+        servo.angle(45) if player == 0 else servo.angle(-45)
+        led1.on() if player == 0 else led1.off()
+        led2.on() if player == 1 else led2.off()
+        text_to_speech(response, player)
+    except Exception as e:
+        print(f"Error playing response: {e}")
 
 # Create a thread for the debate
-thread = client.beta.threads.create()
+thread = defer(lambda: client.beta.threads.create())
+cursor = MessageCursor(client, thread)
 
 try:
     print("Start the debate by entering your topic:")
@@ -132,10 +126,8 @@ try:
         msg = debate(turn % 2, msg)
 
 finally:
-    # Cleanup GPIO and OpenAI resources
+    # Cleanup GPIO resources
     servo.angle(0)
     led1.off()
     led2.off()
-    for assistant in assistants:
-        client.beta.assistants.delete(assistant.id)
     print("Resources cleaned up. Exiting.")
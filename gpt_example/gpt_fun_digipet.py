@@ -1,80 +1,70 @@
-import openai
 from keys import OPENAI_API_KEY
+from http_pool import openai_client
+from startup import defer, enable_speaker, ready
+from conversation import open_conversation
+from tracing import trace_client, traced
+from tts_stream import speak
+from audio_player import get_player
+from stt import make_stt
+from mic_stream import get_microphone
+from json_stream import JSONStream
 import speech_recognition as sr
 
 from fusion_hat import LedMatrix
-from pathlib import Path
-import subprocess
-import sys
-import os
 
 
 # Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
-os.system("fusion_hat enable_speaker")
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+# short commands are transcribed on the device when faster-whisper is installed, see stt.py
+stt = make_stt(client)
+enable_speaker()
+player = get_player()
 
 # Initialize hardware components
 rgb_matrix = LedMatrix(rotate=0)
 recognizer = sr.Recognizer()
+# keep the microphone open, so each turn starts listening without re-calibrating
+mic = get_microphone(recognizer)
 
 
 # Functions for speech-to-text and text-to-speech
+@traced("stt")
 def speech_to_text(audio_file):
     """
-    Convert speech audio to text using OpenAI Whisper model.
+    Convert speech audio to text using Whisper, on the device or over the API.
     """
-    from io import BytesIO
-    wav_data = BytesIO(audio_file.get_wav_data())
-    wav_data.name = "record.wav"
-
     try:
-        transcription = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=wav_data,
-            language=["zh", "en"]
-        )
-        return transcription.text
+        return stt.transcribe(audio_file, language=["zh", "en"])
     except Exception as e:
         print(f"Error in Speech-to-Text: {e}")
         return ""
 
 
+@traced("tts")
 def text_to_speech(text):
     """
     Convert text to speech using OpenAI's TTS model.
     """
-    speech_file_path = Path(__file__).parent / "speech.mp3"
     try:
-        with client.audio.speech.with_streaming_response.create(
-            model="tts-1",
-            voice="alloy",
-            input=text
-        ) as response:
-            response.stream_to_file(speech_file_path)
-        p=subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        p.wait()
+        # stream the speech to the speaker, repeated phrases come from the local cache
+        speak(client, text)
     except Exception as e:
         print(f"Error in Text-to-Speech: {e}")
         return None
 
 
-# Redirect ALSA errors to null
-def redirect_error_to_null():
-    devnull = os.open(os.devnull, os.O_WRONLY)
-    old_stderr = os.dup(2)
-    sys.stderr.flush()
-    os.dup2(devnull, 2)
-    os.close(devnull)
-    return old_stderr
-
-
-def cancel_redirect_error(old_stderr):
-    os.dup2(old_stderr, 2)
-    os.close(old_stderr)
+def show_pattern(pattern):
+    """ Show a face: 8 rows of 8 bits, e.g. 0b00111100. """
+    if not isinstance(pattern, list) or len(pattern) != 8 or not all(isinstance(row, int) and 0 <= row <= 0xFF for row in pattern):
+        print(f"Not an 8x8 pattern: {pattern}")
+        return
+    rgb_matrix.display_pattern(pattern)
 
 
 # Create an OpenAI assistant
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="Electronic Pet Bot",
     instructions=(
         "You are an electronic pet robot with an 8x8 LED matrix as your face. "
@@ -87,17 +77,11 @@ assistant = client.beta.assistants.create(
     response_format="auto",
 )
 
-# Create a conversation thread
-thread = client.beta.threads.create()
-
 try:
     while True:
+        ready()
         print(f'\033[1;30m{"Listening..."}\033[0m')
-        old_stderr = redirect_error_to_null()
-        with sr.Microphone(chunk_size=8192) as source:
-            cancel_redirect_error(old_stderr)
-            recognizer.adjust_for_ambient_noise(source)
-            audio = recognizer.listen(source)
+        audio = mic.listen()
 
         print(f'\033[1;30m{"Processing audio..."}\033[0m')
         user_message = speech_to_text(audio)
@@ -105,38 +89,21 @@ try:
             print("No input detected. Please try again.")
             continue
 
-        # Send the user's message to the assistant
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=user_message,
-        )
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-        )
+        # Send the user's message to the assistant, the face changes as soon
+        # as "pattern" is complete, while the message is still streaming
+        parser = JSONStream({"pattern": show_pattern})
+        reply, run = conversation.stream(user_message, on_delta=parser.feed)
 
         # Process the assistant's response
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-            for message in messages.data:
-                if message.role == "assistant":
-                    for block in message.content:
-                        if block.type == "text":
-                            try:
-                                response = eval(block.text.value)
-                                pattern = response.get("pattern", [])
-                                assistant_message = response.get("message", "")
-                                if pattern:
-                                    rgb_matrix.display_pattern(pattern) 
-                                if assistant_message:
-                                    print(f"Bot: {assistant_message}")
-                                    text_to_speech(assistant_message)
-                            except Exception as e:
-                                print(f"Error in processing assistant response: {e}")
-                    break
+            response = parser.close()
+            if response is None:
+                print(f"Error in processing assistant response: {reply}")
+                continue
+            assistant_message = response.get("message", "")
+            if assistant_message:
+                print(f"Bot: {assistant_message}")
+                text_to_speech(assistant_message)
 
 finally:
-    client.beta.assistants.delete(assistant.id)
     print("Resources cleaned up.")
\ No newline at end of file
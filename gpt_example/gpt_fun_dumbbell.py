@@ -1,22 +1,29 @@
 from fusion_hat import MPU6050, Pin
 from time import sleep,time
-import openai
 from keys import OPENAI_API_KEY
-import sys,os
-import subprocess
-from pathlib import Path
+from http_pool import openai_client
+from startup import defer, enable_speaker
+from conversation import open_conversation
+from tracing import trace_client, traced
+from tts_cache import speech_cache
+from tts_stream import speak
+from audio_player import get_player
+from sensor_context import ContextEncoder
+import sys
 
 # gets API Key from environment variable OPENAI_API_KEY
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
-os.system("fusion_hat enable_speaker")
-
-TTS_OUTPUT_FILE = 'tts_output.mp3'
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+enable_speaker()
+player = get_player()
 
 instructions_text = '''
 You are a smart fitness assistant. Your task is to analyze the user's dumbbell workout based on the number of lifts and speed data, then provide feedback and recommendations.
 
 ### Input Format:
-"The number of times you lift dumbbells: [count], Motion data: [(timestamp, speed), (timestamp, speed), ...]"
+JSON with the number of lifts and the lift speeds in m/s. A short set lists [seconds since the first lift, speed] pairs,
+a longer one is summarized as {"count", "min", "max", "mean", "slope"}, where slope is the change in speed per second:
+{"lifts": [count], "speed": [[0, speed], [seconds, speed], ...]}
+{"lifts": [count], "speed": {"count": [count], "min": [speed], "max": [speed], "mean": [speed], "slope": [change per second]}}
 
 ### Output Guidelines:
 1. **If the user stops lifting for 5 seconds**, acknowledge the session's completion and summarize performance.
@@ -37,7 +44,7 @@ You are a smart fitness assistant. Your task is to analyze the user's dumbbell w
 
 **Example 1:**
 Input:  
-"The number of times you lift dumbbells: 5, Motion data: [(1700000000, 0.2), (1700000002, 0.25), (1700000004, 0.22)]"
+{"lifts":5,"speed":[[0,0.2],[2,0.25],[4,0.22]]}
 
 Output:  
 "You've lifted the dumbbell 5 times. Keep going! Try to maintain a steady rhythm to maximize your gains."
@@ -46,7 +53,7 @@ Output:
 
 **Example 2:**
 Input:  
-"The number of times you lift dumbbells: 35, Motion data: [(1700000000, 0.3), (1700000001, 0.32), (1700000002, 0.31)]"
+{"lifts":35,"speed":{"count":35,"min":0.29,"max":0.33,"mean":0.31,"slope":0.0002}}
 
 Output:  
 "Great job! You've completed 35 reps with excellent consistency. Take a short break and stay hydrated before your next set."
@@ -55,30 +62,28 @@ Output:
 
 **Example 3:**
 Input:  
-"The number of times you lift dumbbells: 20, Motion data: [(1700000000, 0.4), (1700000002, 0.6), (1700000004, 0.2)]"
+{"lifts":20,"speed":{"count":20,"min":0.2,"max":0.6,"mean":0.38,"slope":-0.004}}
 
 Output:  
 "You're at 20 reps, but your speed fluctuates. Try to maintain a controlled pace for better strength gains!"
 '''
 
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="BOT",
     instructions=instructions_text,
     model="gpt-4-1106-preview",
 )
 
-thread = client.beta.threads.create()
 
+# synthesize the start prompt now, so it plays without waiting for the network
+speech_cache.prewarm(client, ["Start exercise!"])
+
+@traced("tts")
 def text_to_speech(text):
-    speech_file_path = Path(__file__).parent / "speech.mp3"
-    with client.audio.speech.with_streaming_response.create(
-        model="tts-1",  # Low-latency TTS model for real-time usage
-        voice="alloy",  # Selected voice for audio playback
-        input=text  # Text to convert to speech
-    ) as response:
-        response.stream_to_file(speech_file_path) # Save audio to the specified file
-    p=subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    p.wait()
+    # stream the speech to the speaker, repeated phrases come from the local cache
+    speak(client, text)
 
 
 # Define GPIO pins for the 74HC595 shift register
@@ -150,6 +155,8 @@ last_state = "down"
 time_last = time()
 last_lift_time = time()
 motion_data = []  # store timestamp for analysis
+# speeds in m/s are sent with two decimals, sets longer than 8 lifts as a summary
+motion_context = ContextEncoder(precision=2)
 speed_list = []
 count = 0
 
@@ -192,32 +199,17 @@ while count <= 100:
 # send data to AI
 
 try:
-    msg = f"Dumbbell lifts: {count}, Motion data: {motion_data}"
-    message = client.beta.threads.messages.create(
-        thread_id=thread.id,
-        role="user",
-        content=msg,
-    )
-
-    run = client.beta.threads.runs.create_and_poll(
-        thread_id=thread.id,
-        assistant_id=assistant.id,
-    )
+    msg = motion_context.encode({"lifts": count, "speed": motion_data})
+    print(motion_context.report())
+    replies, run = conversation.send(msg)
 
     # print("Run completed with status: " + run.status)
 
     if run.status == "completed":
-        messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-        for message in messages.data:
-            if message.role == 'assistant':
-                for block in message.content:
-                    if block.type == 'text':
-                        label = assistant.name
-                        value = block.text.value
-                        print(f'{label:>10} >>> {value}')
-                        text_to_speech(value)
-                break # only last reply
-
-finally:
-    client.beta.assistants.delete(assistant.id)
+        for value in replies:
+            label = conversation.name
+            print(f'{label:>10} >>> {value}')
+            text_to_speech(value)
+
+except KeyboardInterrupt:
+    pass
@@ -1,21 +1,27 @@
-import openai
 from keys import OPENAI_API_KEY
-from pathlib import Path
+from http_pool import openai_client
+from startup import defer, enable_speaker, ready
+from conversation import open_conversation
+from tracing import trace_client, traced
+from tts_stream import speak
+from audio_player import get_player
+from stt import make_stt
+from mic_stream import get_microphone
+from intents import lamp_intents
+from json_stream import JSONStream
 
 import readline # optimize keyboard input, only need to import
-import sys
-import os
-import subprocess
 
 import speech_recognition as sr
 from fusion_hat import RGB_LED, PWM
 
 # gets API Key from environment variable OPENAI_API_KEY
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+# short commands are transcribed on the device when faster-whisper is installed, see stt.py
+stt = make_stt(client)
 
-os.system("fusion_hat enable_speaker")
-
-TTS_OUTPUT_FILE = 'tts_output.mp3'
+enable_speaker()
+player = get_player()
 
 instructions_text = '''
 You are a smart lamp assistant. Your role is to respond to user commands by providing two outputs: 
@@ -37,14 +43,14 @@ The user will provide a command describing their mood or desired lighting condit
 }
 '''
 
-# assistant=client.beta.assistants.retrieve(OPENAI_ASSISTANT_ID)
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="BOT",
     instructions=instructions_text,
     model="gpt-4-1106-preview",
 )
 
-thread = client.beta.threads.create()
 recognizer = sr.Recognizer()
 
 # Initialize an RGB LED.
@@ -54,46 +60,24 @@ rgb_led = RGB_LED(PWM('P0'), PWM('P1'), PWM('P2'),common=RGB_LED.CATHODE)
 recognizer.dynamic_energy_adjustment_damping = 0.15
 recognizer.dynamic_energy_ratio = 1
 recognizer.operation_timeout = None  # seconds after an internal operation (e.g., an API request) starts before it times out, or ``None`` for no timeout
-recognizer.pause_threshold = 1
+# keep the microphone open, so each turn starts listening without re-calibrating
+mic = get_microphone(recognizer)
 
+@traced("stt")
 def speech_to_text(audio_file):
-    from io import BytesIO
-
-    wav_data = BytesIO(audio_file.get_wav_data())
-    wav_data.name = "record.wav"
-
-    transcription = client.audio.transcriptions.create(
-        model="whisper-1", 
-        file=wav_data,
-        language=['zh','en']
-    )
-    return transcription.text
-
-def redirect_error_2_null():
-    # https://github.com/spatialaudio/python-sounddevice/issues/11
-
-    devnull = os.open(os.devnull, os.O_WRONLY)
-    old_stderr = os.dup(2)
-    sys.stderr.flush()
-    os.dup2(devnull, 2)
-    os.close(devnull)
-    return old_stderr
-
-def cancel_redirect_error(old_stderr):
-    os.dup2(old_stderr, 2)
-    os.close(old_stderr)
-
+    return stt.transcribe(audio_file, language=["zh", "en"])
 
+@traced("tts")
 def text_to_speech(text):
-    speech_file_path = Path(__file__).parent / "speech.mp3"
-    with client.audio.speech.with_streaming_response.create(
-        model="tts-1",
-        voice="alloy",
-        input=text
-    ) as response:
-        response.stream_to_file(speech_file_path)
-    p=subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    p.wait()
+    # stream the speech to the speaker, repeated phrases come from the local cache
+    speak(client, text)
+
+def set_color(color):
+    """ Light the LED with a color of three components between 0 and 1. """
+    if not isinstance(color, list) or len(color) != 3 or not all(isinstance(c, (int, float)) and 0 <= c <= 1 for c in color):
+        print(f"Not an RGB color: {color}")
+        return
+    rgb_led.color([round(c * 255) for c in color])
 
 
 try:
@@ -102,12 +86,9 @@ try:
         msg = ""
         # msg = input(f'\033[1;30m{"intput: "}\033[0m').encode(sys.stdin.encoding).decode('utf-8')
 
+        ready()
         print(f'\033[1;30m{"listening... "}\033[0m')
-        _stderr_back = redirect_error_2_null() # ignore error print to ignore ALSA errors
-        with sr.Microphone(chunk_size=8192) as source:
-            cancel_redirect_error(_stderr_back) # restore error print
-            recognizer.adjust_for_ambient_noise(source)
-            audio = recognizer.listen(source)
+        audio = mic.listen()
         
         print(f'\033[1;30m{"stop listening... "}\033[0m')
         # with open("stt-rec.wav", "wb") as f:
@@ -120,58 +101,32 @@ try:
             print() # new line
             continue
 
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=msg,
-        )
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-        )
-
-        if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-            for message in messages.data:
-                if message.role == 'user':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = message.role 
-                            value = block.text.value
-                            print(f'{label:>10} >>> {value}')
-                    break # only last reply
-
-            for message in messages.data:
-                if message.role == 'assistant':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = assistant.name
-                            value = block.text.value
-                            #print(f'value: {value}')
-                            try:
-                                value = eval(value)
-                            except Exception as e:
-                                value = str(value)
-                            if isinstance(value, dict):
-                                if 'color' in value:
-                                    color = list(value['color'])
-                                else:
-                                    color = [0,0,0]
-                                if 'message' in value:
-                                    text = value['message']
-                                else :
-                                    text = ''
-                            else:
-                                color = [0,0,0]
-                                text = value
-
-                            print(f'{label:>10} >>> {text} {color}')
-                            rgb_led.color = color
-                            text_to_speech(text)
-                    break # only last reply
+        # color names like "warm white" or "turn off the light" are resolved locally, without an assistant run
+        print(f'{"user":>10} >>> {msg}')
+        reply = lamp_intents.match(msg)
+        if reply is not None:
+            value, label = reply, "local"
+        else:
+            # the LED changes as soon as "color" is complete, while the message is still streaming
+            parser = JSONStream({"color": set_color})
+            reply, run = conversation.stream(msg, on_delta=parser.feed)
+            if run.status != "completed":
+                continue
+            value, label = parser.close() or reply, conversation.name
+
+        #print(f'value: {value}')
+        if isinstance(value, dict):
+            color = value.get('color', [0,0,0])
+            text = value.get('message', '')
+        else:
+            color = [0,0,0]
+            text = value
+
+        print(f'{label:>10} >>> {text} {color}')
+        set_color(color)
+        text_to_speech(text)
 
 finally:
+    print(lamp_intents.report())
+    print(stt.report())
     rgb_led.color(0x000000)  
-    client.beta.assistants.delete(assistant.id)
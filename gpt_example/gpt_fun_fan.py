@@ -1,17 +1,22 @@
-import openai
 from keys import OPENAI_API_KEY
-import sys
-import os
+from http_pool import openai_client
+from startup import defer, enable_speaker, ready
+from conversation import open_conversation
+from tracing import trace_client, traced
+from stt import make_stt
+from mic_stream import get_microphone
+from intents import fan_intents
+from json_stream import JSONStream
 import time
 import speech_recognition as sr
 from fusion_hat import Motor,PWM,Pin,Buzzer
 
 # gets API Key from environment variable OPENAI_API_KEY
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+# short commands are transcribed on the device when faster-whisper is installed, see stt.py
+stt = make_stt(client)
 
-os.system("fusion_hat enable_speaker")
-
-TTS_OUTPUT_FILE = 'tts_output.mp3'
+enable_speaker()
 
 
 instructions_text = '''
@@ -42,16 +47,15 @@ Input: "current speed: 50, message: What is my current speed?"
 Output: {"speed": 50, "message": "Your current speed is 50%."}
 '''
 
-# assistant=client.beta.assistants.retrieve(OPENAI_ASSISTANT_ID)
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="BOT",
     instructions=instructions_text,
     model="gpt-4-1106-preview",
 )
 
-thread = client.beta.threads.create()
 recognizer = sr.Recognizer()
-os.system("fusion_hat enable_speaker")
 
 
 # speech_recognition init
@@ -59,34 +63,12 @@ os.system("fusion_hat enable_speaker")
 recognizer.dynamic_energy_adjustment_damping = 0.15
 recognizer.dynamic_energy_ratio = 1
 recognizer.operation_timeout = None  # seconds after an internal operation (e.g., an API request) starts before it times out, or ``None`` for no timeout
-recognizer.pause_threshold = 1
+# keep the microphone open, so each turn starts listening without re-calibrating
+mic = get_microphone(recognizer)
 
+@traced("stt")
 def speech_to_text(audio_file):
-    from io import BytesIO
-
-    wav_data = BytesIO(audio_file.get_wav_data())
-    wav_data.name = "record.wav"
-
-    transcription = client.audio.transcriptions.create(
-        model="whisper-1", 
-        file=wav_data,
-        language=['zh','en']
-    )
-    return transcription.text
-
-def redirect_error_2_null():
-    # https://github.com/spatialaudio/python-sounddevice/issues/11
-
-    devnull = os.open(os.devnull, os.O_WRONLY)
-    old_stderr = os.dup(2)
-    sys.stderr.flush()
-    os.dup2(devnull, 2)
-    os.close(devnull)
-    return old_stderr
-
-def cancel_redirect_error(old_stderr):
-    os.dup2(old_stderr, 2)
-    os.close(old_stderr)
+    return stt.transcribe(audio_file, language=["zh", "en"])
 
 motor = Motor('M0')
 touch_sensor = Pin(17, Pin.IN, pull = Pin.PULL_DOWN) 
@@ -116,20 +98,22 @@ def speed_up():
 
 touch_sensor.when_activated = speed_up
 
+def set_speed(value):
+    """ Run the motor at a speed from the assistant, 0-100. """
+    global speed
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0 <= value <= 100:
+        print(f"Not a speed: {value}")
+        return
+    speed = value
+    motor.speed(speed)
+
 try:
     while True:
         msg = ""
         # Notify user that recording has started
+        ready()
         print(f'\033[1;30m{"listening... "}\033[0m')
-        # Redirect error messages to suppress ALSA warnings
-        _stderr_back = redirect_error_2_null() 
-        with sr.Microphone(chunk_size=8192) as source:
-            # Restore standard error output
-            cancel_redirect_error(_stderr_back)
-            # Adjust for ambient noise to filter background sound
-            recognizer.adjust_for_ambient_noise(source)
-            # Record user speech
-            audio = recognizer.listen(source)
+        audio = mic.listen()
         print(f'\033[1;30m{"stop listening... "}\033[0m')
 
         # Convert recorded audio to text
@@ -143,61 +127,31 @@ try:
 
         send_message= "current speed:"+ str(speed) + "message:" + msg
 
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=send_message,
-        )
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-        )
-
-        if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-            for message in messages.data:
-                if message.role == 'user':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = message.role 
-                            value = block.text.value
-                            print(f'{label:>10} >>> {value}')
-                    break # only last reply
-
-            for message in messages.data:
-                if message.role == 'assistant':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = assistant.name
-                            value = block.text.value
-                            # print(f"Raw AI Response: {value}")
-                            try:
-                                value = eval(value)
-                            except Exception as e:
-                                value = str(value)
-                            if isinstance(value, dict):
-                                if 'speed' in value:
-                                    speed = value['speed']
-                                else:
-                                    speed = -1
-                                if 'message' in value:
-                                    text = value['message']
-                                else :
-                                    text = ''
-                            else:
-                                speed = -1
-                                text = value
-
-                            print(f'{label:>10} >>> {text} {speed}')
-
-                            if speed >= 0:
-                                motor.speed(speed)
-
-                    break # only last reply
+        # simple commands like "stop the fan" are resolved locally, without an assistant run
+        print(f'{"user":>10} >>> {send_message}')
+        reply = fan_intents.match(msg, speed=speed)
+        if reply is not None:
+            value, label = reply, "local"
+        else:
+            # the motor changes as soon as "speed" is complete, while the message is still streaming
+            parser = JSONStream({"speed": set_speed})
+            reply, run = conversation.stream(send_message, on_delta=parser.feed)
+            if run.status != "completed":
+                continue
+            value, label = parser.close() or reply, conversation.name
+
+        # print(f"Raw AI Response: {value}")
+        if isinstance(value, dict):
+            if 'speed' in value:
+                set_speed(value['speed'])
+            text = value.get('message', '')
+        else:
+            text = value
+
+        print(f'{label:>10} >>> {text} {speed}')
 
 finally:
-    client.beta.assistants.delete(assistant.id)
+    print(fan_intents.report())
+    print(stt.report())
     buzzer.off()
     motor.stop()
@@ -1,19 +1,23 @@
-import openai
 from keys import OPENAI_API_KEY
+from http_pool import openai_client
+from startup import defer
+from conversation import open_conversation
+from tracing import trace_client
 import time
 from fusion_hat import Pin
 from signal import pause
 
 # init openai
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
 
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="BOT",
     instructions="You function as a gesture interaction device equipped with two infrared obstacle avoidance sensors positioned approximately 10 cm apart. You will receive trigger information from these sensors in the format: {('left', timestamp), ('right', timestamp)}. Based on the time difference between these triggers, determine if the user is waving their hand. Provide appropriate responses, such as 'You waved quickly from left to right, hello!' or 'You waved slowly twice on the left side, hello!'.",
     model="gpt-4-1106-preview",
 )
 
-thread = client.beta.threads.create()
 
 
 # setup GPIO
@@ -45,28 +49,12 @@ def analyze_hand_wave():
 
     # send events to AI for decoding
     try:
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=str(events),
-        )
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-       )
+        replies, run = conversation.send(str(events))
 
         # print("Run completed with status: " + run.status)
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-            for message in messages.data:
-                if message.role == 'assistant':
-                    for block in message.content:
-                        if block.type == 'text':
-                            decoded_message = block.text.value
-                    break # only last reply
+            decoded_message = " ".join(replies)
 
         print(f"Decoded Message: {decoded_message}")
 
@@ -87,5 +75,4 @@ try:
 
 finally:
     print("Resources cleaned up. Exiting.")
-    client.beta.assistants.delete(assistant.id)
     
\ No newline at end of file
@@ -1,10 +1,13 @@
-import openai
 from keys import OPENAI_API_KEY
+from http_pool import openai_client
+from startup import defer
+from conversation import open_conversation
+from tracing import trace_client
 import sys
 from fusion_hat import Keypad
 
 # Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
 
 instructions_text = '''
 You are an MBTI personality test assistant. Your role is to ask me a series of personality-related questions and assess my MBTI type based on my responses. Please follow these guidelines:
@@ -24,15 +27,14 @@ Once all 10 questions are answered, please provide a summary and give me the fin
 '''
 
 # Create or retrieve the assistant
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="MBTI_Assistant",
     instructions=instructions_text,
     model="gpt-4-1106-preview",
 )
 
-# Create a conversation thread
-thread = client.beta.threads.create()
-
 
 def process_user_input(keypad, count):
     """
@@ -69,40 +71,16 @@ try:
             print() # new line
             continue
 
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=msg,
-        )
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-         )
+        replies, run = conversation.send(msg)
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-            for message in messages.data:
-                if message.role == 'user':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = message.role 
-                            value = block.text.value
-                            print(f'{label:>10} >>> {value}')
-                    break # only last reply
-
-            for message in messages.data:
-                if message.role == 'assistant':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = assistant.name
-                            value = block.text.value
-                            print(f'{label:>10} >>> {value}')
-                    break # only last reply
+            print(f'{"user":>10} >>> {msg}')
+
+            for value in replies:
+                label = conversation.name
+                print(f'{label:>10} >>> {value}')
 
     input("\n Press enter for quit.")
 
-finally:
-    client.beta.assistants.delete(assistant.id)
-    print("\n Delete Assistant ID")
+except KeyboardInterrupt:
+    pass
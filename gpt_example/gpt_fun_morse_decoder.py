@@ -1,19 +1,23 @@
-import openai
 from keys import OPENAI_API_KEY
+from http_pool import openai_client
+from startup import defer
+from conversation import open_conversation
+from tracing import trace_client
 from fusion_hat import Pin
 from signal import pause
 import time
 
 # init openai
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
 
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="BOT",
     instructions="You are a Morse code decoder. Decode based on the button press time, interpreting short presses as dots and long presses as dashes. The message you receive may be a word or a sentence, please decode it and output it.",
     model="gpt-4-1106-preview",
 )
 
-thread = client.beta.threads.create()
 
 # setup GPIO
 morse_input = Pin(22, Pin.IN, pull= Pin.PULL_DOWN)  
@@ -28,28 +32,12 @@ input_active = False  # flag to indicate if the input is active
 def decode_and_speak():
     global morse_events
     try:
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=str(morse_events),
-        )
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-       )
+        replies, run = conversation.send(str(morse_events))
 
         # print("Run completed with status: " + run.status)
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-            for message in messages.data:
-                if message.role == 'assistant':
-                    for block in message.content:
-                        if block.type == 'text':
-                            decoded_message = block.text.value
-                    break # only last reply
+            decoded_message = " ".join(replies)
 
         print(f"Decoded Message: {decoded_message}")
     except Exception as e:
@@ -95,6 +83,5 @@ try:
     handle_start_stop()
     pause()
 
-finally:
-    client.beta.assistants.delete(assistant.id)
-    print("\n Delete Assistant ID")
\ No newline at end of file
+except KeyboardInterrupt:
+    pass
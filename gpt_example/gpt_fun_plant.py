@@ -1,94 +1,78 @@
-import openai
 from keys import OPENAI_API_KEY
+from http_pool import openai_client
+from startup import defer, enable_speaker, ready
+from conversation import open_conversation
+from tracing import trace_client, traced
+from tts_stream import speak
+from audio_player import get_player
+from stt import make_stt
+from mic_stream import get_microphone
+from reply_stream import SpeechPipeline
+from sensor_context import ContextEncoder
+from response_cache import ResponseCache
+from runtime import Runtime
 import readline  # Optimize keyboard input
-import sys
-import os
-import subprocess
-from pathlib import Path
 import speech_recognition as sr
 from fusion_hat import ADC,DHT11
 
-import time
-import threading
-
 # Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+# short commands are transcribed on the device when faster-whisper is installed, see stt.py
+stt = make_stt(client)
 
-os.system("fusion_hat enable_speaker")
+enable_speaker()
+player = get_player()
 
 # Initialize speech recognizer
 recognizer = sr.Recognizer()
+# keep the microphone open, so each turn starts listening without re-calibrating
+mic = get_microphone(recognizer)
 
 # Initialize hardware components
 dht11 = DHT11(17)
 light_sensor = ADC('A0')
 moisture_sensor = ADC('A1')
 
-humidity = None
-temperature = None
-light = None
-moisture = None
-
-# Function to fetch sensor data
-def fetch_sensor_data():
-    global humidity, temperature, light, moisture
-    while True:
-        _humidity, _temperature = dht11.read()
-        if _humidity != 0.0:
-            humidity = _humidity
-        if _temperature != 0.0:
-            temperature = _temperature
-        light = light_sensor.read()
-        moisture = moisture_sensor.read()
-        time.sleep(1)
-
-# Start a background thread for sensor data
-sensor_thread = threading.Thread(target=fetch_sensor_data)
-sensor_thread.daemon = True
-sensor_thread.start()
-
-# Function for text-to-speech conversion
-def text_to_speech(text):
-    speech_file_path = Path(__file__).parent / "speech.mp3"
-    try:
-        with client.audio.speech.with_streaming_response.create(
-            model="tts-1", voice="alloy", input=text
-        ) as response:
-            response.stream_to_file(speech_file_path)
-        p=subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        p.wait()
-    except Exception as e:
-        print(f"Error in TTS: {e}")
-        return None
-
+# the sensors are sampled every second while the runtime runs, also while listening and speaking;
+# the DHT11 reads 0.0 when a reading fails
+runtime = Runtime()
+climate = runtime.sensor("dht11", dht11.read, interval=1, valid=lambda reading: 0.0 not in reading)
+light = runtime.sensor("light", light_sensor.read, interval=1)
+moisture = runtime.sensor("moisture", moisture_sensor.read, interval=1)
+
+# readings are sent as compact JSON, see sensor_context.py; dht11 reads (humidity, temperature)
+plant_context = ContextEncoder({
+    "light": "light",
+    "moisture": "moisture",
+    "temperature": "climate.1",
+    "humidity": "climate.0",
+})
+# the same question with readings in the same bands gets the same answer, without a run
+responses = ResponseCache("plant", buckets={"light": 100, "moisture": 100, "temperature": 1, "humidity": 5})
+
+# Functions for text-to-speech conversion
+@traced("tts")
+def synthesize_speech(text):
+    # stream the sentence into the player, it starts playing while still downloading;
+    # every sentence is kept in the TTS cache, so cached replies replay without the network
+    return speak(client, text, wait=False, cache_max_chars=None)
+
+@traced("playback")
+def play_speech(clip):
+    clip.done.wait()
+
+# speak each sentence while the rest of the reply is still being generated
+speech = SpeechPipeline(synthesize_speech, play_speech)
 
 # Function for speech-to-text conversion
+@traced("stt")
 def speech_to_text(audio_file):
-    from io import BytesIO
-
-    wav_data = BytesIO(audio_file.get_wav_data())
-    wav_data.name = "record.wav"
-    transcription = client.audio.transcriptions.create(
-        model="whisper-1", file=wav_data, language=["zh", "en"]
-    )
-    return transcription.text
-
-# Function to redirect errors to null
-def redirect_error_to_null():
-    devnull = os.open(os.devnull, os.O_WRONLY)
-    old_stderr = os.dup(2)
-    sys.stderr.flush()
-    os.dup2(devnull, 2)
-    os.close(devnull)
-    return old_stderr
-
-# Function to cancel redirected errors
-def cancel_redirect_error(old_stderr):
-    os.dup2(old_stderr, 2)
-    os.close(old_stderr)
+    return stt.transcribe(audio_file, language=["zh", "en"])
 
 # Create OpenAI assistant
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="Plant Bot",
     instructions=(
         "You are a virtual plant. Based on the received greeting and environmental conditions "
@@ -102,55 +86,39 @@ assistant = client.beta.assistants.create(
     model="gpt-4-1106-preview",
 )
 
-# Create a conversation thread
-thread = client.beta.threads.create()
-
-try:
+async def main():
     while True:
         # Listen for user input
+        ready()
         print(f'\033[1;30m{"Listening..."}\033[0m')
-        old_stderr = redirect_error_to_null()
-        with sr.Microphone(chunk_size=8192) as source:
-            cancel_redirect_error(old_stderr)
-            recognizer.adjust_for_ambient_noise(source)
-            audio = recognizer.listen(source)
+        audio = await runtime.listen(mic)
         print(f'\033[1;30m{"Processing audio..."}\033[0m')
 
         # Convert speech to text
-        user_message = speech_to_text(audio)
+        user_message = await runtime.call(speech_to_text, audio)
         if not user_message:
             print("No valid input detected.")
             continue
 
         # Prepare input for assistant
-        assistant_input = {
-            "light": light,
-            "moisture": moisture,
-            "temperature": temperature,
-            "humidity": humidity,
-            "message": user_message,
-        }
-
-        # Send message to assistant
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id, role="user", content=str(assistant_input)
-        )
+        sensors = {"light": light.value, "moisture": moisture.value, "climate": climate.value}
+        readings = plant_context.project(sensors)
+        assistant_input = plant_context.encode(sensors, message=user_message)
 
-        # Get assistant response
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id, assistant_id=assistant.id
+        # Send message to assistant and stream the response, speaking each sentence as soon as it is complete
+        response, run = await runtime.call(
+            responses.stream, conversation, assistant_input, on_sentence=speech.say, text=user_message, **readings
         )
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-            for message in messages.data:
-                if message.role == "assistant":
-                    for block in message.content:
-                        if block.type == "text":
-                            response = block.text.value
-                            print(f"Plant Bot >>> {response}")
-                            text_to_speech(response)
-                    break
+            print(f"Plant Bot >>> {response}")
+        await runtime.call(speech.wait)
+
+try:
+    runtime.run(main)
+except KeyboardInterrupt:
+    pass
 finally:
-    client.beta.assistants.delete(assistant.id)
-    print("\n Delete Assistant ID")
\ No newline at end of file
+    print(plant_context.report())
+    print(responses.report())
+    print(stt.report())
@@ -1,55 +1,62 @@
-import openai
 from keys import OPENAI_API_KEY
+from http_pool import openai_client
+from startup import defer, enable_speaker
+from tracing import trace_client, traced
+from tts_cache import speech_cache
+from tts_stream import speak
+from audio_player import ALARM, MUSIC, get_player
+from runtime import Runtime
 from fusion_hat import Pin
 from pathlib import Path
-import subprocess
-import os
 
 # Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
 # thread = client.beta.threads.create()
-os.system("fusion_hat enable_speaker")
+enable_speaker()
+player = get_player()
 
 # Initialize sensors
 reed_switch = Pin(17, Pin.IN, pull=Pin.PULL_UP)
 motion_sensor = Pin(22, Pin.IN, pull=Pin.PULL_DOWN)
 
+DOORBELL = Path(__file__).parent.parent / "music" / "doorbell.wav"
+
 # Function for text-to-speech conversion and play the speech
+@traced("tts")
 def text_to_speech(text):
-    speech_file_path = Path(__file__).parent / "speech.mp3"
     try:
-        with client.audio.speech.with_streaming_response.create(
-            model="tts-1", voice="alloy", input=text
-        ) as response:
-            response.stream_to_file(speech_file_path)
-        # Play the generated speech file
-        subprocess.Popen(
-            ["mplayer", str(speech_file_path)],
-            shell=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-         ).wait()
+        # queue the alert and return, it preempts other speech; an alert that is
+        # still waiting to be played is not queued a second time
+        speak(client, text, wait=False, priority=ALARM, key=text)
     except Exception as e:
         print(f"Error in TTS or playing the file: {e}")
 
+# synthesize the alerts now, so they play without waiting for the network
+speech_cache.prewarm(client, ["Attention! The door was opened.", "Warning! Motion detected."])
+
+# the alerts run on the runtime, so a second event is handled while the first alert still plays
+runtime = Runtime()
+
 # Sensor event handlers
 def door_opened():
     print("Door was opened!")
     text_to_speech("Attention! The door was opened.")
+    # the doorbell is 11 s long: it rings after the announcement, and every alert
+    # preempts it; a door opened again while it waits rings only once
+    player.play(DOORBELL, wait=False, priority=MUSIC, key="doorbell")
 
 def motion_detected():
     print("Motion detected!")
     text_to_speech("Warning! Motion detected.")
 
 # Assign event handlers
-reed_switch.when_deactivated = door_opened
-motion_sensor.when_activated = motion_detected
+runtime.on(reed_switch, "when_deactivated", door_opened)
+runtime.on(motion_sensor, "when_activated", motion_detected)
 
 # Keep the script running
 try:
     print("System is active. Monitoring...")
-    import signal
-    signal.pause()  # Use signal.pause() on Unix to keep the script running
+    runtime.run()  # run until Ctrl+C
 except KeyboardInterrupt:
     print("Program terminated by user.")
 finally:
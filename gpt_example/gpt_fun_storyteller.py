@@ -1,17 +1,21 @@
-import openai
 from keys import OPENAI_API_KEY
+from http_pool import openai_client
+from startup import defer, enable_speaker
+from tracing import trace_client, traced
+from assistant_registry import get_assistant
+from tts_stream import speak
+from audio_player import get_player
+from message_cursor import MessageCursor
 import readline  # Optimize keyboard input
 import sys
-import os
-from pathlib import Path
-import subprocess
 from fusion_hat import Pin
 from picamera2 import Picamera2
 
-os.system("fusion_hat enable_speaker")
+enable_speaker()
+player = get_player()
 
 # Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
 
 # Initialize hardware components
 button = Pin(17, Pin.IN, Pin.PULL_DOWN)
@@ -34,17 +38,14 @@ def capture_photo():
         print(f"Error capturing photo: {e}")
 
 # Function for text-to-speech conversion
+@traced("tts")
 def text_to_speech(text):
     """
     Convert text to speech using OpenAI's TTS model.
     """
-    speech_file_path = Path(__file__).parent / "speech.mp3"
     try:
-        with client.audio.speech.with_streaming_response.create(
-            model="tts-1", voice="alloy", input=text
-        ) as response:
-            response.stream_to_file(speech_file_path)
-        subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT).wait()
+        # stream the speech to the speaker, repeated phrases come from the local cache
+        speak(client, text)
     except Exception as e:
         print(f"Error in Text-to-Speech: {e}")
 
@@ -69,6 +70,7 @@ def story_talking():
                 {"type": "image_file", "image_file": {"file_id": file.id}},
             ],
         )
+        cursor.mark(message)
 
         # Run the assistant and get the response
         run = client.beta.threads.runs.create_and_poll(
@@ -76,20 +78,17 @@ def story_talking():
         )
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-            for message in messages.data:
-                if message.role == "assistant":
-                    for block in message.content:
-                        if block.type == "text":
-                            response = block.text.value
-                            print(f"Assistant >>> {response}")
-                            text_to_speech(response)
-                            return
+            for response in cursor.replies():
+                print(f"Assistant >>> {response}")
+                text_to_speech(response)
+                return
     except Exception as e:
         print(f"Error in story_talking: {e}")
 
 # Create OpenAI assistant
-assistant = client.beta.assistants.create(
+assistant = defer(
+    get_assistant,
+    client,
     name="Storyteller Bot",
     instructions=(
         "You are a storyteller. When given a book cover image, "
@@ -99,7 +98,8 @@ assistant = client.beta.assistants.create(
 )
 
 # Create a conversation thread
-thread = client.beta.threads.create()
+thread = defer(lambda: client.beta.threads.create())
+cursor = MessageCursor(client, thread)
 
 button.when_activated = capture_photo
 
@@ -110,5 +110,4 @@ try:
     signal.pause()  # Use signal.pause() on Unix to keep the script running
 finally:
     # Clean up resources
-    client.beta.assistants.delete(assistant.id)
     print("Resources cleaned up. Exiting.")
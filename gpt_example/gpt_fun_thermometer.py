@@ -1,18 +1,26 @@
-import openai
 from keys import OPENAI_API_KEY
+from http_pool import openai_client
+from startup import defer, enable_speaker, ready
+from conversation import open_conversation
+from tracing import trace_client, traced
+from tts_stream import speak
+from audio_player import get_player
+from stt import make_stt
+from mic_stream import get_microphone
+from reply_stream import SpeechPipeline
+from response_cache import ResponseCache
 import time
 from fusion_hat import ADC
-from pathlib import Path
 import speech_recognition as sr
-import sys
-import os
-import subprocess
 import math
 
 # initialize openai client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+# short commands are transcribed on the device when faster-whisper is installed, see stt.py
+stt = make_stt(client)
 
-os.system("fusion_hat enable_speaker")
+enable_speaker()
+player = get_player()
 
 instructions_text = '''
 You are a health assistant. Your task is to assess the user's body temperature based on the thermistor reading and provide appropriate health advice.
@@ -36,57 +44,44 @@ thermistor: 39.0, message: I feel unwell.
 Your body temperature is 39.0°C, which indicates a high fever. Please rest, stay hydrated, and consider seeking medical advice if symptoms persist.
 '''
 
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="BOT",
     instructions=instructions_text,
     model="gpt-4-1106-preview",
 )
 
-thread = client.beta.threads.create()
 
 # Initialize speech recognizer
 recognizer = sr.Recognizer()
+# keep the microphone open, so each turn starts listening without re-calibrating
+mic = get_microphone(recognizer)
 
 # setup ADC for thermistor reading
 thermistor = ADC('A3')
 
-# Function for text-to-speech conversion
-def text_to_speech(text):
-    speech_file_path = Path(__file__).parent / "speech.mp3"
-    try:
-        with client.audio.speech.with_streaming_response.create(
-            model="tts-1", voice="alloy", input=text
-        ) as response:
-            response.stream_to_file(speech_file_path)
-        p=subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        p.wait()
-    except Exception as e:
-        print(f"Error in TTS: {e}")
+# Functions for text-to-speech conversion
+@traced("tts")
+def synthesize_speech(text):
+    # stream the sentence into the player, it starts playing while still downloading;
+    # every sentence is kept in the TTS cache, so cached replies replay without the network
+    return speak(client, text, wait=False, cache_max_chars=None)
+
+@traced("playback")
+def play_speech(clip):
+    clip.done.wait()
+
+# speak each sentence while the rest of the reply is still being generated
+speech = SpeechPipeline(synthesize_speech, play_speech)
+
+# the same question within the same 0.5 °C gets the same answer, without a run
+responses = ResponseCache("thermometer", buckets={"thermistor": 0.5})
 
 # Function for speech-to-text conversion
+@traced("stt")
 def speech_to_text(audio_file):
-    from io import BytesIO
-
-    wav_data = BytesIO(audio_file.get_wav_data())
-    wav_data.name = "record.wav"
-    transcription = client.audio.transcriptions.create(
-        model="whisper-1", file=wav_data, language=["zh", "en"]
-    )
-    return transcription.text
-
-# Function to redirect errors to null
-def redirect_error_to_null():
-    devnull = os.open(os.devnull, os.O_WRONLY)
-    old_stderr = os.dup(2)
-    sys.stderr.flush()
-    os.dup2(devnull, 2)
-    os.close(devnull)
-    return old_stderr
-
-# Function to cancel redirected errors
-def cancel_redirect_error(old_stderr):
-    os.dup2(old_stderr, 2)
-    os.close(old_stderr)
+    return stt.transcribe(audio_file, language=["zh", "en"])
 
 def temperature():
     while True:
@@ -104,12 +99,9 @@ try:
     while True:
         msg = ""
         # Listen for user input
+        ready()
         print(f'\033[1;30m{"Listening..."}\033[0m')
-        old_stderr = redirect_error_to_null()
-        with sr.Microphone(chunk_size=8192) as source:
-            cancel_redirect_error(old_stderr)
-            recognizer.adjust_for_ambient_noise(source)
-            audio = recognizer.listen(source)
+        audio = mic.listen()
         print(f'\033[1;30m{"Processing audio..."}\033[0m')
 
         # Convert speech to text
@@ -118,40 +110,18 @@ try:
             print("No valid input detected.")
             continue
 
-        text_send="thermistor:" +str(temperature()) +" , message: " + msg
-
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=text_send,
-        )
+        celsius = temperature()
+        text_send="thermistor:" +str(celsius) +" , message: " + msg
 
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-        )
+        print(f'{"user":>10} >>> {text_send}')
+        reply, run = responses.stream(conversation, text_send, on_sentence=speech.say, text=msg, thermistor=celsius)
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-            for message in messages.data:
-                if message.role == 'user':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = message.role 
-                            text = block.text.value
-                            print(f'{label:>10} >>> {text}')
-                    break # only last reply
-
-            for message in messages.data:
-                if message.role == 'assistant':
-                    for block in message.content:
-                        if block.type == 'text':
-                            label = assistant.name
-                            text = block.text.value
-                            print(f'{label:>10} >>> {text}')
-                            text_to_speech(text)
-                    break # only last reply
+            print(f'{conversation.name:>10} >>> {reply}')
+        speech.wait()
 
+except KeyboardInterrupt:
+    pass
 finally:
-    client.beta.assistants.delete(assistant.id)
+    print(responses.report())
+    print(stt.report())
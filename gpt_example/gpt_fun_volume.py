@@ -1,32 +1,39 @@
 #!/usr/bin/env python3
 
 from fusion_hat import ADC, Pin
-from time import sleep
-import openai
 from keys import OPENAI_API_KEY
-import sys
+from http_pool import openai_client
+from startup import defer, enable_speaker, ready
+from conversation import open_conversation
+from tracing import trace_client, traced
+from tts_stream import speak
+from audio_player import get_player
+from stt import make_stt
+from mic_stream import get_microphone
+from reply_stream import SpeechPipeline
+from intents import volume_intents
+from runtime import Runtime
 import os
-import subprocess
-from pathlib import Path
 
 import speech_recognition as sr
 
-os.system("fusion_hat enable_speaker")
+enable_speaker()
+player = get_player()
 
 # gets API Key from environment variable OPENAI_API_KEY
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+# short commands are transcribed on the device when faster-whisper is installed, see stt.py
+stt = make_stt(client)
 
-TTS_OUTPUT_FILE = 'tts_output.mp3'
-
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="BOT",
     instructions="You are a chat bot, you answer people question to help them.",
     model="gpt-4-1106-preview",
 )
 
-thread = client.beta.threads.create()
 recognizer = sr.Recognizer()
-os.system("fusion_hat enable_speaker")
 
 # speech_recognition init
 # =================================================================
@@ -45,46 +52,24 @@ recognizer.non_speaking_duration = 0.5  # seconds of non-speaking audio to keep
 recognizer.dynamic_energy_adjustment_damping = 0.15
 recognizer.dynamic_energy_ratio = 1
 recognizer.operation_timeout = None  # seconds after an internal operation (e.g., an API request) starts before it times out, or ``None`` for no timeout
-recognizer.pause_threshold = 1
+# keep the microphone open, so each turn starts listening without re-calibrating
+mic = get_microphone(recognizer)
 
+@traced("stt")
 def speech_to_text(audio_file):
-    from io import BytesIO
-
-    wav_data = BytesIO(audio_file.get_wav_data())
-    wav_data.name = "record.wav"
-
-    transcription = client.audio.transcriptions.create(
-        model="whisper-1", 
-        file=wav_data,
-        language=['zh','en']
-    )
-    return transcription.text
-
-def redirect_error_2_null():
-    # https://github.com/spatialaudio/python-sounddevice/issues/11
-
-    devnull = os.open(os.devnull, os.O_WRONLY)
-    old_stderr = os.dup(2)
-    sys.stderr.flush()
-    os.dup2(devnull, 2)
-    os.close(devnull)
-    return old_stderr
-
-def cancel_redirect_error(old_stderr):
-    os.dup2(old_stderr, 2)
-    os.close(old_stderr)
-
-def text_to_speech(text):
-    speech_file_path = Path(__file__).parent / "speech.mp3"
-    # print(speech_file_path)
-    with client.audio.speech.with_streaming_response.create(
-        model="tts-1",
-        voice="alloy",
-        input=text
-    ) as response:
-        response.stream_to_file(speech_file_path)
-    p=subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    p.wait()
+    return stt.transcribe(audio_file, language=["zh", "en"])
+
+@traced("tts")
+def synthesize_speech(text):
+    # stream the sentence into the player, it starts playing while still downloading
+    return speak(client, text, wait=False)
+
+@traced("playback")
+def play_speech(clip):
+    clip.done.wait()
+
+# speak each sentence while the rest of the reply is still being generated
+speech = SpeechPipeline(synthesize_speech, play_speech)
 
 # Set up the potentiometer
 pot = ADC('A0')
@@ -117,74 +102,72 @@ def set_volume(percent):
         leds[i].high()
     os.system(f"amixer set Master {percent}%")
 
-def is_mplayer_running():
-    """check if mplayer is running"""
-    result = subprocess.run(["pgrep", "-x", "mplayer"], stdout=subprocess.PIPE)
-    return result.returncode == True  
+KNOB_MOVED = 5     # percent the knob has to turn to take over from a spoken volume
+KNOB_POLL = 0.5    # seconds between knob readings
+volume = MAP(pot.read(), 0, 4095, 0, 100)
+voice_knob = None  # knob position when the volume was last set by voice
 
-try:
+# the knob is read on the runtime, so listening never has to stop to check it
+runtime = Runtime()
+knob = runtime.sensor("knob", lambda: MAP(pot.read(), 0, 4095, 0, 100), interval=KNOB_POLL)
+
+
+async def follow_knob():
+    global volume, voice_knob
+    while True:
+        position = await knob.wait()
+        # a spoken volume holds until the knob is turned
+        if voice_knob is not None and abs(position - voice_knob) <= KNOB_MOVED:
+            continue
+        voice_knob = None
+        if round(position) != round(volume):
+            volume = position
+            await runtime.call(set_volume, volume)
+
+
+async def main():
+    global volume, voice_knob
+    runtime.spawn(follow_knob())
     while True:
-        # Check if mplayer is running, if not, start recording
-        if not is_mplayer_running():
-            msg = ""
-            print(f'\033[1;30m{"listening... "}\033[0m')
-            _stderr_back = redirect_error_2_null() 
-            with sr.Microphone(chunk_size=8192) as source:
-                cancel_redirect_error(_stderr_back)
-                recognizer.adjust_for_ambient_noise(source)
-                audio = recognizer.listen(source)
-            print(f'\033[1;30m{"stop listening... "}\033[0m')
-
-            # Convert recorded audio to text
-            msg = speech_to_text(audio)
-
-            if msg == False or msg == "":
-                print() # new line
-                continue
-
-            # Pass the transcribed text to the chatbot
-            message = client.beta.threads.messages.create(
-                thread_id=thread.id,
-                role="user",
-                content=msg,
-            )
-
-            # Generate and process the assistant's response
-            run = client.beta.threads.runs.create_and_poll(
-                thread_id=thread.id,
-                assistant_id=assistant.id,
-            )
-
-            # print("Run completed with status: " + run.status)
-            if run.status == "completed":
-                messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-                for message in messages.data:
-                    if message.role == 'user':
-                        for block in message.content:
-                            if block.type == 'text':
-                                label = message.role 
-                                value = block.text.value
-                                print(f'{label:>10} >>> {value}')
-                        break # only last reply
-
-                for message in messages.data:
-                    if message.role == 'assistant':
-                        for block in message.content:
-                            if block.type == 'text':
-                                label = assistant.name
-                                value = block.text.value
-                                print(f'{label:>10} >>> {value}')
-                                text_to_speech(value)
-                        break # only last reply
-
-        # Map the ADC value to a range suitable for setting LED brightness
-        volume = MAP(pot.read(), 0, 4095, 0, 100)
-        # print('current volume = %d ' %(result))
-        set_volume(volume)    
-        sleep(0.2)
+        ready()
+        print(f'\033[1;30m{"listening... "}\033[0m')
+        # keep listening while the reply plays, speaking over it stops the reply
+        audio = await runtime.listen(mic, barge_in=True, on_barge_in=speech.cancel)
+        print(f'\033[1;30m{"stop listening... "}\033[0m')
+
+        # Convert recorded audio to text
+        msg = await runtime.call(speech_to_text, audio)
+
+        if msg == False or msg == "":
+            print() # new line
+            continue
+
+        print(f'{"user":>10} >>> {msg}')
+
+        # "louder", "set volume to 40", ... are resolved locally, without a chatbot run
+        command = volume_intents.match(msg, volume=round(volume))
+        if command is not None:
+            volume = command["volume"]
+            voice_knob = knob.value
+            await runtime.call(set_volume, volume)
+            print(f'{"local":>10} >>> {command["message"]}')
+            speech.say(command["message"])
+            continue
+
+        # Pass the transcribed text to the chatbot and stream its response, speaking each sentence as soon as it is complete
+        reply, run = await runtime.ask(conversation, msg, on_sentence=speech.say)
+
+        # print("Run completed with status: " + run.status)
+        if run.status == "completed":
+            print(f'{conversation.name:>10} >>> {reply}')
 
+try:
+    set_volume(volume)
+    runtime.run(main)
+except KeyboardInterrupt:
+    pass
 finally:
-    client.beta.assistants.delete(assistant.id)
+    print(volume_intents.report())
+    print(stt.report())
     for led in leds:
-        led.low()
\ No newline at end of file
+        led.low()
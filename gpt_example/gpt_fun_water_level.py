@@ -1,82 +1,62 @@
-import openai
 from keys import OPENAI_API_KEY
+from http_pool import openai_client
+from startup import defer, enable_speaker, ready
+from conversation import open_conversation
+from tracing import trace_client, traced
+from tts_stream import speak
+from audio_player import get_player
+from stt import make_stt
+from mic_stream import get_microphone
+from reply_stream import SpeechPipeline
+from runtime import Runtime
 import readline  # Optimize keyboard input
-import sys
-import os
-import subprocess
-from pathlib import Path
 import speech_recognition as sr
 from fusion_hat import Ultrasonic,Pin
-import time
-import threading
 
-os.system("fusion_hat enable_speaker")
+enable_speaker()
+player = get_player()
 
 # Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+# short commands are transcribed on the device when faster-whisper is installed, see stt.py
+stt = make_stt(client)
 
 # Initialize speech recognizer
 recognizer = sr.Recognizer()
+# keep the microphone open, so each turn starts listening without re-calibrating
+mic = get_microphone(recognizer)
 
 # Initialize the DistanceSensor using GPIO Zero library
 # Trigger pin is connected to GPIO 27, Echo pin to GPIO 22
 sensor = Ultrasonic(trig=Pin(27), echo=Pin(22))
-distance = 0
 
-# Function to fetch sensor data
-def fetch_sensor_data():
-    global distance
-    while True:
-        dis = sensor.read()  # Measure distance in centimeters
-        if dis > 0:
-            distance = dis
-        time.sleep(1)
-
-# Start a background thread for sensor data
-sensor_thread = threading.Thread(target=fetch_sensor_data)
-sensor_thread.daemon = True
-sensor_thread.start()
-
-# Function for text-to-speech conversion
-def text_to_speech(text):
-    speech_file_path = Path(__file__).parent / "speech.mp3"
-    try:
-        with client.audio.speech.with_streaming_response.create(
-            model="tts-1", voice="alloy", input=text
-        ) as response:
-            response.stream_to_file(speech_file_path)
-        p=subprocess.Popen("mplayer speech.mp3", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        p.wait()
-    except Exception as e:
-        print(f"Error in TTS: {e}")
+# the distance in centimeters is sampled every second while the runtime runs,
+# also while listening and speaking
+runtime = Runtime()
+distance = runtime.sensor("distance", sensor.read, interval=1, valid=lambda dis: dis > 0)
+
+# Functions for text-to-speech conversion
+@traced("tts")
+def synthesize_speech(text):
+    # stream the sentence into the player, it starts playing while still downloading
+    return speak(client, text, wait=False)
+
+@traced("playback")
+def play_speech(clip):
+    clip.done.wait()
+
+# speak each sentence while the rest of the reply is still being generated
+speech = SpeechPipeline(synthesize_speech, play_speech)
 
 # Function for speech-to-text conversion
+@traced("stt")
 def speech_to_text(audio_file):
-    from io import BytesIO
-
-    wav_data = BytesIO(audio_file.get_wav_data())
-    wav_data.name = "record.wav"
-    transcription = client.audio.transcriptions.create(
-        model="whisper-1", file=wav_data, language=["zh", "en"]
-    )
-    return transcription.text
-
-# Function to redirect errors to null
-def redirect_error_to_null():
-    devnull = os.open(os.devnull, os.O_WRONLY)
-    old_stderr = os.dup(2)
-    sys.stderr.flush()
-    os.dup2(devnull, 2)
-    os.close(devnull)
-    return old_stderr
-
-# Function to cancel redirected errors
-def cancel_redirect_error(old_stderr):
-    os.dup2(old_stderr, 2)
-    os.close(old_stderr)
+    return stt.transcribe(audio_file, language=["zh", "en"])
 
 # Create OpenAI assistant
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="Water Level Assistant",
     instructions=(
         "You are an assistant designed to help users monitor water levels using ultrasonic sensor data. The 'distance' refers to the measurement from the sensor to the surface of the water, which you will use to determine the current water level status. When a user sends you this distance along with a message, analyze the data to provide feedback on whether the water level is normal, low, or high based on preset thresholds. Offer advice or actions to take if the water levels are outside normal ranges."
@@ -84,53 +64,36 @@ assistant = client.beta.assistants.create(
     model="gpt-4-1106-preview",
 )
 
-# Create a conversation thread
-thread = client.beta.threads.create()
-
-try:
+async def main():
     while True:
         # Listen for user input
+        ready()
         print(f'\033[1;30m{"Listening..."}\033[0m')
-        old_stderr = redirect_error_to_null()
-        with sr.Microphone(chunk_size=8192) as source:
-            cancel_redirect_error(old_stderr)
-            recognizer.adjust_for_ambient_noise(source)
-            audio = recognizer.listen(source)
+        audio = await runtime.listen(mic)
         print(f'\033[1;30m{"Processing audio..."}\033[0m')
 
         # Convert speech to text
-        user_message = speech_to_text(audio)
+        user_message = await runtime.call(speech_to_text, audio)
         if not user_message:
             print("No valid input detected.")
             continue
 
         # Prepare input for assistant
         assistant_input = {
-            "distance": distance,
+            "distance": distance.value or 0,
             "message": user_message,
         }
 
-        # Send message to assistant
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id, role="user", content=str(assistant_input)
-        )
-
-        # Get assistant response
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id, assistant_id=assistant.id
-        )
+        # Send message to assistant and stream the response, speaking each sentence as soon as it is complete
+        response, run = await runtime.ask(conversation, str(assistant_input), on_sentence=speech.say)
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-            for message in messages.data:
-                if message.role == "assistant":
-                    for block in message.content:
-                        if block.type == "text":
-                            response = block.text.value
-                            print(f"Bot >>> {response}")
-                            text_to_speech(response)
-  
-                    break
+            print(f"Bot >>> {response}")
+        await runtime.call(speech.wait)
+
+try:
+    runtime.run(main)
+except KeyboardInterrupt:
+    pass
 finally:
-    client.beta.assistants.delete(assistant.id)
     print("Cleaned up resources.")
@@ -1,109 +1,101 @@
-import openai
 from keys import OPENAI_API_KEY, OPENWEATHER_API_KEY
-from pathlib import Path
-import sys,os,subprocess
+from http_pool import openai_client, pool, web_session
+from startup import defer, enable_speaker, lazy_import, ready
+from conversation import open_conversation
+from tracing import trace_client, traced
+from tts_stream import speak
+from audio_player import get_player
+from stt import make_stt
+from mic_stream import get_microphone
+from reply_stream import SpeechPipeline
+from sensor_context import ContextEncoder
 import speech_recognition as sr
 import time
 import json
-import requests
-# pip install requests
+
+# pip install requests; imported on the first weather lookup, like in http_pool.py
+requests = lazy_import("requests")
 
 from fusion_hat import LCD1602  # Import module for interfacing with lcd
 
-os.system("fusion_hat enable_speaker")
+enable_speaker()
+player = get_player()
 
 # Initialize LCD with I2C address 0x27 and enable backlight
 lcd=LCD1602(0x27, 1) 
 
 # LCD Initialization
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+# short commands are transcribed on the device when faster-whisper is installed, see stt.py
+stt = make_stt(client)
+# keep-alive connection to the weather service, opened while the microphone calibrates
+weather_session = web_session("https://api.openweathermap.org")
 
 # OpenAI Assistant Setup
-assistant = client.beta.assistants.create(
+conversation = defer(
+    open_conversation,
+    client,
     name="Weather Butler",
     instructions=(
         "You are a weather assistant. Based on the provided local weather data, "
         "offer appropriate clothing recommendations in natural language. "
+        "Temperatures are in Celsius and wind speed in m/s. "
         "Your responses will be converted to speech, so avoid symbols like braces."
     ),
     model="gpt-4-1106-preview",
 )
 
-thread = client.beta.threads.create()
 recognizer = sr.Recognizer()
+# keep the microphone open, so each turn starts listening without re-calibrating
+mic = get_microphone(recognizer)
 
+@traced("stt")
 def speech_to_text(audio_file):
     """
-    Convert speech audio to text using OpenAI Whisper model.
+    Convert speech audio to text using Whisper, on the device or over the API.
     """
-    from io import BytesIO
-
     try:
-        wav_data = BytesIO(audio_file.get_wav_data())
-        wav_data.name = "record.wav"
-        transcription = client.audio.transcriptions.create(
-            model="whisper-1", file=wav_data, language=["zh", "en"]
-        )
-        return transcription.text
+        return stt.transcribe(audio_file, language=["zh", "en"])
     except Exception as e:
         print(f"Error in speech-to-text: {e}")
         return ""
 
-def redirect_error_2_null():
-    devnull = os.open(os.devnull, os.O_WRONLY)
-    old_stderr = os.dup(2)
-    sys.stderr.flush()
-    os.dup2(devnull, 2)
-    os.close(devnull)
-    return old_stderr
-
-def cancel_redirect_error(old_stderr):
-    os.dup2(old_stderr, 2)
-    os.close(old_stderr)
-
-def sox_volume(input_file, output_file):
-    """
-    Adjust the volume of an audio file using the sox library.
-    """
-    import sox
-
-    VOLUME_DB=3  # The volume adjustment in decibels (increase by 3 dB)
-    try:
-        transform = sox.Transformer()
-        transform.vol(VOLUME_DB)
-        transform.build(input_file, output_file)
-        return True 
-    except Exception as e:
-        print(f"sox_volume err: {e}")
-        return False
+VOLUME_DB = 3  # The volume adjustment in decibels (increase by 3 dB)
 
-def text_to_speech(text):
+@traced("tts")
+def synthesize_speech(text):
     """
-    Convert text to speech using OpenAI TTS model.
+    Convert text to speech using OpenAI TTS model, raising its volume in memory.
     """
-    speech_file_path = Path(__file__).parent / "speech.wav"
-    speech_file_path_db = Path(__file__).parent / "speech_db.wav"
-    try:
-        with client.audio.speech.with_streaming_response.create(
-            model="tts-1", voice="alloy", input=text, response_format="wav"
-        ) as response:
-            response.stream_to_file(speech_file_path)
-        sox_volume(speech_file_path,speech_file_path_db)
-        subprocess.Popen(
-            ["mplayer", str(speech_file_path_db)], shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-        ).wait()
-        os.remove(str(speech_file_path))
-        os.remove(str(speech_file_path_db))
-    except Exception as e:
-        print(f"Error in text-to-speech: {e}")
+    # stream the sentence into the player, it starts playing while still downloading
+    return speak(client, text, gain_db=VOLUME_DB, wait=False)
+
+@traced("playback")
+def play_speech(clip):
+    clip.done.wait()
+
+# speak each sentence while the rest of the reply is still being generated
+speech = SpeechPipeline(synthesize_speech, play_speech)
+
+# the parts of the OpenWeather reply the assistant uses, sent as compact JSON
+weather_context = ContextEncoder({
+    "city": "name",
+    "sky": "weather.0.description",
+    "temp": "main.temp",
+    "feels_like": "main.feels_like",
+    "humidity": "main.humidity",
+    "wind": "wind.speed",
+    "rain_1h": "rain.1h",
+    "snow_1h": "snow.1h",
+})
 
 def get_weather(api_key, city):
     """
     Fetch current weather data for a given city.
     """
     try:
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
-        response = requests.get(url)
+        url = f"https://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
+        response = weather_session.get(url, timeout=10)
         response.raise_for_status() 
         return response.json()
     
@@ -130,12 +122,10 @@ def lcd_print(weather_data):
 
 try:
     while True:
+        ready()
         print(f'\033[1;30m{"listing... "}\033[0m')
-        _stderr_back = redirect_error_2_null() # ignore error print to ignore ALSA errors
-        with sr.Microphone(chunk_size=8192) as source:
-            cancel_redirect_error(_stderr_back) # restore error print
-            recognizer.adjust_for_ambient_noise(source)
-            audio = recognizer.listen(source)
+        # keep listening while the reply plays, speaking over it stops the reply
+        audio = mic.listen(barge_in=True, on_barge_in=speech.cancel)
         print(f'\033[1;30m{"stop listening... "}\033[0m')
 
         msg = ""
@@ -147,35 +137,15 @@ try:
         weather_data=get_weather(OPENWEATHER_API_KEY, 'shenzhen')
         lcd_print(weather_data)
         
-        message_content = {
-            "weather": weather_data,
-            "message": msg,
-        }
-
-        # Send the user's message and weather data to the assistant
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=str(message_content),
-        )
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-        )
+        # Send the user's message and weather data, and stream the reply,
+        # speaking each sentence as soon as it is complete
+        response, run = conversation.stream(weather_context.encode(weather_data, message=msg), on_sentence=speech.say)
 
         if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-            for message in messages.data:
-                if message.role == 'assistant':
-                    for block in message.content:
-                        if block.type == 'text':
-                            response = block.text.value
-                            print(f'{assistant.name:>10} >>> {response}')
-                            text_to_speech(response)
-                    break # only last reply
+            print(f'{conversation.name:>10} >>> {response}')
 
 finally:
-    client.beta.assistants.delete(assistant.id)
+    print(weather_context.report())
+    print(pool.report())
+    print(stt.report())
     print("Resources cleaned up.")
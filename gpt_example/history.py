@@ -0,0 +1,163 @@
+"""
+Token-budgeted conversation history with a rolling summary.
+
+Every turn of a long-running loop adds to the prompt of the next one, so
+prompt tokens, cost and latency keep climbing with uptime. History keeps the
+last ``keep_turns`` turns verbatim, within a token ``budget``, and folds the
+older turns into a short summary. The summary is refreshed by a background
+thread, so a turn never waits for it; until a refresh finishes, turns that
+just left the window are simply not sent.
+
+The prompt of a turn is then bounded by:
+    instructions + budget + the new message
+
+Token counts use tiktoken when it is installed and a 4 characters per token
+estimate otherwise.
+
+Configured with environment variables:
+    HISTORY_TOKENS=1500   tokens for the summary and verbatim turns, 0 for no limit
+    HISTORY_TURNS=6       turns kept verbatim
+    SUMMARY_MODEL=...     model that writes the summary, the conversation's by default
+
+Usage:
+    history = History(client, model="gpt-4o-mini")
+    messages = [system_message, *history.messages(), {"role": "user", "content": text}]
+    ...
+    history.add(text, reply)
+"""
+import functools
+import os
+import threading
+
+from tracing import span
+
+HISTORY_BUDGET = int(os.environ.get("HISTORY_TOKENS", 1500))
+HISTORY_TURNS = int(os.environ.get("HISTORY_TURNS", 6))
+SUMMARY_MODEL = os.environ.get("SUMMARY_MODEL")
+SUMMARY_WORDS = 120
+MESSAGE_OVERHEAD = 4  # tokens the chat format adds per message
+
+SUMMARY_INSTRUCTIONS = (
+    "You keep the memory of a voice assistant. Update the summary of the earlier "
+    "conversation with the new turns. Keep names, facts, preferences, decisions, "
+    "open questions and device states; drop greetings and small talk. "
+    f"Answer with the summary only, at most {SUMMARY_WORDS} words."
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken  # pip install tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # not installed, or the encoding could not be downloaded
+        return None
+
+
+def count_tokens(text):
+    """ Number of tokens in ``text``, estimated when tiktoken is not available. """
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+class History:
+    """
+    :param client: The openai.OpenAI client, used for the summary.
+    :param model: Model that writes the summary, SUMMARY_MODEL if set.
+    :param budget: Tokens for the summary and the verbatim turns, None or 0 for no limit.
+    :param keep_turns: Number of latest turns kept verbatim.
+    """
+
+    def __init__(self, client, model, budget=HISTORY_BUDGET, keep_turns=HISTORY_TURNS):
+        self.client = client
+        self.model = SUMMARY_MODEL or model
+        self.budget = budget or None
+        self.keep_turns = keep_turns
+        self.turns = []       # (user, reply, tokens) of every turn
+        self.summary = ""
+        self.summarized = 0   # turns folded into the summary
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def add(self, user, reply):
+        """ Record a finished turn, and start a summary refresh if turns left the window. """
+        tokens = count_tokens(user) + count_tokens(reply) + 2 * MESSAGE_OVERHEAD
+        with self.lock:
+            self.turns.append((user, reply, tokens))
+            if self.budget and len(self.turns) - self.keep_turns > self.summarized:
+                self._refresh()
+
+    def recent(self):
+        """ The turns to send verbatim, newest last, as (user, reply) pairs. """
+        with self.lock:
+            turns = self.turns[-self.keep_turns:] if self.keep_turns else []
+            if not self.budget:
+                return [(user, reply) for user, reply, _ in self.turns]
+            left = self.budget - self._summary_tokens()
+            kept = []
+            for user, reply, tokens in reversed(turns):
+                left -= tokens
+                if left < 0:
+                    break
+                kept.append((user, reply))
+            return kept[::-1]
+
+    def messages(self):
+        """ The history as chat messages: the summary, then the verbatim turns. """
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": self.summary_instructions()})
+        for user, reply in self.recent():
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": reply})
+        return messages
+
+    def summary_instructions(self):
+        """ The summary as extra instructions, "" while there is none. """
+        return f"Summary of the earlier conversation: {self.summary}" if self.summary else ""
+
+    def wait(self, timeout=None):
+        """ Wait for a running summary refresh to finish. """
+        worker = self.worker
+        if worker:
+            worker.join(timeout)
+
+    def _summary_tokens(self):
+        return count_tokens(self.summary) + MESSAGE_OVERHEAD if self.summary else 0
+
+    def _refresh(self):
+        # called with the lock held; one refresh at a time, the next add() catches up
+        if self.worker and self.worker.is_alive():
+            return
+        end = len(self.turns) - self.keep_turns
+        turns = self.turns[self.summarized:end]
+        self.worker = threading.Thread(target=self._summarize, args=(self.summary, turns, end), daemon=True)
+        self.worker.start()
+
+    def _summarize(self, summary, turns, end):
+        lines = [f"Summary so far: {summary or '(none)'}", "", "New turns:"]
+        for user, reply, _ in turns:
+            lines.append(f"user: {user}")
+            lines.append(f"assistant: {reply}")
+        try:
+            with span("summary") as trace:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                        {"role": "user", "content": "\n".join(lines)},
+                    ],
+                    max_tokens=2 * SUMMARY_WORDS,
+                )
+                trace.usage = response.usage
+            text = (response.choices[0].message.content or "").strip()
+        except Exception as e:
+            print(f"Summary refresh failed, keeping the previous one: {e}")
+            return
+        with self.lock:
+            self.summary = text
+            self.summarized = end
@@ -0,0 +1,224 @@
+"""
+Shared, pre-warmed HTTP connections for the OpenAI client and web APIs.
+
+Each request of a voice turn (transcription, the reply, speech) goes to the
+same API host. The SDK's own pool drops idle connections after 5 seconds, so
+the first request after the user has been quiet for a moment paid a new TCP
+and TLS handshake, and requests.get() paid one on every weather lookup.
+
+Here all OpenAI clients of a script share one httpx pool that keeps idle
+connections for HTTP_KEEPALIVE seconds. The pool is warmed up in the
+background while the microphone calibrates, and kept warm with a HEAD
+request whenever it has been idle for half that long, for at most
+HTTP_KEEPWARM rounds after the last real request: a script nobody talks to
+stops pinging the API until it is used again. HTTP/2 is used when
+the h2 package is installed (pip install httpx[http2]); a single
+multiplexed connection then carries the overlapping requests of a turn.
+
+Environment:
+    HTTP_KEEPALIVE=90   seconds idle connections are kept, 0 to not keep warm
+    HTTP_KEEPWARM=3     keep-warm rounds after the last real request, 0 to not keep warm
+    HTTP2=auto          1 to require HTTP/2, 0 for HTTP/1.1 only
+
+Usage:
+    from http_pool import openai_client, web_session
+
+    client = trace_client(openai_client(OPENAI_API_KEY))   # starts warming the pool, see also resilience.py
+    session = web_session("https://api.openweathermap.org")
+    response = session.get(url, timeout=10)
+    print(pool.report())   # http pool: HTTP/2, 2 hosts warmed in 0.31 s, 3 keep-warm requests
+"""
+import importlib.util
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from resilience import resilient_client
+from startup import lazy_import
+from tracing import tracer
+
+# imported on first use, openai takes seconds to import on a Pi Zero
+httpx = lazy_import("httpx")
+openai = lazy_import("openai")
+
+KEEPALIVE = float(os.environ.get("HTTP_KEEPALIVE", 90))
+KEEPWARM_ROUNDS = int(os.environ.get("HTTP_KEEPWARM", 3))
+HTTP2_SETTING = os.environ.get("HTTP2", "auto")
+CONNECTIONS = 4  # HTTP/1.1 connections opened per host: a reply, speech and a transcription overlap
+
+
+def _origin(url):
+    parts = urlsplit(str(url))
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _http2():
+    """ Whether to use HTTP/2, which needs the optional h2 package. """
+    if HTTP2_SETTING == "0":
+        return False
+    if importlib.util.find_spec("h2") is None:
+        if HTTP2_SETTING == "1":
+            print("HTTP/2 needs the h2 package (pip install httpx[http2]), using HTTP/1.1")
+        return False
+    return True
+
+
+class Pool:
+    """
+    The shared transport: one httpx client for OpenAI, requests sessions for
+    the other web APIs, and the thread that keeps their connections warm.
+
+    :param keepalive: Seconds idle connections are kept.
+    :param http2: Use HTTP/2 for the httpx client.
+    :param keepwarm_rounds: Keep-warm rounds per host after its last real request.
+    """
+
+    def __init__(self, keepalive=KEEPALIVE, http2=None, keepwarm_rounds=KEEPWARM_ROUNDS):
+        self.keepalive = keepalive
+        self.keepwarm_rounds = keepwarm_rounds
+        self.http2 = _http2() if http2 is None else http2
+        self.lock = threading.Lock()
+        self.client = None
+        self.sessions = {}     # base url: requests.Session
+        self.hosts = set()     # base urls to keep warm
+        self.last_used = {}    # scheme://host: time.monotonic() of the latest request, pings excluded
+        self.idle_rounds = {}  # scheme://host: keep-warm rounds since that request
+        self.local = threading.local()  # ``pinging`` is set in the threads of the pings
+        self.warmed = 0
+        self.warm_seconds = 0.0
+        self.pings = 0
+        self.thread = None
+
+    def http_client(self):
+        """ The shared httpx client, created on first use. """
+        with self.lock:
+            if self.client is None:
+                self.client = openai.DefaultHttpxClient(
+                    http2=self.http2,
+                    limits=httpx.Limits(
+                        max_connections=100, max_keepalive_connections=20, keepalive_expiry=self.keepalive
+                    ),
+                    event_hooks={"request": [self._used]},
+                )
+            return self.client
+
+    def session(self, base_url):
+        """ A requests.Session with keep-alive for ``base_url``, shared per host. """
+        import requests  # only the scripts calling other web APIs need it, also with FAST_STARTUP=0
+
+        with self.lock:
+            session = self.sessions.get(base_url)
+            if session is None:
+                session = self.sessions[base_url] = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=CONNECTIONS)
+                session.mount(base_url, adapter)
+                session.hooks["response"].append(lambda response, *args, **kwargs: self._touch(response.url))
+            return session
+
+    def _used(self, request):
+        self._touch(request.url)
+
+    def _touch(self, url):
+        if getattr(self.local, "pinging", False):
+            return  # a ping is not traffic, it must not keep the keep-warm going
+        origin = _origin(url)
+        self.last_used[origin] = time.monotonic()
+        self.idle_rounds[origin] = 0
+
+    def warm(self, base_url):
+        """
+        Open connections to ``base_url`` in the background and keep them open.
+        Returns at once; warming failures are printed, the requests then connect as usual.
+        """
+        with self.lock:
+            self.hosts.add(base_url)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._keep_warm, daemon=True)
+                self.thread.start()
+        threading.Thread(target=self._open, args=(base_url,), daemon=True).start()
+
+    def _open(self, base_url):
+        start = time.monotonic()
+        self._ping_all(base_url)
+        seconds = time.monotonic() - start
+        tracer.record("prewarm", seconds)
+        with self.lock:
+            self.warmed += 1
+            self.warm_seconds = max(self.warm_seconds, seconds)
+
+    def _ping_all(self, base_url):
+        """ Ping with as many requests at once as connections should stay open. """
+        # one connection carries everything with HTTP/2, HTTP/1.1 needs one per overlapping request
+        count = 1 if (self.http2 and base_url not in self.sessions) else CONNECTIONS
+        threads = [threading.Thread(target=self._ping, args=(base_url,), daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _ping(self, base_url):
+        """ A HEAD request: the status does not matter, only the open connection. """
+        self.local.pinging = True
+        try:
+            if base_url in self.sessions:
+                self.sessions[base_url].head(base_url, timeout=10)
+            else:
+                self.http_client().head(base_url, timeout=10)
+        except Exception as e:
+            print(f"Error warming {base_url}: {e}")
+
+    def _keep_warm(self):
+        interval = self.keepalive / 2
+        while interval > 0 and self.keepwarm_rounds > 0:
+            time.sleep(interval)
+            for base_url in list(self.hosts):
+                if self._needs_ping(base_url, interval):
+                    self._ping_all(base_url)
+                    self.pings += 1
+
+    def _needs_ping(self, base_url, interval):
+        """ Idle for ``interval``, and used since the last keepwarm_rounds pings. """
+        origin = _origin(base_url)
+        if time.monotonic() - self.last_used.get(origin, 0) < interval:
+            return False
+        rounds = self.idle_rounds.get(origin, 0)
+        if rounds >= self.keepwarm_rounds:
+            return False
+        self.idle_rounds[origin] = rounds + 1
+        return True
+
+    def report(self):
+        """ A one-line summary of the warming. """
+        protocol = "HTTP/2" if self.http2 else "HTTP/1.1"
+        return (
+            f"http pool: {protocol}, {self.warmed} hosts warmed in {self.warm_seconds:.2f} s, "
+            f"{self.pings} keep-warm requests"
+        )
+
+
+pool = Pool()
+
+
+def openai_client(api_key, prewarm=True, resilient=True, **kwargs):
+    """
+    An openai.OpenAI client on the shared pool.
+
+    :param prewarm: Start opening connections to the API now.
+    :param resilient: Adaptive timeouts, hedging and retries, see resilience.py.
+    :param kwargs: Passed to openai.OpenAI, e.g. base_url.
+    """
+    client = openai.OpenAI(api_key=api_key, http_client=pool.http_client(), **kwargs)
+    if resilient:
+        client = resilient_client(client)
+    if prewarm:
+        pool.warm(str(client.base_url).rstrip("/"))
+    return client
+
+
+def web_session(base_url, prewarm=True):
+    """ A pooled requests.Session for another web API, e.g. the weather service. """
+    session = pool.session(base_url)
+    if prewarm:
+        pool.warm(base_url)
+    return session
@@ -0,0 +1,353 @@
+"""
+Local fast path for simple device commands.
+
+"Stop the fan" or "set the volume to 40" do not need speech-to-text plus an
+assistant run plus eval() of the reply. An IntentMatcher resolves such
+commands with regular expressions in microseconds and returns the same
+dict the assistant would have replied with, so the script acts on it
+straight away. Only utterances that are entirely one known command are
+resolved locally; anything else, or an utterance that matches rules with
+different results, goes to the assistant as before.
+
+Hits, misses and ambiguous utterances are counted and, like the other
+stages, the matching time is traced (stage "intent").
+
+Matchers for the fan, lamp and volume scripts are defined here:
+    fan_intents.match(text, speed=30)    -> {"speed": 40, "message": "Speed set to 40%."}
+    lamp_intents.match(text)             -> {"color": [1, 0, 0], "message": "..."}
+    volume_intents.match(text, volume=50) -> {"volume": 60, "message": "..."}
+
+Usage:
+    reply = fan_intents.match(msg, speed=speed)
+    if reply is None:
+        ...  # ask the assistant
+    print(fan_intents.report())   # fan intents: 12 local, 3 to the assistant (80% local)
+
+    python3 intents.py fan "turn it up a bit"
+"""
+import collections
+import re
+import sys
+import time
+
+from tracing import tracer
+
+STEP = 10  # percent, for "faster", "louder", ...
+
+FILLERS = re.compile(
+    r"\b(?:please|kindly|hey|ok|okay|just|now|the|a|an|bit|little|"
+    r"can you|could you|would you|will you|i want you to|i'd like you to)\b"
+)
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+    "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18,
+    "nineteen": 19, "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60,
+    "seventy": 70, "eighty": 80, "ninety": 90, "hundred": 100,
+}
+
+# pattern pieces, for normalized text
+N = r"(?P<n>\d{1,3})(?: ?(?:percent|%))?"
+BY = r"(?: by " + N + r")?"
+
+
+def words_to_numbers(text):
+    """ Replace number words with digits: "forty five percent" -> "45 percent". """
+    out = []
+    number = None
+    for word in text.split():
+        value = NUMBER_WORDS.get(word)
+        if value is None:
+            if number is not None:
+                out.append(str(number))
+                number = None
+            out.append(word)
+        elif value == 100:
+            number = 100 * (number or 1)
+        elif number is not None and number % 100 == 0 and number < 1000 and value < 100:
+            number += value  # "one hundred" + "ten"
+        elif number is not None and number % 10 == 0 and number % 100 and value < 10:
+            number += value  # "forty" + "five"
+        else:
+            if number is not None:
+                out.append(str(number))
+            number = value
+    if number is not None:
+        out.append(str(number))
+    return " ".join(out)
+
+
+def normalize(text):
+    """ Lower case, without punctuation, polite fillers or number words. """
+    text = text.lower().replace("%", " percent")
+    text = re.sub(r"[^\w\s']", " ", text)
+    text = FILLERS.sub(" ", text)
+    return words_to_numbers(" ".join(text.split()))
+
+
+def clamp(value, low=0, high=100):
+    return max(low, min(high, value))
+
+
+def _step(match):
+    """ The "by N" amount of a match, STEP without one. """
+    n = match.groupdict().get("n")
+    return int(n) if n else STEP
+
+
+class IntentMatcher:
+    """
+    A set of command rules for one device.
+
+    :param name: Shown in the report and the trace.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.rules = []   # (intent, compiled pattern, handler)
+        self.hits = collections.Counter()
+        self.misses = 0
+        self.ambiguous = 0
+
+    def intent(self, name, *patterns):
+        """
+        Decorator that registers ``handler(match, **state)`` for utterances that
+        entirely match one of ``patterns`` after normalize(). The handler returns
+        the reply dict, or None to decline.
+        """
+        def decorator(handler):
+            for pattern in patterns:
+                self.rules.append((name, re.compile(pattern), handler))
+            return handler
+        return decorator
+
+    def match(self, text, **state):
+        """
+        Resolve ``text`` locally.
+
+        :param state: Current device state the rules need, e.g. speed=30.
+        :return: The reply dict, or None when the assistant should handle the utterance.
+        """
+        start = time.monotonic()
+        words = normalize(text)
+        found = {}
+        for name, pattern, handler in self.rules:
+            match = pattern.fullmatch(words)
+            if match:
+                reply = handler(match, **state)
+                if reply is not None:
+                    found.setdefault(name, reply)
+        replies = list(found.values())
+        tracer.record("intent", time.monotonic() - start)
+        if not replies:
+            self.misses += 1
+            return None
+        if any(reply != replies[0] for reply in replies[1:]):
+            self.ambiguous += 1
+            return None
+        self.hits[next(iter(found))] += 1
+        return replies[0]
+
+    def report(self):
+        """ A one-line summary of the hit and miss counts. """
+        hits = sum(self.hits.values())
+        total = hits + self.misses + self.ambiguous
+        if not total:
+            return f"{self.name} intents: no commands yet"
+        return (
+            f"{self.name} intents: {hits} local, {self.misses + self.ambiguous} to the assistant "
+            f"({self.ambiguous} ambiguous), {hits / total:.0%} local"
+        )
+
+
+# Fan ------------------------------------------------------------------------
+
+fan_intents = IntentMatcher("fan")
+FAN = r"(?: (?:fan|motor|it))?"
+
+
+def _speed(value, message=None):
+    value = clamp(value)
+    return {"speed": value, "message": message or (f"Speed set to {value}%." if value else "Fan stopped.")}
+
+
+@fan_intents.intent(
+    "stop",
+    r"(?:stop|turn off|switch off|shut off|power off)" + FAN,
+    r"(?:turn|switch|shut|power)" + FAN + r" off",
+    r"(?:fan|motor) off",
+)
+def _fan_stop(match, speed=0):
+    return _speed(0)
+
+
+@fan_intents.intent(
+    "start",
+    r"(?:start|turn on|switch on|power on)" + FAN,
+    r"(?:turn|switch|power)" + FAN + r" on",
+    r"(?:fan|motor) on",
+)
+def _fan_start(match, speed=0):
+    return _speed(speed or 50)
+
+
+@fan_intents.intent(
+    "faster",
+    r"(?:increase|raise)" + FAN + r"(?: speed)?" + BY,
+    r"(?:speed up|turn up|crank up)" + FAN + BY,
+    r"(?:turn|crank)" + FAN + r" up" + BY,
+    r"(?:fan |motor )?(?:faster|speed up)" + BY,
+)
+def _fan_faster(match, speed=0):
+    return _speed(speed + _step(match))
+
+
+@fan_intents.intent(
+    "slower",
+    r"(?:decrease|lower|reduce)" + FAN + r"(?: speed)?" + BY,
+    r"(?:slow down|turn down)" + FAN + BY,
+    r"(?:turn|slow)" + FAN + r" down" + BY,
+    r"(?:fan |motor )?(?:slower|slow down)" + BY,
+)
+def _fan_slower(match, speed=0):
+    return _speed(speed - _step(match))
+
+
+@fan_intents.intent(
+    "set",
+    r"(?:set|change|put|adjust)" + FAN + r"(?: speed)?(?: to)? " + N,
+    r"(?:fan |motor )?speed(?: to)? " + N,
+    N + r"(?: speed)?",
+)
+def _fan_set(match, speed=0):
+    value = int(match["n"])
+    return _speed(value) if value <= 100 else None
+
+
+@fan_intents.intent("max", r"(?:full|max|maximum|top) (?:speed|power)", r"full blast")
+def _fan_max(match, speed=0):
+    return _speed(100)
+
+
+# Lamp -----------------------------------------------------------------------
+
+lamp_intents = IntentMatcher("lamp")
+LIGHT = r"(?: (?:light|lights|lamp|led|it))?"
+
+# RGB components between 0 and 1, as gpt_fun_emotion_lamp.py expects
+COLORS = {
+    "red": [1, 0, 0],
+    "green": [0, 1, 0],
+    "blue": [0, 0, 1],
+    "white": [1, 1, 1],
+    "warm white": [1, 0.7, 0.4],
+    "cool white": [0.8, 0.9, 1],
+    "yellow": [1, 1, 0],
+    "orange": [1, 0.5, 0],
+    "purple": [0.5, 0, 1],
+    "violet": [0.6, 0.2, 1],
+    "pink": [1, 0.4, 0.7],
+    "cyan": [0, 1, 1],
+    "magenta": [1, 0, 1],
+    "turquoise": [0.1, 0.9, 0.8],
+}
+# longest names first, so "warm white" is not matched as "white"
+COLOR = r"(?P<color>" + "|".join(sorted(COLORS, key=len, reverse=True)) + r")"
+
+
+def _color(color, message):
+    return {"color": list(color), "message": message}
+
+
+@lamp_intents.intent(
+    "color",
+    r"(?:set|change|turn|switch|make)" + LIGHT + r"(?: color)?(?: to| into)? " + COLOR + r"(?: light| color)?",
+    r"(?:light|lights|lamp) " + COLOR,
+    COLOR + r"(?: light| lights| color)?",
+)
+def _lamp_color(match):
+    name = match["color"]
+    return _color(COLORS[name], f"Setting the light to {name}.")
+
+
+@lamp_intents.intent(
+    "off",
+    r"(?:turn off|switch off)" + LIGHT,
+    r"(?:turn|switch)" + LIGHT + r" off",
+    r"(?:light|lights|lamp) off",
+)
+def _lamp_off(match):
+    return _color([0, 0, 0], "Turning the light off.")
+
+
+@lamp_intents.intent(
+    "on",
+    r"(?:turn on|switch on)" + LIGHT,
+    r"(?:turn|switch)" + LIGHT + r" on",
+    r"(?:light|lights|lamp) on",
+)
+def _lamp_on(match):
+    return _color(COLORS["white"], "Turning the light on.")
+
+
+# Volume ---------------------------------------------------------------------
+
+volume_intents = IntentMatcher("volume")
+SOUND = r"(?: (?:volume|sound|it))?"
+
+
+def _volume(value):
+    value = clamp(value)
+    return {"volume": value, "message": f"Volume {value}%." if value else "Muted."}
+
+
+@volume_intents.intent(
+    "louder",
+    r"(?:increase|raise)" + SOUND + BY,
+    r"(?:turn|pump)" + SOUND + r" up" + BY,
+    r"(?:turn up|volume up|sound up)" + BY,
+    r"louder",
+)
+def _volume_up(match, volume=50):
+    return _volume(volume + _step(match))
+
+
+@volume_intents.intent(
+    "quieter",
+    r"(?:decrease|lower|reduce)" + SOUND + BY,
+    r"turn" + SOUND + r" down" + BY,
+    r"(?:turn down|volume down|sound down)" + BY,
+    r"(?:quieter|softer)",
+)
+def _volume_down(match, volume=50):
+    return _volume(volume - _step(match))
+
+
+@volume_intents.intent(
+    "set",
+    r"(?:set|change|put|adjust) volume(?: to)? " + N,
+    r"volume(?: to)? " + N,
+)
+def _volume_set(match, volume=50):
+    value = int(match["n"])
+    return _volume(value) if value <= 100 else None
+
+
+@volume_intents.intent("mute", r"mute(?: sound| volume| it)?", r"(?:volume|sound) off")
+def _volume_mute(match, volume=50):
+    return _volume(0)
+
+
+@volume_intents.intent("max", r"(?:max|maximum|full) volume", r"volume (?:max|maximum|full)")
+def _volume_max(match, volume=50):
+    return _volume(100)
+
+
+MATCHERS = {"fan": fan_intents, "lamp": lamp_intents, "volume": volume_intents}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in MATCHERS:
+        sys.exit(f"usage: python3 intents.py {{{','.join(MATCHERS)}}} utterance ...")
+    matcher = MATCHERS[sys.argv[1]]
+    for utterance in sys.argv[2:]:
+        print(f"{utterance!r}: {normalize(utterance)!r} -> {matcher.match(utterance)}")
@@ -0,0 +1,168 @@
+"""
+Incremental parser for JSON replies that arrive as streamed text deltas.
+
+The device scripts ask the assistant for a JSON object such as
+{"color": [...], "message": "..."} and used to wait for the whole reply
+before eval() of it. JSONStream is fed the deltas as they stream in and
+calls back as soon as a top-level field is complete, so the LED, motor or
+matrix changes while the "message" text is still being generated.
+
+Field values are parsed with json.loads, or ast.literal_eval for the
+Python literals the assistants sometimes write (0b00111100, 'single
+quotes', True). Neither runs code, so unlike eval() this is safe on
+untrusted text. Text before the opening brace, such as a ```json fence,
+is skipped.
+
+Usage:
+    parser = JSONStream({"color": set_color})
+    reply, run = conversation.stream(msg, on_delta=parser.feed)
+    value = parser.close()    # {"color": [...], "message": "..."}, None if the reply had no object
+
+    value = parse_reply(text)  # the same for a complete reply
+"""
+import ast
+import json
+
+MAX_VALUE_CHARS = 20000  # longer values are dropped, the replies are a few hundred characters
+
+
+class _Invalid:
+    pass
+
+
+INVALID = _Invalid()
+
+
+def parse_value(raw):
+    """ A JSON or Python literal value, INVALID if ``raw`` is neither. """
+    try:
+        return json.loads(raw)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(raw)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return INVALID
+
+
+class JSONStream:
+    """
+    :param callbacks: {field name: callback(value)}, called once the field's
+        value is complete.
+    """
+
+    def __init__(self, callbacks=None):
+        self.callbacks = callbacks or {}
+        self.fields = {}
+        self.state = "start"
+        self.key = ""
+        self.raw = ""
+        self.quote = None     # quote character of the string being read
+        self.escape = False
+        self.depth = 0        # brackets open inside the current value
+
+    def feed(self, delta):
+        for char in delta:
+            self._char(char)
+
+    def close(self):
+        """
+        End of the reply.
+
+        :return: The top-level fields, or None if the reply had no JSON object.
+        """
+        if self.state == "value" and self.raw and not self.quote and not self.depth:
+            self._complete()  # a number or literal cut off by the end of the reply
+        if self.state == "start":
+            return None
+        self.state = "done"
+        return self.fields
+
+    def _char(self, char):
+        state = self.state
+        if state == "start":
+            if char == "{":
+                self.state = "key"
+        elif state == "key":
+            if char in "\"'":
+                self.quote, self.key, self.state = char, "", "in_key"
+            elif char == "}":
+                self.state = "done"
+        elif state == "in_key":
+            if self.escape:
+                self.key += char
+                self.escape = False
+            elif char == "\\":
+                self.escape = True
+            elif char == self.quote:
+                self.quote = None
+                self.state = "colon"
+            else:
+                self.key += char
+        elif state == "colon":
+            if char == ":":
+                self.raw, self.depth, self.state = "", 0, "value"
+        elif state == "value":
+            self._value_char(char)
+        elif state == "after":
+            if char == ",":
+                self.state = "key"
+            elif char == "}":
+                self.state = "done"
+
+    def _value_char(self, char):
+        if self.quote:
+            self.raw += char
+            if self.escape:
+                self.escape = False
+            elif char == "\\":
+                self.escape = True
+            elif char == self.quote:
+                self.quote = None
+                if not self.depth:
+                    self._complete()
+        elif char in "\"'":
+            self.quote = char
+            self.raw += char
+        elif char in "[{":
+            self.depth += 1
+            self.raw += char
+        elif char in "]}" and self.depth:
+            self.depth -= 1
+            self.raw += char
+            if not self.depth:
+                self._complete()
+        elif self.depth:
+            self.raw += char
+        elif char in ",}":
+            # the end of a number or literal
+            self._complete()
+            self.state = "key" if char == "," else "done"
+        elif char.isspace():
+            if self.raw:
+                self._complete()
+        else:
+            self.raw += char
+        if len(self.raw) > MAX_VALUE_CHARS:
+            self.raw, self.quote, self.depth, self.state = "", None, 0, "after"
+
+    def _complete(self):
+        self.state = "after"
+        value = parse_value(self.raw.strip())
+        if value is INVALID:
+            return
+        self.fields[self.key] = value
+        callback = self.callbacks.get(self.key)
+        if callback:
+            try:
+                callback(value)
+            except Exception as e:
+                # a bad value must not break the stream, the rest of the reply is still wanted
+                print(f"Error handling {self.key!r}: {e}")
+
+
+def parse_reply(text):
+    """ Parse a complete reply, see JSONStream.close(). """
+    parser = JSONStream()
+    parser.feed(text)
+    return parser.close()
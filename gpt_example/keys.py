@@ -1,4 +1,4 @@
 OPENAI_API_KEY = "xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx"
-OPENAI_ASSISTANT_ID = "xxxxxxxxxxxxxxxxxxxxxx" # chat bot
+OPENAI_ASSISTANT_ID = "xxxxxxxxxxxxxxxxxxxxxx" # chat bot, optional: set to an existing "asst_..." ID to reuse it
 OPENWEATHER_API_KEY = "xxxxxxxxxxxxxxxxxxxxxxxxxx"
 
@@ -0,0 +1,149 @@
+"""
+On-device text-to-speech for short and latency-critical phrases.
+
+"Access denied!" or a motion alert waited on a tts-1 round trip before the
+user heard anything. speak() in tts_stream.py uses a local engine instead:
+
+    - for alerts (ALARM priority), and for phrases of at most
+      TTS_LOCAL_MAX_CHARS characters when the caller asks with
+      speak(local="short"); both unless they are already in the TTS cache.
+      The sentences of a chatbot reply are not, so a reply keeps one voice
+    - if the local engine fails, tts-1 speaks the phrase
+    - when tts-1 has not started to answer within its deadline, or fails,
+      the local engine takes over the clip; the deadline is the adaptive
+      one of the "speech" endpoint in resilience.py, or TTS_DEADLINE
+
+Two engines are supported, both as command line programs:
+
+    piper   natural sounding neural voices, needs a voice model
+            (https://github.com/rhasspy/piper, TTS_PIPER_MODEL=voice.onnx)
+    espeak  espeak-ng or espeak, robotic but starts in milliseconds
+            (sudo apt install espeak-ng)
+
+Without either of them speak() always uses tts-1, as before.
+
+Environment:
+    TTS_LOCAL=auto          "piper", "espeak", or 0 for no local engine
+    TTS_PIPER_MODEL=        path of a piper .onnx voice, its .onnx.json next to it
+    TTS_LOCAL_MAX_CHARS=16  longer phrases go to tts-1 with local="short"
+    TTS_DEADLINE=           seconds tts-1 has to start, the adaptive deadline by default
+
+Usage:
+    from local_tts import local_tts
+
+    engine = local_tts()          # None without a local engine
+    if engine is not None:
+        pcm, rate = engine.synthesize("Access denied!")
+"""
+import io
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from pathlib import Path
+
+from audio_player import ALARM
+from tracing import tracer
+
+LOCAL = os.environ.get("TTS_LOCAL", "auto")
+PIPER_MODEL = os.environ.get("TTS_PIPER_MODEL", "")
+LOCAL_MAX_CHARS = int(os.environ.get("TTS_LOCAL_MAX_CHARS", 16))
+DEADLINE = float(os.environ.get("TTS_DEADLINE", 0)) or None
+
+_engine = None
+_engine_lock = threading.Lock()
+_checked = False
+
+
+class Piper:
+    """
+    :param model: Path of the .onnx voice, its sample rate is read from the .onnx.json.
+    """
+
+    name = "piper"
+
+    def __init__(self, model, binary="piper"):
+        self.model = model
+        self.binary = binary
+        with open(f"{model}.json") as file:
+            self.rate = json.load(file)["audio"]["sample_rate"]
+
+    def synthesize(self, text):
+        """ 16-bit mono PCM of ``text`` and its sample rate. """
+        result = subprocess.run(
+            [self.binary, "--model", self.model, "--output_raw"],
+            input=text.encode(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+        )
+        return result.stdout, self.rate
+
+
+class ESpeak:
+    """
+    :param voice: espeak voice, e.g. "en-us" or "zh".
+    :param speed: Words per minute.
+    """
+
+    name = "espeak"
+
+    def __init__(self, binary, voice="en-us", speed=160):
+        self.binary = binary
+        self.voice = voice
+        self.speed = speed
+
+    def synthesize(self, text):
+        """ 16-bit mono PCM of ``text`` and its sample rate. """
+        result = subprocess.run(
+            [self.binary, "--stdout", "-v", self.voice, "-s", str(self.speed), text],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+        )
+        # espeak does not know the length when it writes the header, read the frames that are there
+        with wave.open(io.BytesIO(result.stdout)) as wav:
+            frames = wav.readframes(wav.getnframes())
+            return frames[:len(frames) - len(frames) % 2], wav.getframerate()
+
+
+def _find_engine(setting):
+    if setting in ("auto", "piper") and PIPER_MODEL and shutil.which("piper"):
+        if Path(f"{PIPER_MODEL}.json").exists():
+            return Piper(PIPER_MODEL)
+        print(f"TTS_PIPER_MODEL: {PIPER_MODEL}.json not found")
+    if setting in ("auto", "espeak"):
+        binary = shutil.which("espeak-ng") or shutil.which("espeak")
+        if binary:
+            return ESpeak(binary)
+    if setting not in ("auto", "0"):
+        print(f"TTS_LOCAL={setting}: engine not found, using tts-1 only")
+    return None
+
+
+def local_tts():
+    """ The local engine, looked up once per process; None if there is none. """
+    global _engine, _checked
+    with _engine_lock:
+        if not _checked:
+            _engine = _find_engine(LOCAL)
+            _checked = True
+        return _engine
+
+
+def prefer_local(text, priority, local=None):
+    """
+    The policy: alerts are synthesized locally, and short phrases if ``local`` is "short".
+
+    :param local: True for any text, see speak() in tts_stream.py.
+    """
+    if local is True:
+        return True
+    return priority <= ALARM or (local == "short" and len(text) <= LOCAL_MAX_CHARS)
+
+
+def synthesize(engine, text, reason):
+    """ Run ``engine`` on ``text``, traced as stage "tts_local" and counted by ``reason``. """
+    start = time.monotonic()
+    pcm, rate = engine.synthesize(text)
+    tracer.record("tts_local", time.monotonic() - start)
+    tracer.count("tts_local", reason=reason)
+    return pcm, rate
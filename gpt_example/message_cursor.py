@@ -0,0 +1,86 @@
+"""
+Incremental message fetch for assistant threads.
+
+Listing the whole thread after every run transfers and parses every message
+in it, so each turn gets slower as the conversation grows. A MessageCursor
+remembers the last message it has seen and only asks for newer ones.
+
+Usage:
+    cursor = MessageCursor(client, thread)     # or thread.id
+
+    message = client.beta.threads.messages.create(thread_id=thread.id, role="user", content=msg)
+    cursor.mark(message)
+    run = client.beta.threads.runs.create_and_poll(thread_id=thread.id, assistant_id=assistant.id)
+    for reply in cursor.replies():
+        print(reply)
+"""
+
+
+class MessageCursor:
+    """
+    :param client: The openai.OpenAI client.
+    :param thread: The thread to read from, or its id. A thread from
+        startup.defer() is only waited for when the cursor is first used.
+    :param page_size: Messages requested per call. A turn usually adds one user
+        and one assistant message, so a small page keeps each request constant-size.
+    """
+
+    def __init__(self, client, thread, page_size=4):
+        self.client = client
+        self.thread = thread
+        self.page_size = page_size
+        self.last_id = None
+
+    @property
+    def thread_id(self):
+        return self.thread if isinstance(self.thread, str) else self.thread.id
+
+    def mark(self, message):
+        """ Move the cursor past a message we already know, e.g. the one just sent. """
+        self.last_id = message.id
+
+    def fetch(self):
+        """ Return the messages added since the last call, oldest first. """
+        messages = []
+        if self.last_id is None:
+            # Nothing seen yet: only look at the newest page instead of the whole thread
+            page = self.client.beta.threads.messages.list(
+                thread_id=self.thread_id, order="desc", limit=self.page_size
+            )
+            messages = list(reversed(page.data))
+        else:
+            after = self.last_id
+            while True:
+                page = self.client.beta.threads.messages.list(
+                    thread_id=self.thread_id, order="asc", after=after, limit=self.page_size
+                )
+                messages.extend(page.data)
+                if not page.has_more or not page.data:
+                    break
+                after = page.data[-1].id
+        if messages:
+            self.last_id = messages[-1].id
+        return messages
+
+    def replies(self, assistant_id=None):
+        """
+        Return the text blocks of the new assistant messages, oldest first.
+
+        :param assistant_id: Only keep messages written by this assistant,
+            for threads shared by several assistants.
+        """
+        return reply_texts(self.fetch(), assistant_id)
+
+
+def reply_texts(messages, assistant_id=None):
+    """ The text blocks of the assistant messages among ``messages``, see MessageCursor.replies(). """
+    texts = []
+    for message in messages:
+        if message.role != "assistant":
+            continue
+        if assistant_id and message.assistant_id != assistant_id:
+            continue
+        for block in message.content:
+            if block.type == "text":
+                texts.append(block.text.value)
+    return texts
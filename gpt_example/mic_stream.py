@@ -0,0 +1,239 @@
+"""
+Persistent microphone capture.
+
+The voice scripts used to open a new sr.Microphone for every turn and call
+recognizer.adjust_for_ambient_noise() on it, which spends about a second
+recording "silence" before the user can speak. MicStream opens the
+microphone once and keeps reading it on a background thread into a ring
+buffer. While nobody is listening, the recognizer's energy threshold is
+updated from that audio with the same exponential smoothing that
+speech_recognition uses, so listening starts instantly with an up-to-date
+noise level. Updates pause while the shared audio player is speaking.
+
+By default the end of an utterance is found by the frame-level voice
+activity detector in vad.py, which stops after a short hangover instead of
+recognizer.pause_threshold seconds of silence. Set endpointing="listen" (or
+the MIC_ENDPOINTING environment variable) to fall back to recognizer.listen();
+MicStream is an sr.AudioSource, so recognizer.listen() works on it as usual.
+
+listen(barge_in=True) does not wait for the player to finish: the frames
+are gated against the echo of what the speaker plays (EchoGate in vad.py),
+and once the user starts speaking over a reply the reply is stopped and the
+utterance recorded as usual. Alarms keep playing. With endpointing="listen"
+or MIC_BARGE_IN=0 it waits for the player instead, half-duplex as before.
+
+Usage:
+    from mic_stream import get_microphone
+
+    recognizer = sr.Recognizer()
+    mic = get_microphone(recognizer)
+    audio = mic.listen()        # same result as recognizer.listen(source)
+    audio = mic.listen(barge_in=True, on_barge_in=speech.cancel)   # while the reply still plays
+"""
+import collections
+import os
+import threading
+
+import speech_recognition as sr
+
+from audio_player import SPEECH, cancel_redirect_error, echo_reference, get_player, is_busy, redirect_error_2_null
+from tracing import tracer
+from vad import HANGOVER, EchoGate, Endpointer, make_vad, rms
+
+CHUNK = 2048          # frames per read, about 43 ms at 48 kHz
+BUFFER_SECONDS = 10   # audio kept in the ring buffer
+PREROLL_SECONDS = 0.3 # audio from before listen() handed to the recognizer, so the first syllable is not cut
+CALIBRATE_SECONDS = 0.5
+ENDPOINTING = os.environ.get("MIC_ENDPOINTING", "vad")  # "vad" or "listen"
+BARGE_IN = os.environ.get("MIC_BARGE_IN", "1") != "0"
+
+
+class _RingReader:
+    """ The ``stream`` attribute recognizer.listen() reads from. """
+
+    def __init__(self, mic):
+        self.mic = mic
+
+    def read(self, size):
+        return self.mic.read_chunk()
+
+    def close(self):
+        pass
+
+
+class MicStream(sr.AudioSource):
+    """
+    :param recognizer: The sr.Recognizer whose energy_threshold is kept up to date.
+    :param device_index: PyAudio input device, None for the default one.
+    :param sample_rate: Capture rate, None for the device default.
+    :param chunk_size: Frames per read.
+    :param microphone: An sr.Microphone-like source to read from instead of
+        opening one, e.g. a fake microphone replaying recordings.
+    :param endpointing: "vad" to end utterances with the voice activity
+        detector, "listen" to use recognizer.listen().
+    :param hangover: Seconds of non-speech that end an utterance with "vad".
+    """
+
+    def __init__(self, recognizer, device_index=None, sample_rate=None, chunk_size=CHUNK,
+                 microphone=None, endpointing=ENDPOINTING, hangover=HANGOVER):
+        self.recognizer = recognizer
+        self.endpointing = endpointing
+        self.hangover = hangover
+        if microphone is None:
+            microphone = sr.Microphone(device_index=device_index, sample_rate=sample_rate, chunk_size=chunk_size)
+        self.microphone = microphone
+        self.SAMPLE_RATE = self.microphone.SAMPLE_RATE
+        self.SAMPLE_WIDTH = self.microphone.SAMPLE_WIDTH
+        self.CHUNK = self.microphone.CHUNK
+        self.seconds_per_buffer = self.CHUNK / self.SAMPLE_RATE
+        self.vad = make_vad(recognizer, self.SAMPLE_RATE) if endpointing == "vad" else None
+        # one gate for all turns, it keeps the echo path it has learned
+        self.echo_gate = EchoGate(self.vad, echo_reference) if self.vad is not None else None
+        self.barge_ins = 0
+
+        self.chunks = collections.deque(maxlen=max(1, int(BUFFER_SECONDS / self.seconds_per_buffer)))
+        self.condition = threading.Condition()
+        self.listening = False
+        self.calibrated = threading.Event()
+        self.running = True
+
+        old_stderr = redirect_error_2_null()  # PortAudio prints ALSA warnings when it opens the device
+        try:
+            self.microphone.__enter__()
+        finally:
+            cancel_redirect_error(old_stderr)
+        self.stream = _RingReader(self)
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        # the device stays open between turns, entering the source does nothing
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def read_chunk(self):
+        """ Return the next buffered chunk, waiting for the capture thread if needed. """
+        with self.condition:
+            while not self.chunks:
+                if not self.running:
+                    raise OSError("Microphone stream closed")
+                self.condition.wait()
+            return self.chunks.popleft()
+
+    def listen(self, timeout=None, phrase_time_limit=None, barge_in=False, on_barge_in=None, **kwargs):
+        """
+        Record one phrase, starting immediately.
+
+        :param timeout: Seconds to wait for speech to start before raising
+            sr.WaitTimeoutError, None to wait forever.
+        :param phrase_time_limit: Maximum phrase length in seconds.
+        :param barge_in: Listen while the player is speaking, speech over it
+            stops the speech. Otherwise the caller waits for the player first.
+        :param on_barge_in: function() called when the user speaks over the
+            player, before it is stopped, e.g. SpeechPipeline.cancel.
+        :param kwargs: Extra arguments for recognizer.listen().
+        :return: sr.AudioData
+        """
+        self.calibrated.wait()
+        if barge_in and (self.vad is None or not BARGE_IN):
+            # half-duplex: let the reply finish, its echo would end up in the recording
+            if is_busy():
+                get_player().wait()
+            barge_in = False
+        with self.condition:
+            # drop what was captured before this turn (e.g. our own speech), keep a short pre-roll
+            keep = int(PREROLL_SECONDS / self.seconds_per_buffer)
+            while len(self.chunks) > keep:
+                self.chunks.popleft()
+            self.listening = True
+        try:
+            if self.vad is not None:
+                return self._listen_vad(timeout, phrase_time_limit, barge_in, on_barge_in)
+            return self.recognizer.listen(self, timeout=timeout, phrase_time_limit=phrase_time_limit, **kwargs)
+        finally:
+            self.listening = False
+
+    def _listen_vad(self, timeout, phrase_time_limit, barge_in=False, on_barge_in=None):
+        vad = self.echo_gate if barge_in else self.vad
+        endpointer = Endpointer(vad, self.SAMPLE_RATE, self.hangover, phrase_time_limit)
+        waited = 0
+        while True:
+            utterance = endpointer.feed(self.read_chunk())
+            if barge_in and endpointer.triggered:
+                barge_in = False
+                if is_busy():
+                    self._barge_in(on_barge_in)
+            if utterance is not None:
+                return sr.AudioData(utterance, self.SAMPLE_RATE, self.SAMPLE_WIDTH)
+            if not endpointer.triggered:
+                waited += self.seconds_per_buffer
+                if timeout and waited > timeout:
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+
+    def _barge_in(self, on_barge_in):
+        """ The user started speaking over the player: stop the speech, not the alarms. """
+        self.barge_ins += 1
+        tracer.count("barge_ins")
+        if on_barge_in is not None:
+            try:
+                on_barge_in()
+            except Exception as e:
+                print(f"Error in barge-in handler: {e}")
+        get_player().stop(SPEECH)
+
+    def close(self):
+        self.running = False
+        self.thread.join(timeout=1)
+        with self.condition:
+            self.condition.notify_all()
+        self.microphone.__exit__(None, None, None)
+
+    def _update_threshold(self, energy, calibrating):
+        recognizer = self.recognizer
+        if calibrating:
+            # the first half second sets the level quickly, as adjust_for_ambient_noise() did
+            damping = recognizer.dynamic_energy_adjustment_damping ** (self.seconds_per_buffer * 10)
+        else:
+            damping = recognizer.dynamic_energy_adjustment_damping ** self.seconds_per_buffer
+        target = energy * recognizer.dynamic_energy_ratio
+        recognizer.energy_threshold = recognizer.energy_threshold * damping + target * (1 - damping)
+
+    def _capture_loop(self):
+        calibrate_chunks = max(1, int(CALIBRATE_SECONDS / self.seconds_per_buffer))
+        count = 0
+        while self.running:
+            try:
+                data = self.microphone.stream.read(self.CHUNK)
+            except Exception as e:
+                print(f"Error reading microphone: {e}")
+                break
+            # recognizer.listen() adapts the threshold itself while it runs,
+            # and our own speech from the speaker is not ambient noise
+            if not self.listening and not is_busy():
+                calibrating = count < calibrate_chunks
+                self._update_threshold(rms(data), calibrating)
+                count += 1
+                if count == calibrate_chunks:
+                    self.calibrated.set()
+            with self.condition:
+                self.chunks.append(data)
+                self.condition.notify()
+        self.running = False
+        self.calibrated.set()
+        with self.condition:
+            self.condition.notify_all()
+
+
+_microphone = None
+_microphone_lock = threading.Lock()
+
+
+def get_microphone(recognizer, **kwargs):
+    """ Return the process-wide MicStream, opening the microphone on first use. """
+    global _microphone
+    with _microphone_lock:
+        if _microphone is None:
+            _microphone = MicStream(recognizer, **kwargs)
+        return _microphone
@@ -0,0 +1,438 @@
+"""
+Local mock of the OpenAI HTTP API, for benchmarks that must not depend on
+the network or spend tokens.
+
+It runs on a background thread and answers the endpoints used by the example
+scripts with canned data:
+
+    POST /audio/transcriptions                  returns ``transcript``
+    POST /assistants, GET /assistants/{id}
+    POST /threads
+    POST /threads/{id}/messages, GET /threads/{id}/messages
+    POST /threads/{id}/runs                     polled or streamed (SSE) runs
+    GET  /threads/{id}/runs/{id}
+    POST /chat/completions                      streamed (SSE) or plain
+    POST /audio/speech                          chunked 24 kHz PCM
+
+Artificial latencies can be set per stage (seconds):
+
+    rtt            network round trip, added to every HTTP request
+    transcription  server time of a transcription
+    run            time until a run completes, or until the first streamed token
+    chat           time until the first token of a chat completion
+    token          time between streamed text deltas
+    speech         time to the first byte of synthesized audio
+    setup          time to create or retrieve an assistant, or create a thread
+
+An optional uplink speed makes request bodies "take" as long as they would on
+a slow connection, so upload size shows up in the measured latency.
+
+Usage:
+    from mock_openai import MockOpenAI
+
+    with MockOpenAI(uplink_kbps=256, latency={"rtt": 0.1, "run": 0.8}) as server:
+        client = openai.OpenAI(base_url=server.base_url, api_key="mock")
+        client.audio.transcriptions.create(model="whisper-1", file=upload)
+        print(server.requests)   # [(method, path, body bytes, seconds), ...]
+"""
+import itertools
+import json
+import math
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SPEECH_RATE = 24000          # the OpenAI "pcm" format: 24 kHz, 16-bit, mono
+SPEECH_SECONDS_PER_CHAR = 0.06
+SPEECH_CHUNK = 4800          # bytes per chunk, 100 ms of audio
+
+REPLY = "Sure. This is a mock reply from the local test server. It has a few sentences, so they can be spoken one by one."
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"  # keep-alive, as with the real API
+    disable_nagle_algorithm = True  # headers and body are separate writes, do not wait for delayed ACKs
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return body
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _send_json(self, payload, status=200, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _send_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _handle(self, method):
+        start = time.monotonic()
+        body = self._read_body() if method == "POST" else b""
+        server = self.server
+        server.sleep("rtt")
+        if server.uplink_kbps and body:
+            time.sleep(len(body) * 8 / (server.uplink_kbps * 1000))
+
+        url = urlparse(self.path)
+        path = re.sub(r"^/v1", "", url.path)
+        for pattern, name in ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match and name.startswith(method.lower()):
+                getattr(self, name)(body, parse_qs(url.query), *match.groups())
+                break
+        else:
+            self._send_json({"error": {"message": f"Unknown path {method} {path}"}}, status=404)
+        with server.lock:
+            server.requests.append((method, path, len(body), time.monotonic() - start))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_HEAD(self):
+        # what http_pool.py warms connections with; like the real API, 404 without closing the connection
+        self.server.sleep("rtt")
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    # Endpoints
+
+    def post_transcription(self, body, query):
+        self.server.sleep("transcription")
+        self._send_json({"text": self.server.transcript})
+
+    def post_assistant(self, body, query):
+        self.server.sleep("setup")
+        params = json.loads(body or b"{}")
+        self._send_json(self.server.assistant(params))
+
+    def get_assistant(self, body, query, assistant_id):
+        self.server.sleep("setup")
+        self._send_json(self.server.assistant({"id": assistant_id}))
+
+    def post_thread(self, body, query):
+        self.server.sleep("setup")
+        thread_id = self.server.new_id("thread")
+        with self.server.lock:
+            self.server.threads[thread_id] = []
+        self._send_json({"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}})
+
+    def post_message(self, body, query, thread_id):
+        params = json.loads(body or b"{}")
+        message = self.server.add_message(thread_id, params.get("role", "user"), str(params.get("content", "")))
+        self._send_json(message)
+
+    def get_messages(self, body, query, thread_id):
+        order = query.get("order", ["desc"])[0]
+        after = query.get("after", [None])[0]
+        limit = int(query.get("limit", [20])[0])
+        with self.server.lock:
+            messages = list(self.server.threads.get(thread_id, []))
+        if order == "desc":
+            messages.reverse()
+        if after:
+            ids = [m["id"] for m in messages]
+            messages = messages[ids.index(after) + 1:] if after in ids else []
+        page = messages[:limit]
+        self._send_json({
+            "object": "list",
+            "data": page,
+            "first_id": page[0]["id"] if page else None,
+            "last_id": page[-1]["id"] if page else None,
+            "has_more": len(messages) > limit,
+        })
+
+    def post_run(self, body, query, thread_id):
+        params = json.loads(body or b"{}")
+        run = self.server.new_run(thread_id, params.get("assistant_id", ""))
+        if params.get("stream"):
+            self._stream_run(run)
+            return
+        self._send_json(run, headers={"openai-poll-after-ms": str(self.server.poll_after_ms)})
+
+    def get_run(self, body, query, thread_id, run_id):
+        run = self.server.poll_run(run_id)
+        self._send_json(run, headers={"openai-poll-after-ms": str(self.server.poll_after_ms)})
+
+    def post_speech(self, body, query):
+        params = json.loads(body or b"{}")
+        self.server.sleep("speech")
+        self._start_chunked("audio/pcm")
+        for chunk in self.server.speech_chunks(params.get("input", "")):
+            self._send_chunk(chunk)
+        self._end_chunked()
+
+    def post_chat(self, body, query):
+        params = json.loads(body or b"{}")
+        server = self.server
+        if not isinstance(params.get("response_format", {}), dict):
+            # like the real API, which only takes {"type": ...} objects, "auto" is an Assistants value
+            self._send_json({"error": {
+                "message": "Invalid type for 'response_format': expected an object, but got a string instead.",
+                "type": "invalid_request_error",
+                "param": "response_format",
+            }}, status=400)
+            return
+        chunk = {
+            "id": server.new_id("chatcmpl"),
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": params.get("model", "gpt-mock"),
+        }
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in params.get("messages", []))
+        completion_tokens = len(server.reply.split())
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        server.sleep("chat")
+        if not params.get("stream"):
+            self._send_json(dict(chunk, object="chat.completion", usage=usage, choices=[{
+                "index": 0,
+                "message": {"role": "assistant", "content": server.reply},
+                "finish_reason": "stop",
+            }]))
+            return
+
+        def send(data):
+            self._send_chunk(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+
+        self._start_chunked("text/event-stream")
+        for index, token in enumerate(re.findall(r"\S+\s*", server.reply)):
+            if index:
+                server.sleep("token")
+            delta = {"content": token}
+            if not index:
+                delta["role"] = "assistant"
+            send(dict(chunk, choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+        send(dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if params.get("stream_options", {}).get("include_usage"):
+            send(dict(chunk, choices=[], usage=usage))
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._end_chunked()
+
+    def _stream_run(self, run):
+        server = self.server
+
+        def event(name, data):
+            self._send_chunk(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+
+        self._start_chunked("text/event-stream")
+        event("thread.run.created", dict(run, status="queued"))
+        event("thread.run.in_progress", dict(run, status="in_progress"))
+        server.sleep("run")
+        message = server.new_message(run["thread_id"], "assistant", "", run["assistant_id"], run["id"])
+        message_id = message["id"]
+        event("thread.message.created", dict(message, status="in_progress", content=[]))
+        for index, token in enumerate(re.findall(r"\S+\s*", server.reply)):
+            if index:
+                server.sleep("token")
+            event("thread.message.delta", {
+                "id": message_id,
+                "object": "thread.message.delta",
+                "delta": {"content": [{"index": 0, "type": "text", "text": {"value": token, "annotations": []}}]},
+            })
+        message = server.add_message(run["thread_id"], "assistant", server.reply, run["assistant_id"], run["id"], message_id)
+        event("thread.message.completed", message)
+        event("thread.run.completed", server.finish_run(run["id"]))
+        self._send_chunk(b"event: done\ndata: [DONE]\n\n")
+        self._end_chunked()
+
+
+ROUTES = [
+    (r"/audio/transcriptions", "post_transcription"),
+    (r"/audio/speech", "post_speech"),
+    (r"/chat/completions", "post_chat"),
+    (r"/assistants", "post_assistant"),
+    (r"/assistants/([^/]+)", "get_assistant"),
+    (r"/threads", "post_thread"),
+    (r"/threads/([^/]+)/messages", "post_message"),
+    (r"/threads/([^/]+)/messages", "get_messages"),
+    (r"/threads/([^/]+)/runs", "post_run"),
+    (r"/threads/([^/]+)/runs/([^/]+)", "get_run"),
+]
+
+
+class MockOpenAI(ThreadingHTTPServer):
+    """
+    :param port: Local port, 0 picks a free one.
+    :param uplink_kbps: Simulated client upload speed, 0 for unlimited.
+    :param latency: Extra seconds per stage, e.g. {"rtt": 0.1, "transcription": 0.3, "run": 1.0}.
+    :param transcript: Text returned by the transcription endpoint.
+    :param reply: Text of every assistant reply.
+    :param speech_speed: How many times faster than real time speech audio is sent.
+    :param poll_after_ms: Poll interval advertised to create_and_poll().
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port=0, uplink_kbps=0, latency=None, transcript="Hello.", reply=REPLY,
+                 speech_speed=4, poll_after_ms=100):
+        super().__init__(("127.0.0.1", port), MockOpenAIHandler)
+        self.uplink_kbps = uplink_kbps
+        self.latency = latency or {}
+        self.transcript = transcript
+        self.reply = reply
+        self.speech_speed = speech_speed
+        self.poll_after_ms = poll_after_ms
+        self.requests = []
+        self.threads = {}
+        self.runs = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle_error(self, request, client_address):
+        # clients going away mid-request, e.g. a benchmark child exiting, are not errors of the mock
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def sleep(self, stage):
+        delay = self.latency.get(stage, 0)
+        if delay:
+            time.sleep(delay)
+
+    def new_id(self, prefix):
+        return f"{prefix}_mock{next(self.ids)}"
+
+    def assistant(self, params):
+        return {
+            "id": params.get("id") or self.new_id("asst"),
+            "object": "assistant",
+            "created_at": int(time.time()),
+            "name": params.get("name", "Mock"),
+            "model": params.get("model", "gpt-mock"),
+            "instructions": params.get("instructions", ""),
+            "tools": params.get("tools", []),
+            "metadata": {},
+        }
+
+    def new_message(self, thread_id, role, text, assistant_id=None, run_id=None, message_id=None):
+        return {
+            "id": message_id or self.new_id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "status": "completed",
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+            "assistant_id": assistant_id,
+            "run_id": run_id,
+            "attachments": [],
+            "metadata": {},
+        }
+
+    def add_message(self, thread_id, role, text, assistant_id=None, run_id=None, message_id=None):
+        message = self.new_message(thread_id, role, text, assistant_id, run_id, message_id)
+        with self.lock:
+            self.threads.setdefault(thread_id, []).append(message)
+        return message
+
+    def new_run(self, thread_id, assistant_id):
+        run = {
+            "id": self.new_id("run"),
+            "object": "thread.run",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "assistant_id": assistant_id,
+            "status": "queued",
+            "model": "gpt-mock",
+            "instructions": "",
+            "tools": [],
+            "metadata": {},
+            "parallel_tool_calls": True,
+        }
+        with self.lock:
+            self.runs[run["id"]] = (run, time.monotonic())
+        return run
+
+    def poll_run(self, run_id):
+        with self.lock:
+            run, started = self.runs[run_id]
+        if run["status"] == "completed":
+            return run
+        if time.monotonic() - started < self.latency.get("run", 0):
+            return dict(run, status="in_progress")
+        self.add_message(run["thread_id"], "assistant", self.reply, run["assistant_id"], run_id)
+        return self.finish_run(run_id)
+
+    def finish_run(self, run_id):
+        prompt_tokens = 50
+        completion_tokens = len(self.reply.split())
+        with self.lock:
+            run, started = self.runs[run_id]
+            run = dict(run, status="completed", completed_at=int(time.time()), usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            })
+            self.runs[run_id] = (run, started)
+        return run
+
+    def speech_chunks(self, text):
+        """ Yield PCM chunks of a quiet tone as long as ``text`` would take to say, paced at speech_speed. """
+        frames = int(max(0.3, len(text) * SPEECH_SECONDS_PER_CHAR) * SPEECH_RATE)
+        samples = bytearray()
+        for i in range(frames):
+            value = int(1000 * math.sin(2 * math.pi * 220 * i / SPEECH_RATE))
+            samples += value.to_bytes(2, "little", signed=True)
+        chunk_seconds = SPEECH_CHUNK / 2 / SPEECH_RATE
+        for start in range(0, len(samples), SPEECH_CHUNK):
+            if start:
+                time.sleep(chunk_seconds / self.speech_speed)
+            yield bytes(samples[start:start + SPEECH_CHUNK])
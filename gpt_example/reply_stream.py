@@ -0,0 +1,160 @@
+"""
+Streaming assistant replies with sentence-level speech pipelining.
+
+Instead of waiting for runs.create_and_poll, listing the messages and then
+synthesizing the whole reply at once, the reply is streamed token by token,
+cut into sentences as they complete, and each sentence is synthesized and
+played while the following ones are still being generated.
+
+Usage:
+    speech = SpeechPipeline(synthesize_speech, play_speech)
+    reply, run = stream_reply(client, thread.id, assistant.id, on_sentence=speech.say)
+    speech.wait()    # or listen with barge-in, which calls speech.cancel(), see mic_stream.py
+"""
+import queue
+import re
+import threading
+
+from tracing import span
+
+# Sentence end: western punctuation followed by whitespace, CJK punctuation, or a line break
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+|(?<=[。！？；])|\n+')
+
+
+class SentenceSplitter:
+    """
+    Accumulate streamed text and cut it into sentences.
+
+    Sentences shorter than ``min_chars`` are merged with the next one, so that
+    short fragments like "Hi." do not each cost a TTS request.
+    """
+
+    def __init__(self, min_chars=20):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        """ Add a chunk of text, return the list of sentences completed by it. """
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            if match.end() == len(self.buffer) and not match.group():
+                continue  # CJK punctuation at the very end, wait for more text
+            sentence = self.buffer[start:match.start()].strip()
+            if len(sentence) < self.min_chars:
+                continue
+            sentences.append(sentence)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        """ Return whatever is left once the stream is finished. """
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
+
+
+class SpeechPipeline:
+    """
+    Two-stage speech pipeline: one thread synthesizes sentences, another
+    plays them in order. Sentence n+1 is synthesized while sentence n plays.
+
+    :param synthesize: function(text) -> audio, e.g. a TTS clip queued on the player.
+    :param play: function(audio) that blocks until the audio has been played.
+    """
+
+    def __init__(self, synthesize, play):
+        self.synthesize = synthesize
+        self.play = play
+        self.texts = queue.Queue()
+        self.clips = queue.Queue(maxsize=2)
+        self.generation = 0  # bumped by cancel(), older sentences are dropped
+        threading.Thread(target=self._synthesize_loop, daemon=True).start()
+        threading.Thread(target=self._play_loop, daemon=True).start()
+
+    def say(self, text):
+        """ Queue a sentence, return immediately. """
+        self.texts.put((self.generation, text))
+
+    def wait(self):
+        """ Block until everything queued so far has been played. """
+        self.texts.join()
+        self.clips.join()
+
+    def cancel(self):
+        """
+        Drop the sentences that have not been synthesized or played yet, e.g.
+        when the user barges in. Stopping the clips already queued on the
+        player is up to the caller.
+        """
+        self.generation += 1
+        for pending in (self.texts, self.clips):
+            while True:
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    break
+                pending.task_done()
+
+    def _synthesize_loop(self):
+        while True:
+            generation, text = self.texts.get()
+            try:
+                if generation == self.generation:
+                    clip = self.synthesize(text)
+                    # cancel() may have come while it was synthesized, the clip is stale then
+                    if generation == self.generation:
+                        self.clips.put(clip)
+            except Exception as e:
+                print(f"Error in TTS: {e}")
+            finally:
+                self.texts.task_done()
+
+    def _play_loop(self):
+        while True:
+            clip = self.clips.get()
+            try:
+                self.play(clip)
+            except Exception as e:
+                print(f"Error playing speech: {e}")
+            finally:
+                self.clips.task_done()
+
+
+def stream_reply(client, thread_id, assistant_id, on_sentence=None, on_delta=None, **kwargs):
+    """
+    Run the assistant on a thread with streaming enabled.
+
+    :param on_sentence: Called with each complete sentence as soon as it is available.
+    :param on_delta: Called with every raw text delta.
+    :param kwargs: Extra arguments for client.beta.threads.runs.stream.
+    :return: (reply text, final run)
+    """
+    splitter = SentenceSplitter()
+    parts = []
+    with span("run") as trace, client.beta.threads.runs.stream(
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+        **kwargs
+    ) as stream:
+        for event in stream:
+            if event.event != "thread.message.delta":
+                continue
+            for block in event.data.delta.content or []:
+                if block.type != "text" or not block.text or not block.text.value:
+                    continue
+                delta = block.text.value
+                parts.append(delta)
+                if on_delta:
+                    on_delta(delta)
+                if on_sentence:
+                    for sentence in splitter.feed(delta):
+                        on_sentence(sentence)
+        run = stream.get_final_run()
+        trace.usage = run.usage
+    if on_sentence:
+        for sentence in splitter.flush():
+            on_sentence(sentence)
+    return "".join(parts), run
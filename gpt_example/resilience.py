@@ -0,0 +1,313 @@
+"""
+Adaptive timeouts, hedged requests and retries for the OpenAI calls.
+
+No call of the voice loops had a timeout: the SDK waits up to 10 minutes,
+so one stuck request stalled the conversation. resilient_client() gives the
+calls of a client deadlines that follow their own latency:
+
+    - every endpoint keeps its recent latencies, its deadline is the p95
+      times RESILIENCE_K (the first few calls use a default deadline)
+    - idempotent calls, transcription and opening a speech stream, are
+      hedged: still running at the deadline, the same request is sent
+      again and whichever returns first is used, the other is closed
+    - each attempt times out after RESILIENCE_TIMEOUT deadlines
+    - timeouts, connection errors, 429 and 5xx are retried after a capped,
+      jittered exponential backoff, at most RESILIENCE_ATTEMPTS attempts
+
+Runs and chat completions change state or cost tokens, so they are never
+hedged. They are only retried on errors raised before the reply starts.
+For runs.create_and_poll only the request creating the run is retried;
+once the run exists, a failed poll polls the same run again, so a slow
+network never starts a second run on the thread.
+
+openai_client() in http_pool.py applies this to the clients of the scripts.
+Hedges, retries and timeouts are counted with the tracing metrics as
+voice_resilience_{hedges,hedge_wins,retries,timeouts}_total{endpoint="..."}.
+
+Usage:
+    client = resilient_client(openai.OpenAI(api_key=OPENAI_API_KEY))
+    text = resilience.call("transcription", transcribe, audio, hedge=True)
+    print(resilience.report())   # transcription p95 1.42 s deadline 2.13 s, 2 hedged (1 won), 0 retried, 0 timed out
+"""
+import collections
+import os
+import queue
+import random
+import threading
+import time
+
+from startup import lazy_import
+from tracing import tracer
+
+openai = lazy_import("openai")
+
+K = float(os.environ.get("RESILIENCE_K", 1.5))                  # deadline = p95 * K
+TIMEOUT_FACTOR = float(os.environ.get("RESILIENCE_TIMEOUT", 3))  # attempt timeout, in deadlines
+ATTEMPTS = int(os.environ.get("RESILIENCE_ATTEMPTS", 3))
+BACKOFF = 0.25      # seconds before the first retry, doubled for each further one
+BACKOFF_CAP = 4.0
+WINDOW = 50         # latencies kept per endpoint
+MIN_SAMPLES = 5     # before this many, an endpoint uses its default deadline
+MIN_DEADLINE = 0.5
+MAX_DEADLINE = 60.0
+
+# deadlines before there is a history; for streams, the time until the response starts
+DEFAULT_DEADLINES = {
+    "transcription": 5.0, "speech": 3.0, "chat": 10.0, "chat_stream": 5.0, "run_create": 5.0, "run": 30.0,
+    "run_stream": 5.0,
+}
+# a stream's timeout also limits the pauses while it is read, e.g. a run using the code interpreter
+MIN_TIMEOUTS = {"chat_stream": 15.0, "run_stream": 30.0}
+
+# names in openai, resolved when needed so openai is not imported with this module
+RETRYABLE = ("APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError")
+
+
+def retryable(error):
+    """ Whether ``error`` is worth another attempt: a timeout, connection error, 429 or 5xx. """
+    return isinstance(error, tuple(getattr(openai, name) for name in RETRYABLE))
+
+
+def backoff(attempt, base=BACKOFF, cap=BACKOFF_CAP):
+    """ Seconds to wait before retry ``attempt`` (1 for the first), with full jitter. """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class Endpoint:
+    """
+    Recent latencies of one kind of call.
+
+    :param default: Deadline in seconds until MIN_SAMPLES calls have been timed.
+    :param min_timeout: Shortest attempt timeout.
+    """
+
+    def __init__(self, name, default, min_timeout=0, k=K):
+        self.name = name
+        self.default = default
+        self.min_timeout = min_timeout
+        self.k = k
+        self.samples = collections.deque(maxlen=WINDOW)
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self.timeouts = 0
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+
+    def p95(self):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def deadline(self):
+        """ Seconds after which a call is hedged, and which its timeout is based on. """
+        if len(self.samples) < MIN_SAMPLES:
+            return self.default
+        return max(MIN_DEADLINE, min(MAX_DEADLINE, self.p95() * self.k))
+
+    def timeout(self):
+        """ Seconds before an attempt is abandoned. """
+        return max(self.min_timeout, self.deadline() * TIMEOUT_FACTOR)
+
+
+class Resilience:
+    """
+    Deadlines, hedging and retries per endpoint.
+
+    :param attempts: Attempts per call, including the first.
+    """
+
+    def __init__(self, attempts=ATTEMPTS):
+        self.attempts = attempts
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def endpoint(self, name):
+        with self.lock:
+            endpoint = self.endpoints.get(name)
+            if endpoint is None:
+                endpoint = self.endpoints[name] = Endpoint(
+                    name, DEFAULT_DEADLINES.get(name, 10.0), MIN_TIMEOUTS.get(name, 0)
+                )
+            return endpoint
+
+    def call(self, name, func, *args, hedge=False, discard=None, **kwargs):
+        """
+        Call ``func(*args, timeout=..., **kwargs)`` with the deadline of endpoint ``name``.
+
+        :param hedge: The call is idempotent, send a duplicate once the deadline passes.
+        :param discard: function(result) to release the result of a hedge that lost.
+        :return: The result of the first successful attempt.
+        """
+        endpoint = self.endpoint(name)
+        attempt = 1
+        while True:
+            try:
+                if hedge:
+                    return self._hedged(endpoint, func, args, kwargs, discard)
+                return self._timed(endpoint, func, args, kwargs)
+            except openai.OpenAIError as e:
+                if not retryable(e) or attempt >= self.attempts:
+                    raise
+                endpoint.retries += 1
+                tracer.count("resilience_retries", endpoint=name)
+                time.sleep(backoff(attempt))
+                attempt += 1
+
+    def _timed(self, endpoint, func, args, kwargs):
+        start = time.monotonic()
+        try:
+            result = func(*args, timeout=endpoint.timeout(), **kwargs)
+        except openai.APITimeoutError:
+            # a timed out call still tells that the endpoint is slow
+            endpoint.timeouts += 1
+            tracer.count("resilience_timeouts", endpoint=endpoint.name)
+            endpoint.observe(time.monotonic() - start)
+            raise
+        endpoint.observe(time.monotonic() - start)
+        return result
+
+    def _hedged(self, endpoint, func, args, kwargs, discard):
+        results = queue.Queue()
+
+        def attempt(hedged):
+            try:
+                results.put((hedged, self._timed(endpoint, func, args, kwargs), None))
+            except Exception as e:
+                results.put((hedged, None, e))
+
+        threading.Thread(target=attempt, args=(False,), daemon=True).start()
+        pending = 1
+        try:
+            hedged, result, error = results.get(timeout=endpoint.deadline())
+        except queue.Empty:
+            endpoint.hedges += 1
+            tracer.count("resilience_hedges", endpoint=endpoint.name)
+            threading.Thread(target=attempt, args=(True,), daemon=True).start()
+            pending += 1
+            hedged, result, error = results.get()
+        pending -= 1
+        if error is not None and pending:
+            # the other attempt may still succeed
+            hedged, result, error = results.get()
+            pending -= 1
+        if pending:
+            threading.Thread(target=self._discard, args=(results, discard), daemon=True).start()
+        if error is not None:
+            raise error
+        if hedged:
+            endpoint.hedge_wins += 1
+            tracer.count("resilience_hedge_wins", endpoint=endpoint.name)
+        return result
+
+    @staticmethod
+    def _discard(results, discard):
+        """ Release the result of the slower attempt once it arrives. """
+        hedged, result, error = results.get()
+        if error is None and discard is not None:
+            try:
+                discard(result)
+            except Exception:
+                pass
+
+    def report(self):
+        """ A one-line summary per endpoint. """
+        lines = []
+        for name, endpoint in sorted(self.endpoints.items()):
+            p95 = endpoint.p95()
+            lines.append(
+                f"{name} p95 {p95 or 0:.2f} s deadline {endpoint.deadline():.2f} s, "
+                f"{endpoint.hedges} hedged ({endpoint.hedge_wins} won), {endpoint.retries} retried, "
+                f"{endpoint.timeouts} timed out"
+            )
+        return "\n".join(lines) or "no calls yet"
+
+
+resilience = Resilience()
+
+
+class _Opened:
+    """ A streaming response opened ahead of its ``with`` block. """
+
+    def __init__(self, manager, response):
+        self.manager = manager
+        self.response = response
+
+    def __enter__(self):
+        return self.response
+
+    def __exit__(self, *exc):
+        return self.manager.__exit__(*exc)
+
+    def close(self):
+        self.manager.__exit__(None, None, None)
+
+
+def _open_stream(create):
+    """ Call ``create`` and send its request, which a streaming response only does on ``with``. """
+    def open(*args, timeout=None, **kwargs):
+        manager = create(*args, timeout=timeout, **kwargs)
+        return _Opened(manager, manager.__enter__())
+    return open
+
+
+def _active_run(runs, thread_id):
+    """ The newest run of ``thread_id`` if it has not ended, else None. """
+    latest = runs.list(thread_id=thread_id, order="desc", limit=1).data
+    if latest and latest[0].status in ("queued", "in_progress", "requires_action", "cancelling"):
+        return latest[0]
+    return None
+
+
+def resilient_client(client, resilience=resilience):
+    """
+    Give the calls the voice loops wait on adaptive deadlines and retries:
+    transcriptions.create and speech streams (hedged), chat.completions.create,
+    runs.create_and_poll and runs.stream. Other calls keep the SDK defaults.
+
+    :return: The same client, for ``client = resilient_client(openai.OpenAI(...))``.
+    """
+    # the attempts are made without the SDK's own retries, the policy here replaces them
+    direct = client.with_options(max_retries=0)
+
+    def transcribe(*args, **kwargs):
+        upload = kwargs.get("file")
+        if hasattr(upload, "read"):
+            # each attempt, hedged or retried, sends the whole file
+            kwargs["file"] = (getattr(upload, "name", "speech.wav"), upload.read())
+        return resilience.call("transcription", direct.audio.transcriptions.create, *args, hedge=True, **kwargs)
+
+    def speech_stream(*args, **kwargs):
+        return resilience.call(
+            "speech", _open_stream(direct.audio.speech.with_streaming_response.create), *args,
+            hedge=True, discard=_Opened.close, **kwargs
+        )
+
+    def chat(*args, **kwargs):
+        name = "chat_stream" if kwargs.get("stream") else "chat"
+        return resilience.call(name, direct.chat.completions.create, *args, **kwargs)
+
+    def create_and_poll(*args, poll_interval_ms=None, **kwargs):
+        runs = direct.beta.threads.runs
+        try:
+            run = resilience.call("run_create", runs.create, *args, **kwargs)
+        except openai.BadRequestError as e:
+            # a retried create whose first attempt did reach the API, that run is the one to wait for
+            run = _active_run(runs, kwargs["thread_id"]) if "active run" in str(e) else None
+            if run is None:
+                raise
+        poll = {} if poll_interval_ms is None else {"poll_interval_ms": poll_interval_ms}
+        # retrieving the run is idempotent, a timeout or connection error polls the same run again
+        return resilience.call("run", runs.poll, run.id, thread_id=run.thread_id, **poll)
+
+    def run_stream(*args, **kwargs):
+        return resilience.call("run_stream", _open_stream(direct.beta.threads.runs.stream), *args, **kwargs)
+
+    client.audio.transcriptions.create = transcribe
+    client.audio.speech.with_streaming_response.create = speech_stream
+    client.chat.completions.create = chat
+    client.beta.threads.runs.create_and_poll = create_and_poll
+    client.beta.threads.runs.stream = run_stream
+    return client
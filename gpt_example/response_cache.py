@@ -0,0 +1,149 @@
+"""
+Response cache for repeated sensor questions.
+
+Most questions to the sensor bots repeat: "how do I feel?" with a reading
+in the same band as a minute ago. ResponseCache keys a reply by the
+normalized transcript plus the sensor readings quantized into buckets (e.g.
+0.5 °C, 100 ADC counts). A hit within the TTL skips the assistant run and
+replays the reply sentence by sentence; the scripts keep the sentences in
+the TTS cache, so no network request is made at all.
+
+Bots replying in JSON pass ``valid``, e.g. a parse_reply() check: a reply
+that does not parse is never stored, and a stored one that does not is
+dropped and the question asked again.
+
+A reply is reused for every reading in the same bucket, so a reply that
+quotes "36.7°C" may be replayed for 36.9°C. Choose the buckets as coarse
+as the advice, not the numbers, may differ.
+
+Hits, misses and the seconds saved (the recorded duration of the run that
+was skipped) are counted, and exported with the tracing metrics as
+voice_response_cache_{hits,misses,saved_seconds}_total{cache="..."}.
+
+Usage:
+    from response_cache import ResponseCache
+
+    responses = ResponseCache("thermometer", buckets={"thermistor": 0.5})
+    reply, run = responses.stream(conversation, text_send, on_sentence=speech.say,
+                                  text=msg, thermistor=temperature)
+    print(responses.report())   # thermometer responses: 4 of 10 cached (40%), 9.2 s saved
+"""
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from intents import normalize
+from tracing import tracer
+
+RESPONSE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 600))  # seconds, 0 to disable the cache
+MAX_ENTRIES = 256
+
+# returned instead of a run on a hit, so the scripts' status checks keep working
+CACHED_RUN = SimpleNamespace(status="completed", usage=None)
+
+
+def quantize(value, step):
+    """ Bucket number of ``value`` for buckets ``step`` wide, None stays None. """
+    if value is None or not step:
+        return value
+    return round(value / step)
+
+
+class ResponseCache:
+    """
+    :param name: Label of the metrics.
+    :param buckets: {reading name: bucket width}, readings without one must match exactly.
+    :param ttl: Seconds a reply is reused for.
+    :param max_entries: Oldest entries are dropped beyond this.
+    :param valid: function(reply) -> bool, replies failing it are neither
+        stored nor replayed, e.g. ``lambda reply: parse_reply(reply) is not None``.
+    """
+
+    def __init__(self, name, buckets=None, ttl=RESPONSE_TTL, max_entries=MAX_ENTRIES, valid=None):
+        self.name = name
+        self.buckets = buckets or {}
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.valid = valid
+        self.entries = {}   # key: (expires, reply, sentences, seconds)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0
+
+    def key(self, text, **readings):
+        """ The cache key of an utterance and the sensor readings it was asked with. """
+        quantized = tuple(sorted((name, quantize(value, self.buckets.get(name))) for name, value in readings.items()))
+        return normalize(text), quantized
+
+    def get(self, key):
+        """ Return (reply, sentences) of a live entry, or None. """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic() or not self._valid(entry[1]):
+                self.entries.pop(key, None)
+                self.misses += 1
+                tracer.count("response_cache_misses", cache=self.name)
+                return None
+            expires, reply, sentences, seconds = entry
+            self.hits += 1
+            self.saved += seconds
+        tracer.count("response_cache_hits", cache=self.name)
+        tracer.count("response_cache_saved_seconds", seconds, cache=self.name)
+        return reply, sentences
+
+    def put(self, key, reply, sentences, seconds):
+        """
+        Store a reply.
+
+        :param sentences: The reply as it was spoken, sentence by sentence.
+        :param seconds: How long the run took, counted as saved on every hit.
+        """
+        if not self.ttl or not self._valid(reply):
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, reply, list(sentences), seconds)
+            while len(self.entries) > self.max_entries:
+                # dicts keep insertion order, the first entry is the oldest
+                del self.entries[next(iter(self.entries))]
+
+    def _valid(self, reply):
+        return self.valid is None or self.valid(reply)
+
+    def stream(self, conversation, content, on_sentence=None, text=None, **readings):
+        """
+        conversation.stream(content, on_sentence=...), or a replay of the cached reply.
+
+        :param text: The user's utterance for the key, ``content`` by default.
+        :param readings: The sensor readings for the key, e.g. thermistor=36.7.
+        :return: (reply text, run), the run is CACHED_RUN on a hit.
+        """
+        key = self.key(content if text is None else text, **readings)
+        cached = self.get(key) if self.ttl else None
+        if cached is not None:
+            reply, sentences = cached
+            if on_sentence:
+                for sentence in sentences:
+                    on_sentence(sentence)
+            return reply, CACHED_RUN
+
+        sentences = []
+
+        def collect(sentence):
+            sentences.append(sentence)
+            if on_sentence:
+                on_sentence(sentence)
+
+        start = time.monotonic()
+        reply, run = conversation.stream(content, on_sentence=collect)
+        if run.status == "completed" and reply:
+            self.put(key, reply, sentences, time.monotonic() - start)
+        return reply, run
+
+    def report(self):
+        """ A one-line summary of the hit ratio and the time saved. """
+        total = self.hits + self.misses
+        if not total:
+            return f"{self.name} responses: no questions yet"
+        return f"{self.name} responses: {self.hits} of {total} cached ({self.hits / total:.0%}), {self.saved:.1f} s saved"
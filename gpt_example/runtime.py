@@ -0,0 +1,212 @@
+"""
+asyncio runtime for the example scripts.
+
+The scripts used to mix blocking loops, their own daemon threads for sensor
+polling and GPIO callbacks that block in fusion_hat's callback thread
+while speech plays. Runtime runs all of it on one asyncio event loop:
+
+    - sensors are sampled by periodic tasks, the latest value is always at hand
+    - blocking calls (the OpenAI client, mic.listen, fusion_hat reads, speech)
+      run in daemon threads, a bounded number at a time, and are awaited
+    - GPIO callbacks are handed to the loop and run as tasks, so a slow
+      handler never holds up the next event
+
+The OpenAI helpers (conversation, speak, encode_speech) stay synchronous and
+are awaited through these threads; they keep working unchanged in the plain
+scripts. Daemon threads, unlike a ThreadPoolExecutor, do not keep Ctrl+C
+waiting for a listen() that never returns.
+
+Usage:
+    from runtime import Runtime
+
+    runtime = Runtime()
+    distance = runtime.sensor("distance", ultrasonic.read, interval=1, valid=lambda d: d > 0)
+    runtime.on(button, "when_activated", handle_button)   # a coroutine function or a plain one
+
+    async def main():
+        while True:
+            audio = await runtime.listen(mic)
+            text = await runtime.call(speech_to_text, audio)
+            reply, run = await runtime.ask(conversation, f"{distance.value} {text}", on_sentence=speech.say)
+            await runtime.call(speech.wait)
+
+    runtime.run(main)
+"""
+import asyncio
+import inspect
+import threading
+import time
+
+from tracing import tracer
+
+WORKERS = 8  # blocking calls that can be in flight at once
+
+
+def _resolve(future, result, error):
+    if future.done():
+        return  # cancelled while the call was running
+    if isinstance(error, StopIteration):
+        # a future cannot hold a StopIteration, it would never resolve
+        error = RuntimeError(f"{error!r} raised in a blocking call")
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class Sensor:
+    """
+    A sensor sampled in the background by Runtime.sensor().
+
+    ``value`` is the latest valid reading, None until the first one.
+    """
+
+    def __init__(self, name, read, interval, valid=None):
+        self.name = name
+        self.read = read
+        self.interval = interval
+        self.valid = valid
+        self.value = None
+        self.updated = None   # time.monotonic() of the latest valid reading
+        self.errors = 0
+        # set on every new reading; created on the running loop, Python 3.9 binds an Event to the loop it is made on
+        self.changed = None
+
+    def _changed(self):
+        if self.changed is None:
+            self.changed = asyncio.Event()
+        return self.changed
+
+    async def wait(self):
+        """ Wait for the next valid reading and return it. """
+        changed = self._changed()
+        changed.clear()
+        await changed.wait()
+        return self.value
+
+    async def _sample(self, runtime):
+        while True:
+            start = time.monotonic()
+            try:
+                value = await runtime.call(self.read)
+            except Exception as e:
+                self.errors += 1
+                if self.errors == 1:
+                    print(f"Error reading {self.name}: {e}")
+            else:
+                if self.valid is None or self.valid(value):
+                    self.value = value
+                    self.updated = time.monotonic()
+                    self._changed().set()
+            tracer.record(f"sensor_{self.name}", time.monotonic() - start)
+            await asyncio.sleep(max(0, self.interval - (time.monotonic() - start)))
+
+
+class Runtime:
+    """
+    :param workers: Blocking calls that can run at once.
+    """
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self.slots = None     # asyncio.Semaphore, created on the loop
+        self.loop = None
+        self.sensors = []
+        self.tasks = set()
+
+    def sensor(self, name, read, interval=1.0, valid=None):
+        """
+        Sample ``read()`` every ``interval`` seconds while the runtime runs.
+
+        :param valid: function(value) -> bool, invalid readings are ignored.
+        :return: The Sensor, read its ``value`` at any time.
+        """
+        sensor = Sensor(name, read, interval, valid)
+        self.sensors.append(sensor)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.spawn, sensor._sample(self))
+        return sensor
+
+    async def call(self, func, *args, **kwargs):
+        """ Run a blocking function in a daemon thread and await its result. """
+        loop = asyncio.get_running_loop()
+        async with self.slots:
+            future = loop.create_future()
+
+            def worker():
+                result = error = None
+                try:
+                    result = func(*args, **kwargs)
+                except BaseException as e:
+                    error = e
+                try:
+                    loop.call_soon_threadsafe(_resolve, future, result, error)
+                except RuntimeError:
+                    pass  # the loop has closed
+
+            threading.Thread(target=worker, daemon=True).start()
+            return await future
+
+    async def listen(self, mic, **kwargs):
+        """ Await the next utterance from a MicStream. """
+        return await self.call(mic.listen, **kwargs)
+
+    async def ask(self, conversation, content, on_sentence=None, on_delta=None):
+        """ Await conversation.stream(); the callbacks run in its thread. """
+        return await self.call(conversation.stream, content, on_sentence=on_sentence, on_delta=on_delta)
+
+    async def play(self, clip):
+        """ Await the end of a clip queued on the AudioPlayer. """
+        await self.call(clip.done.wait)
+        return clip
+
+    def spawn(self, coro):
+        """ Run a coroutine as a task of the runtime; errors are printed, not lost. """
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error in task: {task.exception()!r}")
+
+    def on(self, device, event, handler, *args):
+        """
+        Run ``handler(*args)`` on the loop for a fusion_hat callback such as
+        ``button.when_activated``. A plain function runs in a thread.
+        """
+        def callback(*_):
+            if self.loop is None:
+                return
+            if inspect.iscoroutinefunction(handler):
+                self.loop.call_soon_threadsafe(lambda: self.spawn(handler(*args)))
+            else:
+                self.loop.call_soon_threadsafe(lambda: self.spawn(self.call(handler, *args)))
+
+        setattr(device, event, callback)
+
+    def run(self, main=None):
+        """
+        Run the sensors and ``main()`` until main returns or Ctrl+C.
+
+        :param main: A coroutine function, None to run until interrupted.
+        """
+        async def runner():
+            self.loop = asyncio.get_running_loop()
+            self.slots = asyncio.Semaphore(self.workers)
+            for sensor in self.sensors:
+                sensor.changed = None  # an Event of an earlier run() belongs to its loop
+                self.spawn(sensor._sample(self))
+            try:
+                if main is None:
+                    await asyncio.Event().wait()
+                else:
+                    await main()
+            finally:
+                for task in list(self.tasks):
+                    task.cancel()
+                self.loop = None
+
+        asyncio.run(runner())
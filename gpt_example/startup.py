@@ -0,0 +1,176 @@
+"""
+Fast start-up for the example scripts.
+
+Before the first "Listening..." a script used to import the openai package
+(the slowest import by far), shell out to "fusion_hat enable_speaker" and
+wait for it, then create the assistant and a thread over the network, one
+after the other. On a Pi Zero that is several seconds. With FAST_STARTUP
+(the default) these overlap with the microphone calibration:
+
+    - lazy_import() defers a module until an attribute of it is first used
+    - enable_speaker() starts the command once per process and returns,
+      the audio player waits for it before the first sound
+    - defer() runs the client and assistant set-up in the background and
+      returns a stand-in that waits for the result on first use
+
+The first turn only waits for the set-up if the user speaks before it has
+finished, the transcription needs the client anyway. ready() records the
+time to ready (stage "startup" in tracing.py); benchmark_startup.py measures
+it per script.
+
+Environment:
+    FAST_STARTUP=0   do everything in order, as before
+
+Usage:
+    from startup import defer, enable_speaker, ready
+
+    enable_speaker()
+    client = defer(lambda: trace_client(openai_client(OPENAI_API_KEY)))
+    conversation = defer(open_conversation, client, name="BOT", instructions="...", model="gpt-4o-mini")
+    ...
+    ready()   # just before the first "Listening..."
+"""
+import importlib
+import os
+import subprocess
+import threading
+import time
+
+from tracing import tracer
+
+FAST_STARTUP = os.environ.get("FAST_STARTUP", "1") != "0"
+SPEAKER_TIMEOUT = 5  # seconds the player waits for the speaker to be enabled
+
+
+def _process_start():
+    """ When this process was started, from /proc on Linux, else now. """
+    try:
+        with open("/proc/self/stat") as file:
+            # the fields after the command name, which may contain spaces; starttime is field 22
+            start_ticks = int(file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+# the start of the process, or of the benchmark that started it
+_started = float(os.environ.get("STARTUP_T0", 0)) or _process_start()
+_speaker = None
+_speaker_lock = threading.Lock()
+_ready = None
+
+
+class LazyModule:
+    """ A module that is imported when one of its attributes is first used. """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            # import_module is thread-safe, the first thread imports and the others wait
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    """
+    ``name`` as a LazyModule with FAST_STARTUP, otherwise imported now.
+
+    Only attribute access is deferred, a lazily imported module cannot be
+    used in class bases or ``except`` clauses evaluated at import time.
+    """
+    if FAST_STARTUP:
+        return LazyModule(name)
+    return importlib.import_module(name)
+
+
+def enable_speaker():
+    """ Run "fusion_hat enable_speaker" once per process, in the background with FAST_STARTUP. """
+    global _speaker
+    with _speaker_lock:
+        if _speaker is None:
+            try:
+                _speaker = subprocess.Popen(
+                    ["fusion_hat", "enable_speaker"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+            except OSError as e:
+                print(f"Error enabling the speaker: {e}")
+                _speaker = False
+    if not FAST_STARTUP:
+        wait_speaker()
+
+
+def wait_speaker(timeout=SPEAKER_TIMEOUT):
+    """ Wait for enable_speaker() to finish, at once if it was never called. """
+    speaker = _speaker
+    if speaker:
+        try:
+            speaker.wait(timeout)
+        except subprocess.TimeoutExpired:
+            print("Enabling the speaker is taking long, playing anyway")
+
+
+class Deferred:
+    """
+    The result of a call running in the background. Using any attribute of
+    it waits for the call and then forwards to the result; errors of the
+    call are raised there.
+    """
+
+    def __init__(self, func, args, kwargs):
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(func, args, kwargs), daemon=True)
+        self._thread.start()
+
+    def _run(self, func, args, kwargs):
+        try:
+            self._result = func(*args, **kwargs)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def result(self):
+        """ Wait for the call and return its result. """
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def __getattr__(self, attr):
+        return getattr(self.result(), attr)
+
+
+def defer(func, *args, **kwargs):
+    """
+    ``func(*args, **kwargs)`` in the background with FAST_STARTUP, as a
+    Deferred stand-in for the result; otherwise the result of calling it now.
+    """
+    if FAST_STARTUP:
+        return Deferred(func, args, kwargs)
+    return func(*args, **kwargs)
+
+
+def ready():
+    """
+    Record the seconds from the process start to now, the time to ready.
+    Only the first call counts, so it can be called at the top of the loop.
+    """
+    global _ready
+    if _ready is None:
+        _ready = time.time() - _started
+        tracer.record("startup", _ready)
+        if os.environ.get("STARTUP_T0"):
+            print(f"Ready in {_ready:.2f} s")
+    return _ready
@@ -0,0 +1,249 @@
+"""
+Pluggable speech-to-text: whisper-1 over the API, or a Whisper model on the CPU.
+
+Uploading every utterance to whisper-1 needs the network and costs a round
+trip even for "stop the fan". SpeechToText picks a backend per utterance:
+
+    OpenAIBackend   whisper-1, the compressed upload of stt_upload.py
+    LocalBackend    faster-whisper (CTranslate2, int8 quantized) on the CPU,
+                    no network once the model is on the device
+                    (pip install faster-whisper)
+
+With STT_BACKEND=auto (the default) utterances shorter than STT_LOCAL_MAX
+seconds are transcribed locally and longer ones by the API, where the
+larger model is worth the upload. If the API cannot be reached the
+utterance is transcribed locally instead, and the API is skipped for the
+next OFFLINE_SECONDS. Without faster-whisper everything goes to the API, as
+before. The rules are functions, see shorter_than(); benchmark_stt.py
+measures word error rate and latency of the backends on a set of recordings.
+
+faster-whisper downloads the model on first use. To run fully offline,
+download it once, or set STT_LOCAL_MODEL to a converted model directory and
+HF_HUB_OFFLINE=1.
+
+Environment:
+    STT_BACKEND=auto     "auto", "local" or "openai"
+    STT_LOCAL_MODEL=base a faster-whisper model size ("tiny", "base", "small", ...) or directory
+    STT_LOCAL_MAX=4      seconds, shorter utterances are transcribed locally with "auto"
+
+Usage:
+    from stt import make_stt
+
+    stt = make_stt(client)
+    text = stt.transcribe(audio, language=["zh", "en"])
+    print(stt.report())   # stt: 14 local (p50 0.41 s), 3 openai (p50 0.92 s), 1 fallback
+"""
+import importlib.util
+import os
+import threading
+import time
+
+from startup import defer, lazy_import
+from stt_upload import STT_RATE, encode_speech
+from tracing import tracer
+
+openai = lazy_import("openai")
+
+BACKEND = os.environ.get("STT_BACKEND", "auto")
+LOCAL_MODEL = os.environ.get("STT_LOCAL_MODEL", "base")
+LOCAL_MAX = float(os.environ.get("STT_LOCAL_MAX", 4))
+OFFLINE_SECONDS = 30  # after a connection error, the API is not tried again for this long
+
+
+def duration(audio):
+    """ Length of an sr.AudioData in seconds. """
+    return len(audio.frame_data) / audio.sample_rate / audio.sample_width
+
+
+def _languages(language):
+    """ The scripts pass a list of the languages they expect, or one code. """
+    if isinstance(language, str):
+        return [language]
+    return list(language or [])
+
+
+class OpenAIBackend:
+    """
+    :param client: An openai.OpenAI client, or a Deferred one.
+    :param model: The transcription model.
+    :param codec: Upload codec, see stt_upload.py.
+    """
+
+    name = "openai"
+
+    def __init__(self, client, model="whisper-1", codec=None):
+        self.client = client
+        self.model = model
+        self.codec = codec
+
+    def available(self):
+        return True
+
+    def transcribe(self, audio, language=None, prompt=None):
+        kwargs = {}
+        if language:
+            kwargs["language"] = language
+        if prompt:
+            kwargs["prompt"] = prompt
+        # 16 kHz compressed audio uploads much faster than the raw WAV recording
+        upload = encode_speech(audio, self.codec)
+        return self.client.audio.transcriptions.create(model=self.model, file=upload, **kwargs).text
+
+
+class LocalBackend:
+    """
+    faster-whisper on the CPU. The model is loaded in the background when the
+    backend is created, so the first utterance does not wait for it.
+
+    :param model: Model size or directory of a converted model.
+    :param compute_type: "int8" is the fastest on a Pi and barely less accurate.
+    :param threads: CPU threads, 0 for all cores.
+    :param beam_size: 1 is greedy decoding, the fastest.
+    """
+
+    name = "local"
+
+    def __init__(self, model=LOCAL_MODEL, compute_type="int8", threads=0, beam_size=1):
+        self.model_name = model
+        self.compute_type = compute_type
+        self.threads = threads
+        self.beam_size = beam_size
+        self.model = defer(self._load) if self.available() else None
+
+    @staticmethod
+    def available():
+        return importlib.util.find_spec("faster_whisper") is not None
+
+    def _load(self):
+        from faster_whisper import WhisperModel  # pip install faster-whisper
+
+        return WhisperModel(
+            self.model_name, device="cpu", compute_type=self.compute_type, cpu_threads=self.threads
+        )
+
+    def transcribe(self, audio, language=None, prompt=None):
+        if self.model is None:
+            raise RuntimeError("faster-whisper is not installed (pip install faster-whisper)")
+        import numpy  # installed with faster-whisper
+
+        raw = audio.get_raw_data(convert_rate=STT_RATE, convert_width=2)
+        samples = numpy.frombuffer(raw, dtype=numpy.int16).astype(numpy.float32) / 32768
+        languages = _languages(language)
+        # one expected language skips the detection, several are left to it
+        segments, info = self.model.transcribe(
+            samples,
+            language=languages[0] if len(languages) == 1 else None,
+            beam_size=self.beam_size,
+            initial_prompt=prompt,
+            condition_on_previous_text=False,
+        )
+        return "".join(segment.text for segment in segments).strip()
+
+
+def shorter_than(seconds, backend):
+    """ A rule: utterances shorter than ``seconds`` go to ``backend``. """
+    def rule(audio, length):
+        return backend if length < seconds else None
+    return rule
+
+
+class SpeechToText:
+    """
+    Transcribe each utterance with the backend the rules pick.
+
+    :param backends: The backends by name, e.g. {"openai": ..., "local": ...}.
+    :param rules: functions(audio, seconds) -> backend name or None, the
+        first name returned wins.
+    :param default: The backend when no rule matches.
+    """
+
+    def __init__(self, backends, rules=(), default="openai"):
+        self.backends = backends
+        self.rules = list(rules)
+        self.default = default
+        self.offline_until = 0
+        self.lock = threading.Lock()
+        self.latencies = {name: [] for name in backends}
+        self.fallbacks = 0
+
+    def route(self, audio):
+        """ The name of the backend for ``audio``. """
+        length = duration(audio)
+        name = self.default
+        for rule in self.rules:
+            chosen = rule(audio, length)
+            if chosen is not None:
+                name = chosen
+                break
+        if name not in self.backends or not self.backends[name].available():
+            name = self.default
+        if name == "openai" and time.monotonic() < self.offline_until and "local" in self.backends:
+            name = "local"
+        return name
+
+    def transcribe(self, audio, language=None, prompt=None):
+        """
+        :param language: A language code, or a list of the expected ones.
+        :param prompt: Words to expect, e.g. names, passed to the model.
+        :return: The text.
+        """
+        name = self.route(audio)
+        try:
+            return self._transcribe(name, audio, language, prompt)
+        except Exception as e:
+            other = self._fallback(name, e)
+            if other is None:
+                raise
+            print(f"Error in {name} speech-to-text ({e}), trying {other}")
+            self.fallbacks += 1
+            tracer.count("stt_fallbacks", backend=other)
+            return self._transcribe(other, audio, language, prompt)
+
+    def _transcribe(self, name, audio, language, prompt):
+        start = time.monotonic()
+        text = self.backends[name].transcribe(audio, language=language, prompt=prompt)
+        seconds = time.monotonic() - start
+        tracer.record(f"stt_{name}", seconds)
+        tracer.count("stt_requests", backend=name)
+        with self.lock:
+            self.latencies[name].append(seconds)
+        return text
+
+    def _fallback(self, name, error):
+        """ The backend to try after ``name`` failed, None to raise. """
+        if name == "openai":
+            if isinstance(error, openai.APIConnectionError):
+                self.offline_until = time.monotonic() + OFFLINE_SECONDS
+            local = self.backends.get("local")
+            return "local" if local is not None and local.available() else None
+        return "openai" if "openai" in self.backends else None
+
+    def report(self):
+        """ A one-line summary of the transcriptions per backend. """
+        parts = []
+        for name, latencies in self.latencies.items():
+            if latencies:
+                p50 = sorted(latencies)[len(latencies) // 2]
+                parts.append(f"{len(latencies)} {name} (p50 {p50:.2f} s)")
+        return f"stt: {', '.join(parts) or 'no transcriptions yet'}, {self.fallbacks} fallback"
+
+
+def make_stt(client, backend=BACKEND, local_max=LOCAL_MAX, model=LOCAL_MODEL):
+    """
+    The speech-to-text of a script, configured from the environment.
+
+    :param client: The OpenAI client for the "openai" backend.
+    :param backend: "auto", "local" or "openai".
+    :param local_max: With "auto", utterances shorter than this go to the local backend.
+    """
+    backends = {"openai": OpenAIBackend(client)}
+    if backend in ("auto", "local"):
+        if LocalBackend.available():
+            backends["local"] = LocalBackend(model)
+        elif backend == "local":
+            print("STT_BACKEND=local needs faster-whisper (pip install faster-whisper), using the API")
+    if backend == "local":
+        return SpeechToText(backends, default="local" if "local" in backends else "openai")
+    if backend == "auto":
+        return SpeechToText(backends, rules=[shorter_than(local_max, "local")])
+    return SpeechToText(backends)
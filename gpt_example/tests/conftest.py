@@ -0,0 +1,15 @@
+"""
+The example modules are imported the way the scripts import them, from the
+gpt_example directory. Tests use fakes for the OpenAI client and the audio
+device, they need neither the network nor the Fusion HAT.
+
+Run from gpt_example:
+    python3 -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# no Prometheus port or trace file from the tracing module during tests
+os.environ.setdefault("TRACE_PORT", "")
+os.environ.setdefault("TRACE_JSONL", "")
@@ -0,0 +1,146 @@
+import itertools
+import json
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+import assistant_registry
+
+
+class FakeAssistants:
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.existing = set()
+        self.created = []
+        self.deleted = []
+        self.lock = threading.Lock()
+
+    def create(self, **params):
+        with self.lock:
+            assistant_id = f"asst_{next(self.ids)}"
+        self.existing.add(assistant_id)
+        self.created.append(params)
+        return type("Assistant", (), {"id": assistant_id})()
+
+    def retrieve(self, assistant_id):
+        if assistant_id not in self.existing:
+            response = httpx.Response(404, request=httpx.Request("GET", "https://api.openai.com"))
+            raise openai.NotFoundError("No assistant found", response=response, body=None)
+        return type("Assistant", (), {"id": assistant_id})()
+
+    def delete(self, assistant_id):
+        self.existing.discard(assistant_id)
+        self.deleted.append(assistant_id)
+
+
+class FakeClient:
+    def __init__(self):
+        self.beta = type("Beta", (), {})()
+        self.beta.assistants = FakeAssistants()
+
+
+@pytest.fixture(autouse=True)
+def registry(tmp_path, monkeypatch):
+    path = tmp_path / ".assistants.json"
+    monkeypatch.setattr(assistant_registry, "REGISTRY_FILE", path)
+    monkeypatch.setattr(assistant_registry, "_gc_started", True)  # no garbage collection thread
+    return path
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_definition_hash_changes_with_the_definition():
+    base = assistant_registry.definition_hash("BOT", "Be brief.", "gpt-4o-mini")
+    assert base == assistant_registry.definition_hash("BOT", "Be brief.", "gpt-4o-mini", tools=[])
+    assert base != assistant_registry.definition_hash("BOT", "Be briefer.", "gpt-4o-mini")
+    assert base != assistant_registry.definition_hash("BOT", "Be brief.", "gpt-4o")
+
+
+def test_reuses_the_registered_assistant(registry):
+    client = FakeClient()
+    first = assistant_registry.get_assistant(client, "BOT", "Be brief.", "gpt-4o-mini")
+    second = assistant_registry.get_assistant(client, "BOT", "Be brief.", "gpt-4o-mini")
+    assert first.id == second.id
+    assert len(client.beta.assistants.created) == 1
+    assert [entry["id"] for entry in json.loads(registry.read_text()).values()] == [first.id]
+
+
+def test_recreates_an_assistant_deleted_remotely(registry):
+    client = FakeClient()
+    old_id = assistant_registry.get_assistant(client, "BOT", "Be brief.", "gpt-4o-mini").id
+    client.beta.assistants.existing.clear()
+    ref = assistant_registry.get_assistant(client, "BOT", "Be brief.", "gpt-4o-mini")
+    wait_for(lambda: ref.id != old_id)
+    assert [entry["id"] for entry in json.loads(registry.read_text()).values()] == [ref.id]
+
+
+def test_background_errors_are_reported(capsys):
+    client = FakeClient()
+    assistant_registry.get_assistant(client, "BOT", "Be brief.", "gpt-4o-mini")
+    client.beta.assistants.existing.clear()
+
+    def fail(**params):
+        raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+
+    client.beta.assistants.create = fail
+    assistant_registry.get_assistant(client, "BOT", "Be brief.", "gpt-4o-mini")
+    wait_for(lambda: "Error checking assistant BOT" in capsys.readouterr().out)
+
+
+def test_concurrent_scripts_create_one_assistant():
+    client = FakeClient()
+    threads = [
+        threading.Thread(target=assistant_registry.get_assistant, args=(client, "BOT", "Be brief.", "gpt-4o-mini"))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(client.beta.assistants.created) == 1
+
+
+def test_prune_deletes_unused_entries(registry):
+    client = FakeClient()
+    kept = assistant_registry.get_assistant(client, "BOT", "Be brief.", "gpt-4o-mini")
+    old = assistant_registry.get_assistant(client, "OLD", "Be brief.", "gpt-4o-mini")
+    entries = json.loads(registry.read_text())
+    for entry in entries.values():
+        if entry["id"] == old.id:
+            entry["last_used"] = time.time() - 10 * 86400
+    registry.write_text(json.dumps(entries))
+
+    pruned = assistant_registry.collect_garbage(client, max_age=7 * 86400)
+    assert len(pruned) == 1
+    assert client.beta.assistants.deleted == [old.id]
+    assert [entry["id"] for entry in json.loads(registry.read_text()).values()] == [kept.id]
+
+
+def test_recreated_assistant_is_saved_when_its_entry_was_pruned(registry, monkeypatch):
+    client = FakeClient()
+    old_id = assistant_registry.get_assistant(client, "BOT", "Be brief.", "gpt-4o-mini").id
+    client.beta.assistants.existing.clear()
+    load = assistant_registry._load
+    loads = []
+
+    def pruned():
+        # the check finds the entry gone, as after collect_garbage() in another script
+        loads.append(None)
+        return load() if len(loads) == 1 else {}
+
+    monkeypatch.setattr(assistant_registry, "_load", pruned)
+    ref = assistant_registry.get_assistant(client, "BOT", "Be brief.", "gpt-4o-mini")
+    wait_for(lambda: ref.id != old_id)
+    monkeypatch.setattr(assistant_registry, "_load", load)
+    entries = json.loads(registry.read_text())
+    assert [entry["id"] for entry in entries.values()] == [ref.id]
+    assert assistant_registry.get_assistant(client, "BOT", "Be brief.", "gpt-4o-mini").id == ref.id
+    assert len(client.beta.assistants.created) == 2
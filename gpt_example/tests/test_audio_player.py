@@ -0,0 +1,108 @@
+import time
+
+from audio_player import ALARM, CHUNK, MUSIC, SAMPLE_WIDTH, SPEECH, AudioPlayer, Clip, ClipQueue
+
+CHUNK_BYTES = CHUNK * SAMPLE_WIDTH
+
+
+class SlowOutput:
+    """ A null sink taking ``delay`` seconds per write, recording which clip each chunk came from. """
+
+    def __init__(self, delay=0.005):
+        self.delay = delay
+        self.writes = []
+
+    def write(self, data):
+        time.sleep(self.delay)
+        self.writes.append(data[:1])
+
+
+def sound(marker, chunks=4):
+    """ PCM whose chunks start with ``marker``, so the writes tell which clip played. """
+    return marker * (chunks * CHUNK_BYTES)
+
+
+def played(output):
+    markers = []
+    for marker in output.writes:
+        if not markers or markers[-1] != marker:
+            markers.append(marker)
+    return markers
+
+
+def test_queue_orders_by_priority_then_arrival():
+    clips = ClipQueue()
+    for name, priority in (("music", MUSIC), ("first", SPEECH), ("alarm", ALARM), ("second", SPEECH)):
+        clips.put(Clip(name, priority))
+    assert [clips.get(0).data for _ in range(4)] == ["alarm", "first", "second", "music"]
+    assert clips.get(0) is None
+
+
+def test_queue_coalesces_waiting_clips_with_the_same_key():
+    clips = ClipQueue()
+    first = clips.put(Clip("door", ALARM, key="door"))
+    assert clips.put(Clip("door", ALARM, key="door")) is first
+    assert clips.put(Clip("door", SPEECH, key="door")) is not first
+    assert clips.waiting("door", ALARM) is first
+    assert clips.unfinished == 2
+
+
+def test_a_started_clip_is_not_coalesced():
+    clips = ClipQueue()
+    first = clips.put(Clip("door", ALARM, key="door"))
+    assert clips.get(0) is first
+    first.started_at = time.monotonic()
+    clips.put(first, requeue=True)   # preempted, waits to resume
+    assert clips.waiting("door", ALARM) is None
+    second = clips.put(Clip("door", ALARM, key="door"))
+    assert second is not first
+
+
+def test_drain_keeps_more_urgent_clips():
+    clips = ClipQueue()
+    for priority in (ALARM, SPEECH, MUSIC):
+        clips.put(Clip(priority, priority))
+    assert sorted(clip.priority for clip in clips.drain(SPEECH)) == [SPEECH, MUSIC]
+    assert clips.get(0).priority == ALARM
+
+
+def test_alarm_preempts_speech_which_resumes():
+    output = SlowOutput()
+    player = AudioPlayer(output=output)
+    speech = player.play_pcm(sound(b"s", 20), wait=False)
+    while speech.started_at is None:
+        time.sleep(0.001)
+    player.play_pcm(sound(b"a"), wait=False, priority=ALARM)
+    player.wait()
+    assert played(output) == [b"s", b"a", b"s"]
+    assert output.writes.count(b"s") == 20
+
+
+def test_stop_drops_the_clips_queued_before_it():
+    output = SlowOutput()
+    player = AudioPlayer(output=output)
+    speech = player.play_pcm(sound(b"s", 50), wait=False)
+    queued = player.play_pcm(sound(b"q"), wait=False)
+    while speech.started_at is None:
+        time.sleep(0.001)
+    alarm = player.play_pcm(sound(b"a", 20), wait=False, priority=ALARM)
+    player.stop(SPEECH)
+    after = player.play_pcm(sound(b"n"), wait=False)
+    player.wait()
+    assert speech.done.is_set() and queued.done.is_set() and alarm.done.is_set() and after.done.is_set()
+    assert b"q" not in output.writes
+    assert output.writes.count(b"s") < 50
+    assert output.writes.count(b"a") == 20   # more urgent, not stopped
+    assert output.writes.count(b"n") == 4    # queued after the stop
+
+
+def test_a_clip_from_before_a_stop_is_dropped_when_it_is_taken():
+    output = SlowOutput(0)
+    player = AudioPlayer(output=output)
+    player.stop(SPEECH)
+    # queued before the stop, but in the play loop's hands when the queue was drained
+    stale = player.clips.put(Clip(sound(b"s"), SPEECH))
+    assert stale.done.wait(1)
+    assert stale.started_at is None and output.writes == []
+    player.play_pcm(sound(b"n"))
+    assert output.writes == [b"n"] * 4
@@ -0,0 +1,95 @@
+import openai
+import pytest
+
+import conversation
+from conversation import ChatConversation, chat_options, open_conversation
+from mock_openai import MockOpenAI
+
+
+PET_REPLY = '{"pattern": [0, 24, 24, 0], "message": "Hello!"}'
+
+
+@pytest.fixture(scope="module")
+def server():
+    with MockOpenAI() as server:
+        yield server
+
+
+@pytest.fixture(autouse=True)
+def reset(server):
+    server.requests.clear()
+    server.reply = PET_REPLY
+
+
+@pytest.fixture
+def client(server):
+    return openai.OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+
+
+def test_assistant_options_are_mapped_for_chat():
+    assert chat_options({"response_format": "auto", "temperature": 0.2}) == {"temperature": 0.2}
+    assert chat_options({"response_format": {"type": "json_object"}}) == {"response_format": {"type": "json_object"}}
+    assert chat_options({"description": "A pet", "metadata": {}, "tool_resources": {}, "top_p": 1}) == {"top_p": 1}
+
+
+def test_digipet_runs_on_the_chat_backend(client, server):
+    # the call of gpt_fun_digipet.py, with CONVERSATION_BACKEND=chat
+    chat = open_conversation(
+        client,
+        name="Digipet",
+        instructions="Provide a JSON output with a 'pattern' and a 'message'.",
+        model="gpt-4o-mini",
+        backend="chat",
+        response_format="auto",
+    )
+    assert isinstance(chat, ChatConversation)
+    deltas = []
+    reply, run = chat.stream("Hi!", on_delta=deltas.append)
+    assert reply == server.reply
+    assert "".join(deltas) == server.reply
+    assert run.status == "completed"
+    assert [path for _, path, _, _ in server.requests] == ["/chat/completions"]
+
+
+def test_the_mock_rejects_assistants_values(client):
+    with pytest.raises(openai.BadRequestError):
+        client.chat.completions.create(model="gpt-4o-mini", messages=[], response_format="auto")
+
+
+def test_chat_sends_the_history(client):
+    chat = open_conversation(client, name="BOT", instructions="Be brief.", model="gpt-4o-mini", backend="chat")
+    chat.send("One")
+    chat.send("Two")
+    assert [m["role"] for m in chat.messages] == ["system", "user", "assistant", "user", "assistant"]
+
+
+def test_unknown_backends_are_rejected(client):
+    with pytest.raises(ValueError, match="Unknown conversation backend"):
+        open_conversation(client, name="BOT", instructions="", model="gpt-4o-mini", backend="local")
+
+
+def test_tools_keep_the_assistants_backend(client, monkeypatch):
+    opened = []
+    monkeypatch.setattr(conversation, "AssistantConversation", lambda *args, **kwargs: opened.append(args))
+    open_conversation(client, name="BOT", instructions="", model="gpt-4o-mini", backend="chat",
+                      tools=[{"type": "code_interpreter"}])
+    assert len(opened) == 1
+
+
+def test_the_window_covers_the_verbatim_turns_in_the_thread(client, server):
+    assistant = client.beta.assistants.create(name="BOT", instructions="", model="gpt-mock")
+    chat = open_conversation(client, name="BOT", instructions="", model="gpt-mock", backend="assistants",
+                             assistant_id=assistant.id, keep_turns=2)
+    server.reply = "A reply."
+    chat.send("one")
+    server.reply = ""  # an empty reply is not added to the history, but stays in the thread
+    chat.send("two")
+    server.reply = "A reply."
+    chat.stream("three")
+    chat.send("four")
+    thread = [message["content"][0]["text"]["value"] for message in server.threads[chat.thread.id]]
+    assert thread == ["one", "A reply.", "two", "", "three", "A reply.", "four", "A reply."]
+    # "three" and "four" are sent verbatim, and the messages after them
+    assert chat._window() == 1 + 4
+    chat.history.keep_turns = 3
+    assert chat._window() == 1 + 8
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import history
+from history import History
+
+
+class FakeCompletions:
+    def __init__(self, text="They talked about the fan."):
+        self.text = text
+        self.requests = []
+
+    def create(self, **params):
+        self.requests.append(params)
+        if isinstance(self.text, Exception):
+            raise self.text
+        message = SimpleNamespace(content=self.text)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def make_history(budget=1000, keep_turns=2, text="They talked about the fan."):
+    completions = FakeCompletions(text)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return History(client, "gpt-4o-mini", budget, keep_turns), completions
+
+
+def test_only_the_latest_turns_are_sent():
+    chat, _ = make_history()
+    for n in range(4):
+        chat.add(f"question {n}", f"answer {n}")
+    assert chat.recent() == [("question 2", "answer 2"), ("question 3", "answer 3")]
+
+
+def test_without_a_budget_every_turn_is_sent():
+    chat, completions = make_history(budget=0)
+    for n in range(4):
+        chat.add(f"question {n}", f"answer {n}")
+    assert len(chat.recent()) == 4
+    assert completions.requests == []
+
+
+def test_the_budget_drops_long_turns():
+    chat, _ = make_history(budget=60, keep_turns=3)
+    chat.add("short", "ok")
+    chat.add("long " * 100, "ok")
+    chat.add("short again", "ok")
+    assert chat.recent() == [("short again", "ok")]
+
+
+def test_turns_that_leave_the_window_are_summarized():
+    chat, completions = make_history()
+    for n in range(3):
+        chat.add(f"question {n}", f"answer {n}")
+    chat.wait()
+    assert "user: question 0" in completions.requests[0]["messages"][1]["content"]
+    assert "question 1" not in completions.requests[0]["messages"][1]["content"]
+    messages = chat.messages()
+    assert messages[0] == {"role": "system", "content": "Summary of the earlier conversation: They talked about the fan."}
+    assert [m["content"] for m in messages[1:]] == ["question 1", "answer 1", "question 2", "answer 2"]
+
+
+def test_a_failed_summary_keeps_the_previous_one(capsys):
+    chat, _ = make_history(text=ConnectionError("offline"))
+    chat.summary = "Earlier summary."
+    for n in range(3):
+        chat.add(f"question {n}", f"answer {n}")
+    chat.wait()
+    assert chat.summary == "Earlier summary."
+    assert "Summary refresh failed, keeping the previous one: offline" in capsys.readouterr().out
+
+
+def test_token_estimate_without_tiktoken(monkeypatch):
+    monkeypatch.setattr(history, "_encoding", lambda: None)
+    assert history.count_tokens("x" * 40) == 11
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import http_pool
+from http_pool import Pool
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = Pool(keepalive=90, http2=False, keepwarm_rounds=2)
+    pinged = []
+
+    def ping(base_url):
+        pool.local.pinging = True
+        pool._touch(base_url + "/")
+        pinged.append(base_url)
+
+    monkeypatch.setattr(pool, "_ping", ping)
+    pool.pinged = pinged
+    return pool
+
+
+def test_keep_warm_stops_after_idle_rounds(pool, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(http_pool.time, "monotonic", lambda: now[0])
+    base_url = "https://api.openai.com/v1"
+    pool._touch("https://api.openai.com/v1/threads")
+    now[0] += 10
+    assert not pool._needs_ping(base_url, 45)  # used recently
+    rounds = 0
+    for _ in range(5):
+        now[0] += 45
+        rounds += pool._needs_ping(base_url, 45)
+    assert rounds == 2
+    pool._touch("https://api.openai.com/v1/audio/speech")
+    now[0] += 45
+    assert pool._needs_ping(base_url, 45)  # real traffic starts the rounds again
+
+
+def test_pings_are_not_traffic(pool):
+    base_url = "https://api.openweathermap.org"
+    pool._ping_all(base_url)
+    assert len(pool.pinged) == http_pool.CONNECTIONS
+    assert pool.last_used == {}
+    pool._touch(base_url + "/data/2.5/weather")
+    assert set(pool.last_used) == {base_url}
+
+
+def test_keep_warm_can_be_turned_off(monkeypatch):
+    pool = Pool(keepalive=90, http2=False, keepwarm_rounds=0)
+    opened = threading.Event()
+    monkeypatch.setattr(pool, "_open", lambda base_url: opened.set())
+    pool.warm("https://api.openai.com/v1")
+    assert opened.wait(1)
+    pool.thread.join(1)
+    assert not pool.thread.is_alive()
+
+
+def test_requests_is_not_imported_without_a_web_session():
+    # with FAST_STARTUP=0 lazy_import() imports at once, the scripts without a web API must not pay for requests
+    env = dict(os.environ, FAST_STARTUP="0", TRACE_PORT="", TRACE_JSONL="")
+    code = "import sys, http_pool; print('requests' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(http_pool.__file__), env=env,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
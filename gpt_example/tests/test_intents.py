@@ -0,0 +1,85 @@
+import pytest
+
+from intents import IntentMatcher, fan_intents, lamp_intents, normalize, volume_intents, words_to_numbers
+
+
+def test_number_words():
+    assert words_to_numbers("forty five percent") == "45 percent"
+    assert words_to_numbers("one hundred") == "100"
+    assert words_to_numbers("one hundred ten") == "110"
+    assert words_to_numbers("two three") == "2 3"
+
+
+def test_normalize_drops_fillers_and_punctuation():
+    assert normalize("Could you please turn the fan off?") == "turn fan off"
+    assert normalize("Set it to 40%!") == "set it to 40 percent"
+
+
+@pytest.mark.parametrize("text, speed, expected", [
+    ("Stop the fan.", 60, 0),
+    ("turn it off please", 60, 0),
+    ("turn on the fan", 0, 50),
+    ("turn on the fan", 30, 30),
+    ("faster", 30, 40),
+    ("speed up the fan by twenty percent", 30, 50),
+    ("slow down", 5, 0),
+    ("set the fan speed to forty five", 0, 45),
+    ("80%", 0, 80),
+    ("full speed", 0, 100),
+    ("turn it up", 95, 100),
+])
+def test_fan_commands(text, speed, expected):
+    assert fan_intents.match(text, speed=speed)["speed"] == expected
+
+
+@pytest.mark.parametrize("text", [
+    "set the fan to 150",
+    "why is the fan so loud",
+    "stop the fan and turn on the light",
+    "",
+])
+def test_other_utterances_go_to_the_assistant(text):
+    assert fan_intents.match(text, speed=30) is None
+
+
+def test_lamp_colors():
+    assert lamp_intents.match("Make the light warm white.")["color"] == [1, 0.7, 0.4]
+    assert lamp_intents.match("red")["color"] == [1, 0, 0]
+    assert lamp_intents.match("lights off")["color"] == [0, 0, 0]
+    assert lamp_intents.match("I feel blue today") is None
+
+
+def test_volume_commands():
+    assert volume_intents.match("louder", volume=50)["volume"] == 60
+    assert volume_intents.match("turn the volume down by 25", volume=50)["volume"] == 25
+    assert volume_intents.match("mute") == {"volume": 0, "message": "Muted."}
+    assert volume_intents.match("volume to 120", volume=50) is None
+
+
+def test_conflicting_rules_are_ambiguous():
+    matcher = IntentMatcher("test")
+
+    @matcher.intent("on", r"switch")
+    def on(match):
+        return {"power": 1}
+
+    @matcher.intent("off", r"switch")
+    def off(match):
+        return {"power": 0}
+
+    assert matcher.match("switch") is None
+    assert matcher.ambiguous == 1
+
+
+def test_agreeing_rules_and_the_report():
+    matcher = IntentMatcher("test")
+
+    @matcher.intent("on", r"on", r"(?:on|start)")
+    def on(match):
+        return {"power": 1}
+
+    assert matcher.report() == "test intents: no commands yet"
+    assert matcher.match("on") == {"power": 1}
+    assert matcher.match("off") is None
+    assert matcher.hits["on"] == 1
+    assert matcher.report() == "test intents: 1 local, 1 to the assistant (0 ambiguous), 50% local"
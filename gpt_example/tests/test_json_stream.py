@@ -0,0 +1,60 @@
+import pytest
+
+import json_stream
+from json_stream import JSONStream, parse_reply
+
+REPLY = '```json\n{"color": [1, 0, 0.5], "speed": 40, "on": true, "message": "Red, \\"warm\\" {light}, ok?"}\n```'
+
+
+def feed_in_pieces(text, size, callbacks=None):
+    parser = JSONStream(callbacks)
+    for start in range(0, len(text), size):
+        parser.feed(text[start:start + size])
+    return parser
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(REPLY)])
+def test_the_same_fields_whatever_the_deltas(size):
+    assert feed_in_pieces(REPLY, size).close() == {
+        "color": [1, 0, 0.5], "speed": 40, "on": True, "message": 'Red, "warm" {light}, ok?',
+    }
+
+
+def test_fields_are_reported_as_soon_as_they_are_complete():
+    seen = []
+    parser = JSONStream({"color": lambda value: seen.append(("color", value))})
+    parser.feed('{"color": [0, 1')
+    assert seen == []
+    parser.feed(', 0], "message": "Gre')
+    assert seen == [("color", [0, 1, 0])]
+
+
+def test_python_literals_are_accepted():
+    reply = "{'pattern': [0b00111100, 0b01000010], 'message': 'Hi!', 'happy': True}"
+    assert parse_reply(reply) == {"pattern": [60, 66], "message": "Hi!", "happy": True}
+
+
+def test_a_number_at_the_end_of_the_reply():
+    assert parse_reply('{"speed": 40') == {"speed": 40}
+
+
+def test_replies_without_an_object():
+    assert parse_reply("Sorry, I cannot do that.") is None
+
+
+def test_invalid_values_are_skipped():
+    assert parse_reply('{"color": [red], "message": "ok"}') == {"message": "ok"}
+
+
+def test_callback_errors_do_not_stop_the_stream(capsys):
+    def fail(value):
+        raise ValueError("no such color")
+
+    parser = feed_in_pieces('{"color": [9, 9, 9], "message": "ok"}', 4, {"color": fail})
+    assert parser.close() == {"color": [9, 9, 9], "message": "ok"}
+    assert "Error handling 'color': no such color" in capsys.readouterr().out
+
+
+def test_oversized_values_are_dropped(monkeypatch):
+    monkeypatch.setattr(json_stream, "MAX_VALUE_CHARS", 10)
+    assert parse_reply('{"data": "' + "x" * 50 + '", "message": "ok"}') == {"message": "ok"}
@@ -0,0 +1,89 @@
+import io
+import wave
+
+import pytest
+
+import local_tts
+from audio_player import ALARM, MUSIC, SPEECH
+from local_tts import ESpeak, Piper, prefer_local, synthesize
+from tracing import Tracer
+
+
+@pytest.fixture
+def binaries(monkeypatch):
+    """ The programs shutil.which() finds, none by default. """
+    found = {}
+    monkeypatch.setattr(local_tts.shutil, "which", lambda name: found.get(name))
+    return found
+
+
+def test_alerts_and_requested_short_phrases_are_local(monkeypatch):
+    monkeypatch.setattr(local_tts, "LOCAL_MAX_CHARS", 16)
+    assert not prefer_local("Access denied!", SPEECH)   # e.g. a sentence of a reply
+    assert prefer_local("Access denied!", SPEECH, local="short")
+    assert not prefer_local("The door is open. Access granted to Ann!", SPEECH, local="short")
+    assert prefer_local("The door is open. Access granted to Ann!", ALARM)
+    assert prefer_local("A long piece of background music", MUSIC, local=True)
+    assert not prefer_local("A long piece of background music", MUSIC)
+
+
+def test_no_engine_without_the_programs(binaries, capsys):
+    assert local_tts._find_engine("auto") is None
+    assert local_tts._find_engine("0") is None
+    assert capsys.readouterr().out == ""
+    assert local_tts._find_engine("espeak") is None
+    assert "TTS_LOCAL=espeak: engine not found" in capsys.readouterr().out
+
+
+def test_espeak_ng_is_preferred(binaries):
+    binaries["espeak"] = "/usr/bin/espeak"
+    assert local_tts._find_engine("auto").binary == "/usr/bin/espeak"
+    binaries["espeak-ng"] = "/usr/bin/espeak-ng"
+    assert local_tts._find_engine("auto").binary == "/usr/bin/espeak-ng"
+
+
+def test_piper_needs_its_model_config(binaries, monkeypatch, tmp_path, capsys):
+    model = tmp_path / "voice.onnx"
+    binaries["piper"] = "/usr/bin/piper"
+    binaries["espeak-ng"] = "/usr/bin/espeak-ng"
+    monkeypatch.setattr(local_tts, "PIPER_MODEL", str(model))
+    assert isinstance(local_tts._find_engine("auto"), ESpeak)
+    assert "voice.onnx.json not found" in capsys.readouterr().out
+
+    (tmp_path / "voice.onnx.json").write_text('{"audio": {"sample_rate": 22050}}')
+    engine = local_tts._find_engine("auto")
+    assert isinstance(engine, Piper) and engine.rate == 22050
+    assert isinstance(local_tts._find_engine("espeak"), ESpeak)
+
+
+def test_espeak_reads_the_frames_that_are_there(monkeypatch):
+    wav = io.BytesIO()
+    with wave.open(wav, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(22050)
+        out.writeframes(b"\x01\x00" * 100)
+    commands = []
+
+    def run(command, **kwargs):
+        commands.append(command)
+        return type("Result", (), {"stdout": wav.getvalue()})()
+
+    monkeypatch.setattr(local_tts.subprocess, "run", run)
+    pcm, rate = ESpeak("espeak-ng", voice="zh").synthesize("你好")
+    assert (len(pcm), rate) == (200, 22050)
+    assert commands == [["espeak-ng", "--stdout", "-v", "zh", "-s", "160", "你好"]]
+
+
+def test_synthesize_is_traced_by_reason(monkeypatch):
+    tracer = Tracer()
+    monkeypatch.setattr(local_tts, "tracer", tracer)
+
+    class Engine:
+        def synthesize(self, text):
+            return b"\x00\x00" * len(text), 16000
+
+    assert synthesize(Engine(), "Hi", "deadline") == (b"\x00\x00" * 2, 16000)
+    synthesize(Engine(), "Hi", "policy")
+    assert tracer.histograms["tts_local"].count == 2
+    assert tracer.counters == {("tts_local", (("reason", "deadline"),)): 1, ("tts_local", (("reason", "policy"),)): 1}
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+from message_cursor import MessageCursor
+
+
+def message(number, role="assistant", text=None, assistant_id="asst_1"):
+    block = SimpleNamespace(type="text", text=SimpleNamespace(value=text or f"reply {number}"))
+    return SimpleNamespace(id=f"msg_{number:03}", role=role, assistant_id=assistant_id, content=[block])
+
+
+class FakeMessages:
+    """ A thread held in memory, paged like the Assistants API. """
+
+    def __init__(self):
+        self.thread = []
+        self.calls = []
+
+    def list(self, thread_id, order, limit, after=None):
+        self.calls.append({"order": order, "after": after, "limit": limit})
+        ordered = self.thread if order == "asc" else list(reversed(self.thread))
+        if after is not None:
+            ids = [m.id for m in ordered]
+            ordered = ordered[ids.index(after) + 1:]
+        return SimpleNamespace(data=ordered[:limit], has_more=len(ordered) > limit)
+
+
+def make_cursor(page_size=4):
+    messages = FakeMessages()
+    client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(messages=messages)))
+    return MessageCursor(client, "thread_1", page_size=page_size), messages
+
+
+def test_first_fetch_reads_only_the_newest_page():
+    cursor, messages = make_cursor()
+    messages.thread = [message(n) for n in range(10)]
+    assert [m.id for m in cursor.fetch()] == ["msg_006", "msg_007", "msg_008", "msg_009"]
+    assert messages.calls == [{"order": "desc", "after": None, "limit": 4}]
+
+
+def test_fetch_returns_only_messages_after_the_mark():
+    cursor, messages = make_cursor()
+    question = message(1, role="user")
+    messages.thread = [message(0), question, message(2)]
+    cursor.mark(question)
+    assert [m.id for m in cursor.fetch()] == ["msg_002"]
+    assert cursor.fetch() == []
+
+
+def test_fetch_follows_pages():
+    cursor, messages = make_cursor(page_size=2)
+    messages.thread = [message(n) for n in range(7)]
+    cursor.mark(messages.thread[0])
+    assert [m.id for m in cursor.fetch()] == [f"msg_{n:03}" for n in range(1, 7)]
+    assert [call["after"] for call in messages.calls] == ["msg_000", "msg_002", "msg_004"]
+
+
+def test_replies_skip_user_messages_and_other_assistants():
+    cursor, messages = make_cursor()
+    question = message(0, role="user")
+    messages.thread = [
+        question,
+        message(1, text="Pro: yes.", assistant_id="asst_pro"),
+        message(2, text="Con: no.", assistant_id="asst_con"),
+        message(3, role="user"),
+    ]
+    cursor.mark(question)
+    assert cursor.replies(assistant_id="asst_con") == ["Con: no."]
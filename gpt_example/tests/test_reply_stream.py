@@ -0,0 +1,134 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from reply_stream import SentenceSplitter, SpeechPipeline, stream_reply
+
+
+def split(chunks, min_chars=20):
+    splitter = SentenceSplitter(min_chars)
+    sentences = []
+    for chunk in chunks:
+        sentences += splitter.feed(chunk)
+    return sentences, splitter.flush()
+
+
+def test_sentences_are_cut_as_they_complete():
+    splitter = SentenceSplitter(min_chars=5)
+    assert splitter.feed("Hello there, fri") == []
+    assert splitter.feed("end. How are") == ["Hello there, friend."]
+    assert splitter.flush() == ["How are"]
+
+
+def test_short_sentences_are_merged_with_the_next():
+    sentences, rest = split(["Hi. ", "Nice to meet you today. ", "Bye."])
+    assert sentences == ["Hi. Nice to meet you today."]
+    assert rest == ["Bye."]
+
+
+def test_cjk_punctuation_and_line_breaks_end_sentences():
+    sentences, rest = split(["今天天气很好。", "我们出去走走吧！", "好"], min_chars=3)
+    assert sentences == ["今天天气很好。", "我们出去走走吧！"]
+    assert rest == ["好"]
+    sentences, rest = split(["- first item in the list\n- second item in the list\n"])
+    assert sentences == ["- first item in the list", "- second item in the list"]
+    assert rest == []
+
+
+def test_pipeline_plays_in_order_and_wait_blocks_until_done():
+    played = []
+
+    def synthesize(text):
+        time.sleep(0.01 if text == "one" else 0)
+        return text.upper()
+
+    speech = SpeechPipeline(synthesize, played.append)
+    for text in ("one", "two", "three"):
+        speech.say(text)
+    speech.wait()
+    assert played == ["ONE", "TWO", "THREE"]
+
+
+def test_pipeline_survives_errors(capsys):
+    played = []
+
+    def synthesize(text):
+        if text == "bad":
+            raise RuntimeError("no audio")
+        return text
+
+    speech = SpeechPipeline(synthesize, played.append)
+    for text in ("good", "bad", "fine"):
+        speech.say(text)
+    speech.wait()
+    assert played == ["good", "fine"]
+    assert "Error in TTS: no audio" in capsys.readouterr().out
+
+
+def delta(text):
+    block = SimpleNamespace(type="text", text=SimpleNamespace(value=text))
+    return SimpleNamespace(event="thread.message.delta", data=SimpleNamespace(delta=SimpleNamespace(content=[block])))
+
+
+class FakeStream:
+    def __init__(self, events):
+        self.events = events
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def get_final_run(self):
+        return SimpleNamespace(status="completed", usage=None)
+
+
+def test_stream_reply_returns_the_text_and_speaks_sentences():
+    events = [SimpleNamespace(event="thread.run.created")]
+    events += [delta(text) for text in ("The fan is ", "on now, at half speed. ", "Anything else?")]
+    client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=SimpleNamespace(
+        stream=lambda **kwargs: FakeStream(events)
+    ))))
+    sentences = []
+    deltas = []
+    reply, run = stream_reply(client, "thread_1", "asst_1", on_sentence=sentences.append, on_delta=deltas.append)
+    assert reply == "The fan is on now, at half speed. Anything else?"
+    assert run.status == "completed"
+    assert sentences == ["The fan is on now, at half speed.", "Anything else?"]
+    assert len(deltas) == 3
+
+
+def test_say_returns_immediately():
+    release = threading.Event()
+    speech = SpeechPipeline(lambda text: text, lambda clip: release.wait())
+    start = time.monotonic()
+    for text in ("a", "b", "c", "d"):
+        speech.say(text)
+    assert time.monotonic() - start < 0.1
+    release.set()
+    speech.wait()
+
+
+def test_a_sentence_synthesized_during_cancel_is_dropped():
+    started = threading.Event()
+    release = threading.Event()
+    played = []
+
+    def synthesize(text):
+        if text == "old":
+            started.set()
+            release.wait()
+        return text
+
+    speech = SpeechPipeline(synthesize, played.append)
+    speech.say("old")
+    started.wait()
+    speech.cancel()
+    release.set()
+    speech.say("new")
+    speech.wait()
+    assert played == ["new"]
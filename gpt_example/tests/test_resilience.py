@@ -0,0 +1,203 @@
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import resilience as resilience_module
+from mock_openai import MockOpenAI
+from resilience import Resilience, backoff, resilient_client, retryable
+
+REQUEST = httpx.Request("POST", "https://api.openai.com")
+
+
+def status_error(cls, status, message="error"):
+    return cls(message, response=httpx.Response(status, request=REQUEST), body=None)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience_module, "backoff", lambda attempt: 0)
+
+
+def failing(errors, result="ok"):
+    """ A function raising ``errors`` one per call, then returning ``result``; its calls are in .calls. """
+    errors = list(errors)
+
+    def func(*args, timeout=None, **kwargs):
+        func.calls.append(timeout)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    func.calls = []
+    return func
+
+
+def test_retryable_errors():
+    assert retryable(openai.APIConnectionError(request=REQUEST))
+    assert retryable(openai.APITimeoutError(request=REQUEST))
+    assert retryable(status_error(openai.RateLimitError, 429))
+    assert retryable(status_error(openai.InternalServerError, 503))
+    assert not retryable(status_error(openai.BadRequestError, 400))
+    assert not retryable(status_error(openai.AuthenticationError, 401))
+
+
+def test_backoff_is_capped():
+    assert all(0 <= backoff(attempt) <= resilience_module.BACKOFF_CAP for attempt in range(1, 20))
+    assert all(backoff(1) <= resilience_module.BACKOFF for _ in range(20))
+
+
+def test_call_retries_until_it_succeeds():
+    policy = Resilience(attempts=3)
+    func = failing([openai.APIConnectionError(request=REQUEST), status_error(openai.InternalServerError, 502)])
+    assert policy.call("chat", func) == "ok"
+    assert len(func.calls) == 3
+    assert func.calls[0] == policy.endpoint("chat").timeout()
+    assert policy.endpoint("chat").retries == 2
+
+
+def test_call_gives_up_after_the_last_attempt():
+    policy = Resilience(attempts=2)
+    func = failing([openai.APITimeoutError(request=REQUEST)] * 3)
+    with pytest.raises(openai.APITimeoutError):
+        policy.call("chat", func)
+    assert len(func.calls) == 2
+    assert policy.endpoint("chat").timeouts == 2
+
+
+def test_client_errors_are_not_retried():
+    policy = Resilience(attempts=3)
+    func = failing([status_error(openai.BadRequestError, 400)])
+    with pytest.raises(openai.BadRequestError):
+        policy.call("chat", func)
+    assert len(func.calls) == 1
+
+
+def test_deadline_follows_the_latency():
+    endpoint = Resilience().endpoint("speech")
+    assert endpoint.deadline() == resilience_module.DEFAULT_DEADLINES["speech"]
+    for _ in range(resilience_module.MIN_SAMPLES):
+        endpoint.observe(1.0)
+    assert endpoint.deadline() == pytest.approx(1.0 * resilience_module.K)
+    assert endpoint.timeout() == pytest.approx(endpoint.deadline() * resilience_module.TIMEOUT_FACTOR)
+
+
+def test_hedge_returns_the_faster_attempt_and_discards_the_other():
+    policy = Resilience()
+    endpoint = policy.endpoint("transcription")
+    for _ in range(resilience_module.MIN_SAMPLES):
+        endpoint.observe(0.4)   # deadline 0.6 s
+    calls = itertools.count()
+    discarded = []
+    released = threading.Event()
+
+    def transcribe(timeout=None):
+        if next(calls) == 0:
+            time.sleep(1.2)
+            return "slow"
+        return "fast"
+
+    def discard(result):
+        discarded.append(result)
+        released.set()
+
+    assert policy.call("transcription", transcribe, hedge=True, discard=discard) == "fast"
+    assert (endpoint.hedges, endpoint.hedge_wins) == (1, 1)
+    assert released.wait(2)
+    assert discarded == ["slow"]
+
+
+class FakeRuns:
+    """ runs.create and runs.poll failing as told, recording what was created and polled. """
+
+    def __init__(self, create_errors=(), poll_errors=()):
+        self.create_errors = list(create_errors)
+        self.poll_errors = list(poll_errors)
+        self.created = []
+        self.polled = []
+
+    def create(self, thread_id, timeout=None, **kwargs):
+        run = SimpleNamespace(id=f"run_{len(self.created) + 1}", thread_id=thread_id, status="queued")
+        if self.create_errors:
+            error = self.create_errors.pop(0)
+            if error == "sent":
+                # the run was created, but the response never arrived
+                self.created.append(run)
+                raise openai.APITimeoutError(request=REQUEST)
+            raise error
+        if any(run.status == "queued" for run in self.created):
+            raise status_error(openai.BadRequestError, 400, f"Thread {thread_id} already has an active run")
+        self.created.append(run)
+        return run
+
+    def poll(self, run_id, thread_id, timeout=None, poll_interval_ms=None):
+        self.polled.append(run_id)
+        if self.poll_errors:
+            raise self.poll_errors.pop(0)
+        return SimpleNamespace(id=run_id, thread_id=thread_id, status="completed")
+
+    def list(self, thread_id, order, limit):
+        return SimpleNamespace(data=list(reversed(self.created))[:limit])
+
+
+class FakeClient:
+    def __init__(self, runs):
+        self.runs = runs
+        self.audio = SimpleNamespace(
+            transcriptions=SimpleNamespace(), speech=SimpleNamespace(with_streaming_response=SimpleNamespace())
+        )
+        self.chat = SimpleNamespace(completions=SimpleNamespace())
+        self.beta = SimpleNamespace(threads=SimpleNamespace(runs=SimpleNamespace()))
+
+    def with_options(self, max_retries):
+        return SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=self.runs)))
+
+
+def test_a_failed_poll_polls_the_same_run_again():
+    runs = FakeRuns(poll_errors=[openai.APITimeoutError(request=REQUEST), openai.APIConnectionError(request=REQUEST)])
+    client = resilient_client(FakeClient(runs), Resilience(attempts=3))
+    run = client.beta.threads.runs.create_and_poll(thread_id="thread_1", assistant_id="asst_1")
+    assert run.status == "completed"
+    assert [run.id for run in runs.created] == ["run_1"]
+    assert runs.polled == ["run_1"] * 3
+
+
+def test_only_the_create_request_is_retried():
+    runs = FakeRuns(create_errors=[openai.APIConnectionError(request=REQUEST)])
+    client = resilient_client(FakeClient(runs), Resilience(attempts=3))
+    run = client.beta.threads.runs.create_and_poll(thread_id="thread_1", assistant_id="asst_1")
+    assert run.id == "run_1"
+    assert len(runs.created) == 1
+    assert runs.polled == ["run_1"]
+
+
+def test_a_create_that_reached_the_api_is_not_repeated():
+    runs = FakeRuns(create_errors=["sent"])
+    client = resilient_client(FakeClient(runs), Resilience(attempts=3))
+    run = client.beta.threads.runs.create_and_poll(thread_id="thread_1", assistant_id="asst_1")
+    assert run.id == "run_1"
+    assert len(runs.created) == 1
+
+
+def test_other_client_errors_of_create_are_raised():
+    runs = FakeRuns(create_errors=[status_error(openai.BadRequestError, 400, "Invalid assistant")])
+    client = resilient_client(FakeClient(runs), Resilience(attempts=3))
+    with pytest.raises(openai.BadRequestError):
+        client.beta.threads.runs.create_and_poll(thread_id="thread_1", assistant_id="asst_1")
+    assert runs.polled == []
+
+
+def test_create_and_poll_against_the_mock_server():
+    with MockOpenAI(latency={"run": 0.05}) as server:
+        client = resilient_client(openai.OpenAI(base_url=server.base_url, api_key="mock"), Resilience())
+        thread = client.beta.threads.create()
+        client.beta.threads.messages.create(thread_id=thread.id, role="user", content="Hi")
+        run = client.beta.threads.runs.create_and_poll(
+            thread_id=thread.id, assistant_id="asst_1", poll_interval_ms=20
+        )
+        assert run.status == "completed"
+        assert sum(1 for method, path, *_ in server.requests if method == "POST" and path.endswith("/runs")) == 1
@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import response_cache
+from json_stream import parse_reply
+from response_cache import CACHED_RUN, ResponseCache, quantize
+
+
+class FakeConversation:
+    def __init__(self, reply="Feeling fine. A bit warm.", status="completed"):
+        self.reply = reply
+        self.status = status
+        self.calls = 0
+
+    def stream(self, content, on_sentence=None):
+        self.calls += 1
+        for sentence in self.reply.split(". "):
+            on_sentence(sentence)
+        return self.reply, SimpleNamespace(status=self.status, usage=None)
+
+
+def test_quantize():
+    assert quantize(36.9, 0.5) == quantize(37.1, 0.5) == 74
+    assert quantize(37.3, 0.5) == 75
+    assert quantize(None, 0.5) is None
+    assert quantize(12, None) == 12
+
+
+def test_a_repeated_question_is_replayed_without_a_run():
+    cache = ResponseCache("test", buckets={"temperature": 0.5})
+    conversation = FakeConversation()
+    spoken = []
+    first = cache.stream(conversation, '{"t":36.7}', on_sentence=spoken.append, text="How do I feel?", temperature=36.9)
+    second = cache.stream(conversation, '{"t":36.9}', on_sentence=spoken.append, text="how do i feel", temperature=37.1)
+    assert conversation.calls == 1
+    assert second == (first[0], CACHED_RUN)
+    assert spoken == ["Feeling fine", "A bit warm."] * 2
+    assert cache.report().startswith("test responses: 1 of 2 cached (50%)")
+
+
+def test_other_readings_and_failed_runs_miss():
+    cache = ResponseCache("test", buckets={"temperature": 0.5})
+    conversation = FakeConversation(status="failed")
+    cache.stream(conversation, "hi", temperature=36.7)
+    cache.stream(conversation, "hi", temperature=36.7)
+    assert conversation.calls == 2
+    conversation.status = "completed"
+    cache.stream(conversation, "hi", temperature=36.7)
+    cache.stream(conversation, "hi", temperature=38.0)
+    assert conversation.calls == 4
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    cache = ResponseCache("test", ttl=60)
+    key = cache.key("hi")
+    cache.put(key, "Hello.", ["Hello."], 1.5)
+    assert cache.get(key) == ("Hello.", ["Hello."])
+    now[0] += 61
+    assert cache.get(key) is None
+    assert cache.saved == 1.5
+
+
+def test_the_oldest_entries_are_dropped():
+    cache = ResponseCache("test", max_entries=2)
+    for text in ("one", "two", "three"):
+        cache.put(cache.key(text), text, [text], 1)
+    assert cache.get(cache.key("one")) is None
+    assert cache.get(cache.key("three")) is not None
+
+
+def test_a_zero_ttl_disables_the_cache():
+    cache = ResponseCache("test", ttl=0)
+    conversation = FakeConversation()
+    cache.stream(conversation, "hi")
+    cache.stream(conversation, "hi")
+    assert conversation.calls == 2
+    assert cache.entries == {}
+
+
+def test_malformed_json_replies_are_not_stored_or_replayed():
+    cache = ResponseCache("test", valid=lambda reply: parse_reply(reply) is not None)
+    conversation = FakeConversation(reply="Sorry. I cannot do that")
+    cache.stream(conversation, "play a tune", temperature=20)
+    cache.stream(conversation, "play a tune", temperature=20)
+    assert conversation.calls == 2 and not cache.entries
+
+    # an entry that no longer parses, e.g. stored before the check, is a miss and is replaced
+    key = cache.key("play a tune", temperature=20)
+    cache.entries[key] = (float("inf"), "not json", ["not json"], 1.0)
+    conversation.reply = '{"message": "Here it is."}'
+    reply, run = cache.stream(conversation, "play a tune", temperature=20)
+    assert reply == '{"message": "Here it is."}' and run is not CACHED_RUN
+    assert cache.entries[key][1] == reply
+    assert cache.stream(conversation, "play a tune", temperature=20)[1] is CACHED_RUN
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from runtime import Runtime
+
+
+class Button:
+    when_activated = None
+
+
+def test_blocking_calls_run_in_threads():
+    runtime = Runtime(workers=4)
+    results = {}
+
+    async def main():
+        start = time.monotonic()
+        results["values"] = await asyncio.gather(*(runtime.call(time.sleep, 0.1) for _ in range(4)))
+        results["seconds"] = time.monotonic() - start
+        results["thread"] = await runtime.call(threading.current_thread)
+        with pytest.raises(ZeroDivisionError):
+            await runtime.call(lambda: 1 / 0)
+        with pytest.raises(RuntimeError, match="StopIteration"):
+            await runtime.call(next, iter([]))
+
+    runtime.run(main)
+    assert results["values"] == [None] * 4
+    assert results["seconds"] < 0.3
+    assert results["thread"] is not threading.main_thread()
+
+
+def test_sensors_made_before_the_loop_can_be_awaited():
+    readings = iter([-1, 5, 7, 9])
+    runtime = Runtime()
+    distance = runtime.sensor("distance", lambda: next(readings), interval=0.01, valid=lambda d: d > 0)
+    assert distance.changed is None  # no Event outside the loop
+    seen = []
+
+    async def main():
+        seen.append(await distance.wait())
+        seen.append(await distance.wait())
+
+    runtime.run(main)
+    assert seen == [5, 7]
+    assert distance.value == 7
+
+
+def test_sensor_errors_are_counted_and_reported_once(capsys):
+    runtime = Runtime()
+
+    def broken():
+        raise OSError("I2C timeout")
+
+    sensor = runtime.sensor("dht11", broken, interval=0.01)
+
+    async def main():
+        while sensor.errors < 3:
+            await asyncio.sleep(0.01)
+
+    runtime.run(main)
+    assert capsys.readouterr().out.count("Error reading dht11: I2C timeout") == 1
+    assert sensor.value is None
+
+
+def test_callbacks_run_on_the_loop():
+    runtime = Runtime()
+    button = Button()
+    events = []
+
+    async def pressed(name):
+        events.append(name)
+
+    runtime.on(button, "when_activated", pressed, "coroutine")
+    runtime.on(Button, "when_deactivated", events.append, "plain")
+    button.when_activated()  # before run(), ignored
+
+    async def main():
+        await runtime.call(button.when_activated)
+        await runtime.call(Button.when_deactivated)
+        while len(events) < 2:
+            await asyncio.sleep(0.01)
+
+    runtime.run(main)
+    assert sorted(events) == ["coroutine", "plain"]
+
+
+def test_task_errors_are_printed(capsys):
+    runtime = Runtime()
+
+    async def fail():
+        raise RuntimeError("motor stalled")
+
+    async def main():
+        task = runtime.spawn(fail())
+        await asyncio.wait([task])
+
+    runtime.run(main)
+    assert "Error in task: RuntimeError('motor stalled')" in capsys.readouterr().out
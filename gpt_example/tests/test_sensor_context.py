@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from sensor_context import ContextEncoder, compact, lookup, summarize
+
+WEATHER = {
+    "name": "Shenzhen",
+    "weather": [{"description": "light rain", "icon": "10d"}],
+    "main": {"temp": 21.3456, "humidity": 88, "pressure": 1012},
+}
+
+
+def test_lookup_follows_dotted_paths():
+    assert lookup(WEATHER, "weather.0.description") == "light rain"
+    assert lookup(WEATHER, "weather.3.description") is None
+    assert lookup(WEATHER, "main.temp.x") is None
+    assert lookup({"climate": None}, "climate.1") is None
+
+
+def test_summaries_of_values_and_pairs():
+    assert summarize([1, 2, 3, 4]) == {"count": 4, "min": 1, "max": 4, "mean": 2.5, "slope": 1}
+    assert summarize([(0, 10), (2, 14), (4, 18)])["slope"] == 2
+
+
+def test_mixed_series_are_rejected_or_kept_item_by_item():
+    mixed = [1.234, (2, 3.456)] * 6
+    with pytest.raises(ValueError, match="not a mix"):
+        summarize(mixed)
+    with pytest.raises(ValueError):
+        summarize([])
+    assert compact(mixed) == [1.2, [2, 3.5]] * 6
+
+
+def test_long_series_are_summarized_and_short_pairs_made_relative():
+    assert compact(list(range(20)))["count"] == 20
+    assert compact([(100.0, 1.04), (100.5, 2.06)]) == [[0, 1], [0.5, 2.1]]
+
+
+def test_only_declared_fields_are_encoded():
+    context = ContextEncoder({"temp": "main.temp", "sky": "weather.0.description", "wind": "wind.speed"})
+    text = context.encode(WEATHER, message="Should I take an umbrella?")
+    assert json.loads(text) == {"temp": 21.3, "sky": "light rain", "message": "Should I take an umbrella?"}
+    assert " " not in text.replace("light rain", "").replace("Should I take an umbrella?", "")
+    assert context.tokens < context.raw_tokens
+    assert context.report().startswith("context: ")
+
+
+def test_fields_index_into_tuples():
+    # as in gpt_fun_plant.py, the dht11 reads (humidity, temperature) and has no value before its first reading
+    context = ContextEncoder({"light": "light", "temperature": "climate.1", "humidity": "climate.0"})
+    assert context.project({"light": 2812, "climate": (62.0, 25.04)}) == {"light": 2812, "temperature": 25.04, "humidity": 62.0}
+    assert json.loads(context.encode({"light": 2812, "climate": None})) == {"light": 2812}
@@ -0,0 +1,91 @@
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import startup
+from message_cursor import MessageCursor
+from mock_openai import MockOpenAI
+from startup import Deferred, LazyModule, defer
+
+
+def test_lazy_module_imports_on_first_use():
+    module = LazyModule("json")
+    assert "not loaded" in repr(module)
+    assert module.dumps([1]) == "[1]"
+    assert "(loaded)" in repr(module)
+
+
+def test_lazy_import_is_eager_without_fast_startup(monkeypatch):
+    monkeypatch.setattr(startup, "FAST_STARTUP", False)
+    assert not isinstance(startup.lazy_import("json"), LazyModule)
+
+
+def test_defer_returns_at_once_and_waits_on_first_use():
+    release = threading.Event()
+
+    def create():
+        release.wait()
+        return SimpleNamespace(id="thread_1")
+
+    start = time.monotonic()
+    thread = Deferred(create, (), {})
+    assert time.monotonic() - start < 0.1
+    release.set()
+    assert thread.id == "thread_1"
+
+
+def test_deferred_errors_are_raised_on_use():
+    def fail():
+        raise ValueError("no network")
+
+    thread = Deferred(fail, (), {})
+    with pytest.raises(ValueError, match="no network"):
+        thread.id
+
+
+def test_defer_calls_now_without_fast_startup(monkeypatch):
+    monkeypatch.setattr(startup, "FAST_STARTUP", False)
+    assert defer(lambda x: x * 2, 21) == 42
+
+
+def test_cursor_does_not_wait_for_a_deferred_thread():
+    release = threading.Event()
+    listed = []
+
+    def create():
+        release.wait()
+        return SimpleNamespace(id="thread_1")
+
+    def list_messages(thread_id, **kwargs):
+        listed.append(thread_id)
+        return SimpleNamespace(data=[], has_more=False)
+
+    client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(messages=SimpleNamespace(list=list_messages))))
+    start = time.monotonic()
+    cursor = MessageCursor(client, Deferred(create, (), {}))
+    assert time.monotonic() - start < 0.1
+    release.set()
+    assert cursor.fetch() == []
+    assert listed == ["thread_1"]
+    assert MessageCursor(client, "thread_2").thread_id == "thread_2"
+
+
+def test_ready_counts_only_the_first_call(monkeypatch):
+    monkeypatch.setattr(startup, "_ready", None)
+    monkeypatch.setattr(startup, "_started", time.time() - 1)
+    first = startup.ready()
+    assert first >= 1
+    time.sleep(0.01)
+    assert startup.ready() == first
+
+
+def test_mock_server_ignores_clients_that_disconnect(capsys):
+    with MockOpenAI(latency={"setup": 0.2}) as server:
+        with socket.create_connection(server.server_address) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, b"\x01\x00\x00\x00\x00\x00\x00\x00")
+            sock.sendall(b"POST /v1/threads HTTP/1.1\r\nHost: x\r\nContent-Length: 2\r\n\r\n{}")
+        time.sleep(0.3)   # the reply is written to a reset connection
+    assert "Traceback" not in capsys.readouterr().err
@@ -0,0 +1,107 @@
+import time
+
+import httpx
+import openai
+import pytest
+import speech_recognition as sr
+
+import stt as stt_module
+from stt import SpeechToText, duration, make_stt, shorter_than
+
+
+class FakeBackend:
+    """ A backend returning its name, or raising the errors it is given one per call. """
+
+    def __init__(self, name, errors=(), available=True):
+        self.name = name
+        self.errors = list(errors)
+        self.is_available = available
+        self.calls = []
+
+    def available(self):
+        return self.is_available
+
+    def transcribe(self, audio, language=None, prompt=None):
+        self.calls.append((language, prompt))
+        if self.errors:
+            raise self.errors.pop(0)
+        return f"text from {self.name}"
+
+
+def speech(seconds, rate=16000):
+    return sr.AudioData(b"\x00\x00" * int(seconds * rate), rate, 2)
+
+
+def offline():
+    return openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+
+
+def auto(local=None, api=None):
+    backends = {"openai": api or FakeBackend("openai"), "local": local or FakeBackend("local")}
+    return SpeechToText(backends, rules=[shorter_than(4, "local")])
+
+
+def test_duration():
+    assert duration(speech(2.5)) == pytest.approx(2.5)
+
+
+def test_short_utterances_are_transcribed_locally():
+    stt = auto()
+    assert stt.route(speech(1)) == "local"
+    assert stt.route(speech(6)) == "openai"
+    assert stt.transcribe(speech(1), language=["zh", "en"]) == "text from local"
+
+
+def test_an_unavailable_backend_is_replaced_by_the_default():
+    stt = auto(local=FakeBackend("local", available=False))
+    assert stt.route(speech(1)) == "openai"
+
+
+def test_a_connection_error_falls_back_and_skips_the_api_for_a_while(capsys):
+    api = FakeBackend("openai", errors=[offline()])
+    stt = auto(api=api)
+    assert stt.transcribe(speech(6)) == "text from local"
+    assert stt.fallbacks == 1
+    assert "Error in openai speech-to-text" in capsys.readouterr().out
+    assert stt.offline_until > time.monotonic()
+    assert stt.route(speech(6)) == "local"
+    stt.offline_until = time.monotonic() - 1
+    assert stt.route(speech(6)) == "openai"
+
+
+def test_other_api_errors_fall_back_without_going_offline():
+    stt = auto(api=FakeBackend("openai", errors=[RuntimeError("bad audio")]))
+    assert stt.transcribe(speech(6)) == "text from local"
+    assert stt.offline_until == 0
+
+
+def test_a_failing_local_backend_falls_back_to_the_api():
+    stt = auto(local=FakeBackend("local", errors=[RuntimeError("out of memory")]))
+    assert stt.transcribe(speech(1)) == "text from openai"
+
+
+def test_errors_are_raised_without_a_fallback():
+    stt = SpeechToText({"openai": FakeBackend("openai", errors=[offline()])})
+    with pytest.raises(openai.APIConnectionError):
+        stt.transcribe(speech(1))
+    assert stt.fallbacks == 0
+
+
+def test_report():
+    stt = auto()
+    assert stt.report() == "stt: no transcriptions yet, 0 fallback"
+    stt.transcribe(speech(1))
+    stt.transcribe(speech(1))
+    stt.transcribe(speech(6))
+    report = stt.report()
+    assert report.startswith("stt: 1 openai (p50 ")
+    assert ", 2 local (p50 " in report
+    assert report.endswith(", 0 fallback")
+
+
+def test_make_stt_without_faster_whisper(monkeypatch, capsys):
+    monkeypatch.setattr(stt_module.LocalBackend, "available", staticmethod(lambda: False))
+    assert list(make_stt(None, backend="auto").backends) == ["openai"]
+    local = make_stt(None, backend="local")
+    assert local.default == "openai"
+    assert "STT_BACKEND=local needs faster-whisper" in capsys.readouterr().out
@@ -0,0 +1,59 @@
+import io
+import wave
+
+import openai
+import pytest
+import speech_recognition as sr
+
+import stt_upload
+from mock_openai import MockOpenAI
+from stt_upload import encode_speech
+
+
+def recording(seconds=0.5, rate=48000):
+    frames = b"".join(int(1000 * ((i // 20) % 2 * 2 - 1)).to_bytes(2, "little", signed=True)
+                      for i in range(int(seconds * rate)))
+    return sr.AudioData(frames, rate, 2)
+
+
+def test_wav_is_resampled_to_16_khz():
+    upload = encode_speech(recording(), codec="wav")
+    assert upload.name == "record.wav"
+    with wave.open(io.BytesIO(upload.getvalue())) as wav:
+        assert (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) == (16000, 1, 2)
+        assert wav.getnframes() == 8000
+
+
+def test_low_rates_are_not_upsampled():
+    upload = encode_speech(recording(rate=8000), codec="wav")
+    with wave.open(io.BytesIO(upload.getvalue())) as wav:
+        assert wav.getframerate() == 8000
+
+
+def test_unknown_codecs_are_rejected():
+    with pytest.raises(ValueError, match="Unknown STT codec: mp3"):
+        encode_speech(recording(), codec="mp3")
+
+
+def test_a_missing_encoder_falls_back_to_wav(monkeypatch, capsys):
+    monkeypatch.setattr(stt_upload, "_warned", set())
+
+    def missing(*args, **kwargs):
+        raise OSError("ffmpeg not found")
+
+    monkeypatch.setattr(stt_upload, "_opus", missing)
+    for _ in range(2):
+        upload = encode_speech(recording(), codec="opus")
+        assert upload.name == "record.wav"
+    assert capsys.readouterr().out.count("opus encoder unavailable") == 1
+
+
+def test_the_upload_is_smaller_than_the_recording():
+    audio = recording()
+    with MockOpenAI(transcript="Turn on the fan.") as server:
+        client = openai.OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+        text = client.audio.transcriptions.create(model="whisper-1", file=encode_speech(audio, codec="wav")).text
+    assert text == "Turn on the fan."
+    (method, path, size, _), = server.requests
+    assert (method, path) == ("POST", "/audio/transcriptions")
+    assert size < len(audio.get_wav_data()) / 2
@@ -0,0 +1,65 @@
+import json
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+from tracing import Tracer
+
+
+def test_histogram_buckets_and_tokens():
+    tracer = Tracer()
+    tracer.record("run", 0.3, usage=SimpleNamespace(prompt_tokens=50, completion_tokens=20, total_tokens=70))
+    tracer.record("run", 3.0, usage=SimpleNamespace(prompt_tokens=10, completion_tokens=None, total_tokens=10))
+    histogram = tracer.histograms["run"]
+    assert histogram.count == 2
+    assert histogram.sum == pytest.approx(3.3)
+    assert tracer.tokens["run"] == {"prompt_tokens": 60, "completion_tokens": 20, "total_tokens": 80}
+    text = tracer.prometheus()
+    assert 'voice_stage_seconds_bucket{stage="run",le="0.25"} 0' in text
+    assert 'voice_stage_seconds_bucket{stage="run",le="0.5"} 1' in text
+    assert 'voice_stage_seconds_bucket{stage="run",le="+Inf"} 2' in text
+    assert 'voice_tokens_total{stage="run",kind="prompt"} 60' in text
+
+
+def test_counters_are_labelled():
+    tracer = Tracer()
+    tracer.count("cache", result="hit")
+    tracer.count("cache", result="hit")
+    tracer.count("cache", result="miss")
+    text = tracer.prometheus()
+    assert text.count("# TYPE voice_cache_total counter") == 1
+    assert 'voice_cache_total{result="hit"} 2' in text
+    assert 'voice_cache_total{result="miss"} 1' in text
+
+
+def test_traced_functions_record_even_when_they_raise(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = Tracer(str(path))
+
+    @tracer.traced("run", usage=True)
+    def run():
+        return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=1, completion_tokens=2, total_tokens=3))
+
+    @tracer.traced("stt")
+    def fail():
+        raise RuntimeError("offline")
+
+    run()
+    with pytest.raises(RuntimeError):
+        fail()
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["stage"] for line in lines] == ["run", "stt"]
+    assert lines[0]["total_tokens"] == 3
+
+
+def test_metrics_are_served():
+    tracer = Tracer()
+    tracer.record("tts", 0.1)
+    server = tracer.serve(0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            assert 'voice_stage_seconds_count{stage="tts"} 1' in response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
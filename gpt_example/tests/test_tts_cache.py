@@ -0,0 +1,85 @@
+import os
+import time
+from types import SimpleNamespace
+
+from tts_cache import TTSCache
+
+
+class FakeResponse:
+    def __init__(self, audio):
+        self.audio = audio
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def read(self):
+        return self.audio
+
+
+class FakeClient:
+    def __init__(self):
+        self.requests = []
+        speech = SimpleNamespace(with_streaming_response=SimpleNamespace(create=self.create))
+        self.audio = SimpleNamespace(speech=speech)
+
+    def create(self, **params):
+        self.requests.append(params)
+        return FakeResponse(params["input"].encode())
+
+
+def test_the_api_is_called_only_on_a_miss(tmp_path):
+    cache = TTSCache(tmp_path)
+    client = FakeClient()
+    first = cache.speech_file(client, "Access denied!")
+    second = cache.speech_file(client, "Access denied!")
+    assert first == second
+    assert first.read_bytes() == b"Access denied!"
+    assert len(client.requests) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_the_key_covers_voice_and_format(tmp_path):
+    cache = TTSCache(tmp_path)
+    client = FakeClient()
+    cache.speech_file(client, "Hello")
+    cache.speech_file(client, "Hello", voice="nova")
+    cache.speech_file(client, "Hello", response_format="mp3")
+    assert len(client.requests) == 3
+
+
+def test_prewarmed_phrases_are_found_by_speak(tmp_path):
+    cache = TTSCache(tmp_path)
+    client = FakeClient()
+    cache.prewarm(client, ["Start exercise!"], background=False)
+    assert client.requests[0]["response_format"] == "pcm"
+    # speak() in tts_stream.py looks clips up in this format
+    assert cache.get("tts-1", "alloy", "pcm", "Start exercise!") is not None
+
+
+def test_prewarm_errors_are_reported(tmp_path, capsys):
+    cache = TTSCache(tmp_path)
+    client = FakeClient()
+
+    def fail(**params):
+        raise ConnectionError("offline")
+
+    client.audio.speech.with_streaming_response.create = fail
+    cache.prewarm(client, ["Hi"], background=False)
+    assert "Error pre-warming TTS cache: offline" in capsys.readouterr().out
+
+
+def test_least_recently_used_clips_are_evicted(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=25)
+    old = cache.put("tts-1", "alloy", "pcm", "one", b"1" * 10)
+    used = cache.put("tts-1", "alloy", "pcm", "two", b"2" * 10)
+    past = time.time() - 60
+    os.utime(old, (past, past))
+    os.utime(used, (past - 60, past - 60))
+    assert cache.get("tts-1", "alloy", "pcm", "two") == used  # touched, now the newest
+    cache.put("tts-1", "alloy", "pcm", "three", b"3" * 10)
+    assert cache.get("tts-1", "alloy", "pcm", "one") is None
+    assert cache.get("tts-1", "alloy", "pcm", "two") is not None
+    assert cache.get("tts-1", "alloy", "pcm", "three") is not None
@@ -0,0 +1,136 @@
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import tts_stream
+from audio_player import ALARM, AudioPlayer
+from tts_cache import TTSCache
+from tts_stream import speak
+
+TTS1 = b"\x01\x00" * 2400    # 100 ms from tts-1
+LOCAL = b"\x02\x00" * 2400   # 100 ms from the local engine, at the same rate
+
+
+class NullOutput:
+    def write(self, data):
+        pass
+
+
+class RecordingOutput:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+
+class FakeEngine:
+    def __init__(self, error=None):
+        self.error = error
+        self.texts = []
+
+    def synthesize(self, text):
+        self.texts.append(text)
+        if self.error is not None:
+            raise self.error
+        return LOCAL, 24000
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(tts_stream, "local_tts", lambda: engine)
+    monkeypatch.setattr(tts_stream, "DEADLINE", 0.1)
+    return engine
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def speech_client(chunks, release=None, error=None):
+    """ A client whose speech stream sends ``chunks``, once ``release`` is set, then raises ``error``. """
+
+    @contextmanager
+    def create(**params):
+        if release is not None:
+            release.wait()
+        if error is not None:
+            raise error
+
+        def iter_bytes(size):
+            yield from chunks
+
+        yield SimpleNamespace(iter_bytes=iter_bytes)
+
+    speech = SimpleNamespace(with_streaming_response=SimpleNamespace(create=create))
+    return SimpleNamespace(audio=SimpleNamespace(speech=speech))
+
+
+def test_wait_false_returns_before_the_download(tmp_path):
+    release = threading.Event()
+    cache = TTSCache(tmp_path)
+    client = speech_client([b"\x01\x00" * 2400], release)
+    clip = speak(client, "Hello!", wait=False, player=AudioPlayer(output=NullOutput()), cache=cache, local=False)
+    assert not clip.done.is_set()
+    release.set()
+    assert clip.done.wait(2)
+    # the worker caches the download once it is complete
+    wait_for(lambda: cache.get("tts-1", "alloy", "pcm", "Hello!") is not None)
+
+
+def test_background_errors_are_printed(tmp_path, capsys):
+    client = speech_client([], error=RuntimeError("no network"))
+    clip = speak(client, "Hello!", wait=False, player=AudioPlayer(output=NullOutput()), cache=TTSCache(tmp_path),
+                 local=False)
+    assert clip.done.wait(2)
+    wait_for(lambda: "Error in TTS: no network" in capsys.readouterr().out)
+
+
+def test_local_engine_takes_over_after_the_deadline(engine):
+    release = threading.Event()
+    output = RecordingOutput()
+    speak(speech_client([TTS1], release), "A sentence long enough for tts-1.", player=AudioPlayer(output=output),
+          cache=None)
+    release.set()
+    assert engine.texts == ["A sentence long enough for tts-1."]
+    assert LOCAL in output.data and b"\x01\x00" not in output.data
+
+
+def test_local_engine_takes_over_a_failing_tts1(engine):
+    output = RecordingOutput()
+    speak(speech_client([], error=RuntimeError("no network")), "A sentence long enough for tts-1.",
+          player=AudioPlayer(output=output), cache=None)
+    assert LOCAL in output.data
+
+
+def test_tts1_is_not_replaced_once_it_has_started(engine):
+    output = RecordingOutput()
+    speak(speech_client([TTS1]), "A sentence long enough for tts-1.", player=AudioPlayer(output=output), cache=None)
+    assert engine.texts == []
+    assert TTS1 in output.data
+
+
+def test_a_failing_local_engine_falls_back_to_tts1(engine, capsys):
+    engine.error = subprocess.CalledProcessError(1, ["espeak-ng"])
+    output = RecordingOutput()
+    speak(speech_client([TTS1]), "Attention! The door was opened.", player=AudioPlayer(output=output), cache=None,
+          priority=ALARM)
+    assert engine.texts == ["Attention! The door was opened."]
+    assert TTS1 in output.data
+    assert "Error in local TTS, using tts-1" in capsys.readouterr().out
+
+
+def test_short_sentences_of_a_reply_keep_the_tts1_voice(engine):
+    output = RecordingOutput()
+    speak(speech_client([TTS1]), "Sure.", player=AudioPlayer(output=output), cache=None)
+    assert engine.texts == [] and TTS1 in output.data
+    speak(speech_client([TTS1]), "Sure.", player=AudioPlayer(output=output), cache=None, local="short")
+    assert engine.texts == ["Sure."]
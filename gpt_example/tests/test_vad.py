@@ -0,0 +1,100 @@
+import array
+import math
+from types import SimpleNamespace
+
+import vad
+from vad import EchoGate, Endpointer, EnergyVAD, make_vad, rms, zero_crossings
+
+RATE = 16000
+FRAME = int(RATE * vad.FRAME_MS / 1000)  # samples per frame
+
+
+def tone(frames, amplitude=3000, hz=200):
+    samples = array.array("h", (int(amplitude * math.sin(2 * math.pi * hz * i / RATE)) for i in range(frames * FRAME)))
+    return samples.tobytes()
+
+
+def silence(frames):
+    return bytes(frames * FRAME * 2)
+
+
+class LoudVAD:
+    """ Speech is anything above a fixed level. """
+
+    def is_speech(self, frame):
+        return rms(frame) > 500
+
+
+def test_rms_and_zero_crossings():
+    assert rms(b"") == 0
+    assert rms(array.array("h", [3, -3, 3, -3]).tobytes()) == 3
+    assert zero_crossings(array.array("h", [1, -1, 1, 1, -1]).tobytes()) == 3
+
+
+def test_energy_vad_rejects_quiet_frames_and_hiss():
+    detector = EnergyVAD(SimpleNamespace(energy_threshold=1000), RATE)
+    assert not detector.is_speech(tone(1, amplitude=1000))
+    assert detector.is_speech(tone(1, amplitude=1800))
+    assert not detector.is_speech(tone(1, amplitude=1800, hz=7000))  # hiss: too many zero crossings
+    assert detector.is_speech(tone(1, amplitude=3000, hz=7000))       # loud enough to skip the check
+
+
+def test_make_vad_falls_back_to_energy():
+    detector = make_vad(SimpleNamespace(energy_threshold=300), 44100)
+    assert isinstance(detector, EnergyVAD)
+
+
+def test_utterance_ends_after_the_hangover():
+    endpointer = Endpointer(LoudVAD(), RATE, hangover=0.3)
+    assert endpointer.feed(silence(20)) is None
+    assert endpointer.feed(tone(30)) is None
+    assert endpointer.triggered
+    utterance = endpointer.feed(silence(20))
+    assert utterance is not None
+    frames = len(utterance) // (FRAME * 2)
+    preroll = round(vad.PREROLL * 1000 / vad.FRAME_MS)
+    tail = round(vad.TAIL * 1000 / vad.FRAME_MS)
+    assert frames == preroll + 30 + tail
+
+
+def test_clicks_do_not_start_an_utterance():
+    endpointer = Endpointer(LoudVAD(), RATE)
+    for _ in range(5):
+        endpointer.feed(tone(vad.ONSET_FRAMES - 1) + silence(1))
+    assert not endpointer.triggered
+
+
+def test_chunks_need_not_be_aligned_to_frames():
+    endpointer = Endpointer(LoudVAD(), RATE, hangover=0.09)
+    audio = silence(3) + tone(10) + silence(10)
+    utterance = None
+    for start in range(0, len(audio), 1000):
+        utterance = utterance or endpointer.feed(audio[start:start + 1000])
+    assert utterance is not None
+    assert len(utterance) % (FRAME * 2) == 0
+
+
+def test_max_seconds_cuts_long_utterances():
+    endpointer = Endpointer(LoudVAD(), RATE, max_seconds=0.6)
+    utterance = endpointer.feed(tone(100))
+    assert len(utterance) == 20 * FRAME * 2
+
+
+def test_echo_gate_ignores_the_played_audio():
+    played = [0]
+    gate = EchoGate(LoudVAD(), lambda: played[0], coupling=0.5)
+    echo = tone(1, amplitude=1500)
+    assert gate.is_speech(echo)  # nothing playing
+    played[0] = rms(echo) * 2
+    assert not gate.is_speech(echo)
+    assert gate.is_speech(tone(1, amplitude=8000))  # the user talking over it
+
+
+def test_echo_gate_learns_the_coupling():
+    played = rms(tone(1, amplitude=3000))
+    gate = EchoGate(LoudVAD(), lambda: played, coupling=1.0)
+    echo = tone(1, amplitude=1000)
+    for _ in range(100):
+        assert not gate.is_speech(echo)
+    assert abs(gate.coupling - 1 / 3) < 0.02
+    assert gate.is_speech(tone(1, amplitude=2100))  # quieter than the first guess allowed
@@ -0,0 +1,200 @@
+"""
+Per-stage latency tracing for the voice loops.
+
+Each traced call (speech_to_text, a run, messages.list, text_to_speech, ...)
+is timed with time.monotonic() and counted into a fixed-bucket histogram for
+its stage. Token counts from OpenAI run.usage are recorded with the run stage,
+and helpers such as the response cache add their own counters.
+The bookkeeping is a bisect and a few additions under a lock, so tracing can
+stay on all the time.
+
+Output is chosen with environment variables:
+    TRACE_JSONL=trace.jsonl   append one JSON line per traced call
+    TRACE_PORT=9464           serve the histograms as Prometheus text on
+                              http://127.0.0.1:9464/metrics
+
+Usage:
+    from tracing import span, trace_client, traced
+
+    client = trace_client(openai.OpenAI(api_key=OPENAI_API_KEY))  # runs and messages.list
+
+    @traced("stt")
+    def speech_to_text(audio_file):
+        ...
+
+    with span("lcd"):
+        lcd_print(weather_data)
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, float("inf"))
+TOKEN_KINDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+
+class Histogram:
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class Tracer:
+    """
+    :param jsonl_path: File to append one JSON line per traced call to, None for none.
+    """
+
+    def __init__(self, jsonl_path=None):
+        self.histograms = {}
+        self.tokens = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.jsonl = open(jsonl_path, "a", buffering=1) if jsonl_path else None
+        self.server = None
+
+    def record(self, stage, seconds, usage=None):
+        """ Add one timing, and the token counts of ``usage`` (a run.usage object) if given. """
+        tokens = {}
+        if usage is not None:
+            tokens = {kind: getattr(usage, kind, 0) or 0 for kind in TOKEN_KINDS}
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+            if tokens:
+                totals = self.tokens.setdefault(stage, dict.fromkeys(TOKEN_KINDS, 0))
+                for kind, value in tokens.items():
+                    totals[kind] += value
+            if self.jsonl:
+                self.jsonl.write(json.dumps(dict(ts=time.time(), stage=stage, seconds=round(seconds, 6), **tokens)) + "\n")
+
+    def count(self, name, value=1, **labels):
+        """ Add ``value`` to the counter ``name``, exported as voice_<name>_total{labels}. """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def span(self, stage):
+        """
+        Time a block. The yielded object takes ``usage`` for token accounting:
+
+            with tracer.span("run") as s:
+                run = ...
+                s.usage = run.usage
+        """
+        state = _Span()
+        start = time.monotonic()
+        try:
+            yield state
+        finally:
+            self.record(stage, time.monotonic() - start, state.usage)
+
+    def traced(self, stage, usage=False):
+        """
+        Decorator that times every call of a function.
+
+        :param usage: The function returns a run, record its usage.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage) as state:
+                    result = func(*args, **kwargs)
+                    if usage:
+                        state.usage = getattr(result, "usage", None)
+                    return result
+            return wrapper
+        return decorator
+
+    def prometheus(self):
+        """ Return the metrics in the Prometheus text exposition format. """
+        lines = [
+            "# HELP voice_stage_seconds Latency of voice pipeline stages.",
+            "# TYPE voice_stage_seconds histogram",
+        ]
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f'voice_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'voice_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'voice_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            lines.append("# HELP voice_tokens_total OpenAI tokens used, from run.usage.")
+            lines.append("# TYPE voice_tokens_total counter")
+            for stage, totals in sorted(self.tokens.items()):
+                for kind, value in totals.items():
+                    lines.append(f'voice_tokens_total{{stage="{stage}",kind="{kind[:-len("_tokens")]}"}} {value}')
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE voice_{name}_total counter")
+                    typed.add(name)
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f"voice_{name}_total{{{label_text}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port):
+        """ Serve /metrics on 127.0.0.1:``port`` from a daemon thread. """
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                data = tracer.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+
+class _Span:
+    usage = None
+
+
+# Shared tracer used by the example scripts
+tracer = Tracer(os.environ.get("TRACE_JSONL"))
+if os.environ.get("TRACE_PORT"):
+    tracer.serve(int(os.environ["TRACE_PORT"]))
+
+span = tracer.span
+traced = tracer.traced
+
+
+def trace_client(client, tracer=tracer):
+    """
+    Trace the OpenAI calls that the voice loops block on: runs.create_and_poll
+    ("run", with token usage) and messages.list ("fetch").
+
+    :return: The same client, for ``client = trace_client(openai.OpenAI(...))``.
+    """
+    runs = client.beta.threads.runs
+    messages = client.beta.threads.messages
+    runs.create_and_poll = tracer.traced("run", usage=True)(runs.create_and_poll)
+    messages.list = tracer.traced("fetch")(messages.list)
+    return client
@@ -0,0 +1,133 @@
+"""
+Content-addressed cache for OpenAI text-to-speech audio.
+
+Fixed phrases such as "Access denied!" or "Start exercise!" used to be
+synthesized and downloaded again every time they were spoken. The cache keeps
+each clip on disk under a hash of (model, voice, format, text), so a repeated
+phrase plays straight from the SD card. The least recently used clips are
+removed once the cache grows over its size limit.
+
+Usage:
+    from tts_cache import speech_cache
+
+    speech_cache.prewarm(client, ["Access denied!"])
+    speech_file_path = speech_cache.speech_file(client, "Access denied!")
+"""
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+CACHE_DIR = Path(__file__).parent / ".tts_cache"
+MAX_BYTES = 50 * 1024 * 1024  # 50 MB
+
+
+class TTSCache:
+    """
+    :param directory: Where the audio clips are stored.
+    :param max_bytes: Size limit of the cache, least recently used clips are evicted first.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model, voice, response_format, text):
+        raw = "\0".join((model, voice, response_format, text))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path(self, model, voice, response_format, text):
+        return self.directory / f"{self.key(model, voice, response_format, text)}.{response_format}"
+
+    def get(self, model, voice, response_format, text):
+        """ Return the path of a cached clip, or None on a miss. """
+        path = self.path(model, voice, response_format, text)
+        try:
+            # the modification time doubles as the LRU timestamp
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, model, voice, response_format, text, audio):
+        """ Store a clip and return its path. """
+        path = self.path(model, voice, response_format, text)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # write under a temporary name so a half-written clip is never played
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(audio)
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def speech_file(self, client, text, model="tts-1", voice="alloy", response_format="pcm"):
+        """
+        Return the path of an audio clip for ``text``, calling the TTS API only on a miss.
+
+        The default format is raw PCM, the one speak() in tts_stream.py looks up.
+        """
+        path = self.get(model, voice, response_format, text)
+        if path is not None:
+            self.hits += 1
+            return path
+        self.misses += 1
+        with client.audio.speech.with_streaming_response.create(
+            model=model,
+            voice=voice,
+            input=text,
+            response_format=response_format,
+        ) as response:
+            audio = response.read()
+        return self.put(model, voice, response_format, text, audio)
+
+    def prewarm(self, client, phrases, background=True, **kwargs):
+        """
+        Synthesize a list of phrases ahead of time, so they play without any
+        network round trip when they are first needed.
+
+        :param kwargs: model, voice and response_format, as for speech_file().
+        :return: The worker thread when ``background`` is True.
+        """
+        def worker():
+            for text in phrases:
+                try:
+                    self.speech_file(client, text, **kwargs)
+                except Exception as e:
+                    print(f"Error pre-warming TTS cache: {e}")
+
+        if not background:
+            worker()
+            return None
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        return thread
+
+    def evict(self):
+        """ Remove the least recently used clips until the cache fits in max_bytes. """
+        with self.lock:
+            files = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".tmp"):
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            for mtime, size, path in sorted(files):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+
+# Shared cache used by the example scripts
+speech_cache = TTSCache()
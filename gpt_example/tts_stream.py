@@ -0,0 +1,171 @@
+"""
+Zero-file text-to-speech playback.
+
+speech_file() downloads a whole clip and writes it to the SD card before a
+single sample is played. speak() requests raw PCM instead and feeds the HTTP
+response straight into the audio player, chunk by chunk, so playback starts
+as soon as the first chunk and a short jitter buffer have arrived. Volume is
+changed in memory, nothing is written to disk.
+
+Short phrases are still looked up in, and added to, the TTS cache, so fixed
+prompts keep playing without a network round trip. Long replies rarely repeat
+and are not stored.
+
+With a local engine installed (espeak-ng or piper, see local_tts.py), alerts
+and, on request, short phrases that are not cached are synthesized on the
+device, and it takes over any clip that tts-1 has not started within its
+deadline. If the engine fails, tts-1 is used.
+
+Usage:
+    from audio_player import ALARM
+    from tts_stream import speak
+
+    speak(client, "Hello there!")                 # blocks until played
+    clip = speak(client, "Louder.", gain_db=3, wait=False)   # returns once queued
+    speak(client, "Door opened!", wait=False, priority=ALARM, key="door")   # preempts the chat
+    speak(client, "Access denied!", local="short")   # on the device if there is a local engine
+"""
+import subprocess
+import threading
+
+from audio_player import PCM_RATE, SPEECH, convert, get_player
+from local_tts import DEADLINE, local_tts, prefer_local, synthesize
+from resilience import resilience
+from tracing import tracer
+from tts_cache import speech_cache
+
+STREAM_CHUNK = 4096   # bytes read from the response at a time, about 85 ms of audio
+CACHE_MAX_CHARS = 80  # longer texts are streamed without being stored
+
+
+class _Download:
+    """ tts-1 audio streamed into a clip, which the local engine can take over until the first chunk. """
+
+    def __init__(self, client, clip, keep):
+        self.client = client
+        self.clip = clip
+        self.keep = keep
+        self.chunks = []
+        self.error = None
+        self.fed = False
+        self.abandoned = False
+        self.lock = threading.Lock()
+        self.started = threading.Event()   # set on the first chunk, or when the download ends
+        self.finished = threading.Event()
+
+    def run(self, text, model, voice):
+        try:
+            with self.client.audio.speech.with_streaming_response.create(
+                model=model,
+                voice=voice,
+                input=text,
+                response_format="pcm",
+            ) as response:
+                for chunk in response.iter_bytes(STREAM_CHUNK):
+                    with self.lock:
+                        if self.abandoned:
+                            return
+                        self.clip.feed(chunk)
+                        self.fed = True
+                    self.started.set()
+                    if self.keep:
+                        self.chunks.append(chunk)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.started.set()
+            self.finished.set()
+
+    def abandon(self):
+        """ Stop feeding the clip, unless tts-1 has already started to. """
+        with self.lock:
+            if not self.fed:
+                self.abandoned = True
+            return self.abandoned
+
+
+def speak(client, text, model="tts-1", voice="alloy", gain_db=0, wait=True, player=None, cache=speech_cache,
+          cache_max_chars=CACHE_MAX_CHARS, priority=SPEECH, key=None, local=None):
+    """
+    Synthesize ``text`` and play it while it downloads.
+
+    :param gain_db: Volume change in decibels.
+    :param wait: Block until the clip has been played. Otherwise return once
+        it is queued, it is downloaded in the background and errors are printed.
+    :param player: The AudioPlayer to use, the shared one by default.
+    :param cache: The TTSCache to use, None to always stream.
+    :param cache_max_chars: Longest text that is stored in the cache, None for any length.
+    :param priority: ALARM, SPEECH or MUSIC, see audio_player.py.
+    :param key: While a clip with this key and priority waits to be played,
+        return it instead of synthesizing the text again.
+    :param local: True to use the local engine, False for tts-1 only, "short"
+        for the local engine if the text is short, None for alerts only; see
+        local_tts.py. Leave it None for the sentences of a reply.
+    :return: The queued clip, its ``done`` event is set once it has been played.
+    """
+    player = player or get_player()
+    if key is not None:
+        waiting = player.waiting(key, priority)
+        if waiting is not None:
+            if wait:
+                waiting.done.wait()
+            return waiting
+    if cache is not None:
+        path = cache.get(model, voice, "pcm", text)
+        if path is not None:
+            cache.hits += 1
+            return player.play(path, wait=wait, gain_db=gain_db, priority=priority, key=key)
+        cache.misses += 1
+
+    engine = local_tts() if local is not False else None
+    if engine is not None and prefer_local(text, priority, local):
+        try:
+            pcm, rate = synthesize(engine, text, "policy")
+        except (subprocess.CalledProcessError, OSError) as e:
+            # a broken engine must not silence an alert, tts-1 speaks it instead
+            print(f"Error in local TTS, using tts-1: {e}")
+            tracer.count("tts_local_failures", reason="error")
+            engine = None
+        else:
+            return player.play_pcm(pcm, rate, wait=wait, gain_db=gain_db, priority=priority, key=key)
+
+    keep = cache is not None and (cache_max_chars is None or len(text) <= cache_max_chars)
+    clip = player.open_stream(gain_db=gain_db, priority=priority, key=key)
+    download = _Download(client, clip, keep)
+
+    def fetch():
+        try:
+            if engine is None:
+                download.run(text, model, voice)
+            else:
+                threading.Thread(target=download.run, args=(text, model, voice), daemon=True).start()
+                download.started.wait(DEADLINE or resilience.endpoint("speech").deadline())
+                if download.abandon():
+                    # tts-1 missed its deadline or failed before any audio, the local engine takes over the clip
+                    reason = "error" if download.finished.is_set() else "deadline"
+                    pcm, rate = synthesize(engine, text, reason)
+                    clip.feed(convert(pcm, rate, 1, out_rate=PCM_RATE, out_channels=1))
+                else:
+                    download.finished.wait()
+        finally:
+            # on an error the partial clip still ends cleanly, and is not cached
+            clip.end()
+
+        if download.error is not None and not download.abandoned:
+            raise download.error
+        if keep and download.error is None and not download.abandoned:
+            cache.put(model, voice, "pcm", text, b"".join(download.chunks))
+
+    if not wait:
+        threading.Thread(target=_in_background, args=(fetch,), daemon=True).start()
+        return clip
+    fetch()
+    clip.done.wait()
+    return clip
+
+
+def _in_background(fetch):
+    try:
+        fetch()
+    except Exception as e:
+        print(f"Error in TTS: {e}")
@@ -0,0 +1,202 @@
+"""
+Frame-level voice activity detection and utterance endpointing.
+
+recognizer.listen() ends a phrase after ``pause_threshold`` seconds of
+silence, so with its default of 0.8 s every request waits most of a second
+before speech-to-text even starts. The Endpointer classifies short
+frames (30 ms) as speech or not and closes the utterance after a short,
+configurable hangover. Leading and trailing silence are trimmed, which also
+makes the upload smaller.
+
+Two detectors are available:
+    WebRTCVAD  the Google WebRTC detector, ``pip install webrtcvad``
+    EnergyVAD  no extra package: frame energy against the recognizer's
+               energy threshold, plus a zero-crossing check that rejects
+               hiss and clicks
+
+While the speaker plays, EchoGate wraps either one so that the device's
+own voice picked up by the microphone is not taken for the user's.
+
+Usage:
+    endpointer = Endpointer(make_vad(recognizer, rate), rate, hangover=0.4)
+    for chunk in chunks:
+        utterance = endpointer.feed(chunk)
+        if utterance is not None:
+            break
+"""
+import array
+import collections
+import math
+import sys
+
+FRAME_MS = 30          # webrtcvad accepts 10, 20 or 30 ms frames
+HANGOVER = 0.4         # seconds of non-speech that end an utterance
+ONSET_FRAMES = 3       # consecutive speech frames that start an utterance, filters out clicks
+PREROLL = 0.15         # seconds kept before the detected onset
+TAIL = 0.1             # seconds kept after the last speech frame
+MAX_ZCR_HZ = 5000      # zero crossings per second above which a frame is treated as noise
+WEBRTC_RATES = (8000, 16000, 32000, 48000)
+ECHO_MARGIN = 2.0      # over playback, speech must be this many times the expected echo RMS (6 dB)
+ECHO_COUPLING = 0.5    # first guess of the microphone RMS per played RMS, then learned
+ECHO_ADAPT = 0.05      # weight of each echo frame in the learned coupling
+
+
+def rms(data):
+    """ Root mean square energy of 16-bit little-endian PCM bytes. """
+    samples = array.array("h", data)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    if not samples:
+        return 0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+def zero_crossings(data):
+    """ Number of sign changes in 16-bit little-endian PCM bytes. """
+    samples = array.array("h", data)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return sum(1 for a, b in zip(samples, samples[1:]) if (a < 0) != (b < 0))
+
+
+class EnergyVAD:
+    """
+    :param recognizer: sr.Recognizer, its energy_threshold (kept up to date
+        by MicStream) separates speech from background noise.
+    :param rate: Sample rate of the frames.
+    """
+
+    def __init__(self, recognizer, rate):
+        self.recognizer = recognizer
+        self.rate = rate
+
+    def is_speech(self, frame):
+        energy = rms(frame)
+        threshold = self.recognizer.energy_threshold
+        if energy <= threshold:
+            return False
+        if energy > 2 * threshold:
+            return True  # clearly loud enough, skip the spectral check
+        # Voiced speech has most of its energy below a few kHz, hiss and clicks do not
+        seconds = len(frame) / 2 / self.rate
+        return zero_crossings(frame) / seconds < MAX_ZCR_HZ
+
+
+class WebRTCVAD:
+    """
+    :param rate: Sample rate of the frames, one of WEBRTC_RATES.
+    :param aggressiveness: 0 (least) to 3 (most aggressive at filtering out non-speech).
+    """
+
+    def __init__(self, rate, aggressiveness=2):
+        import webrtcvad  # pip install webrtcvad
+
+        if rate not in WEBRTC_RATES:
+            raise ValueError(f"webrtcvad does not support {rate} Hz")
+        self.rate = rate
+        self.vad = webrtcvad.Vad(aggressiveness)
+
+    def is_speech(self, frame):
+        return self.vad.is_speech(frame, self.rate)
+
+
+def make_vad(recognizer, rate, aggressiveness=2):
+    """ Return a WebRTCVAD when webrtcvad is installed and supports ``rate``, an EnergyVAD otherwise. """
+    try:
+        return WebRTCVAD(rate, aggressiveness)
+    except (ImportError, ValueError):
+        return EnergyVAD(recognizer, rate)
+
+
+class EchoGate:
+    """
+    Half-duplex echo gate, for listening while the speaker plays.
+
+    During playback a frame is speech only if the wrapped detector says so
+    and it is ECHO_MARGIN times louder than the echo expected from the
+    reference, the level of what was played. The echo path (microphone RMS
+    per played RMS) is learned from the other frames, so it follows the
+    volume setting and where the speaker is. Without playback the frames go
+    straight to the wrapped detector.
+
+    :param vad: An object with is_speech(frame).
+    :param reference: function() -> RMS of the audio played recently, 0 when silent.
+    :param margin: How much louder than the echo the user has to be.
+    """
+
+    def __init__(self, vad, reference, margin=ECHO_MARGIN, coupling=ECHO_COUPLING):
+        self.vad = vad
+        self.reference = reference
+        self.margin = margin
+        self.coupling = coupling
+
+    def is_speech(self, frame):
+        played = self.reference()
+        if not played:
+            return self.vad.is_speech(frame)
+        energy = rms(frame)
+        if energy > self.margin * self.coupling * played and self.vad.is_speech(frame):
+            return True
+        self.coupling += ECHO_ADAPT * (energy / played - self.coupling)
+        return False
+
+
+class Endpointer:
+    """
+    Cut a stream of 16-bit mono PCM chunks into one utterance.
+
+    :param vad: An object with is_speech(frame).
+    :param rate: Sample rate of the chunks.
+    :param hangover: Seconds of non-speech after which the utterance ends.
+    :param max_seconds: Upper bound on the utterance length, None for no limit.
+    """
+
+    def __init__(self, vad, rate, hangover=HANGOVER, max_seconds=None):
+        self.vad = vad
+        self.frame_bytes = int(rate * FRAME_MS / 1000) * 2
+        frame_seconds = FRAME_MS / 1000
+        self.hangover_frames = max(1, round(hangover / frame_seconds))
+        self.tail_frames = min(self.hangover_frames, round(TAIL / frame_seconds))
+        self.max_frames = round(max_seconds / frame_seconds) if max_seconds else None
+        self.pending = b""
+        self.preroll = collections.deque(maxlen=round(PREROLL / frame_seconds) + ONSET_FRAMES)
+        self.onset = 0
+        self.frames = None  # frames of the utterance, None until speech starts
+        self.silent = 0
+
+    @property
+    def triggered(self):
+        return self.frames is not None
+
+    def feed(self, chunk):
+        """
+        Add a chunk of audio.
+
+        :return: The utterance PCM bytes once it has ended, None before that.
+        """
+        data = self.pending + chunk
+        end = len(data) - len(data) % self.frame_bytes
+        self.pending = data[end:]
+        for start in range(0, end, self.frame_bytes):
+            frame = data[start:start + self.frame_bytes]
+            speech = self.vad.is_speech(frame)
+            if self.frames is None:
+                self.preroll.append(frame)
+                self.onset = self.onset + 1 if speech else 0
+                if self.onset >= ONSET_FRAMES:
+                    self.frames = list(self.preroll)
+                    self.silent = 0
+                continue
+            self.frames.append(frame)
+            self.silent = 0 if speech else self.silent + 1
+            if self.silent >= self.hangover_frames or (self.max_frames and len(self.frames) >= self.max_frames):
+                return self.finish()
+        return None
+
+    def finish(self):
+        """ End the utterance now and return it, with the trailing silence trimmed. """
+        frames = self.frames or []
+        cut = max(0, self.silent - self.tail_frames)
+        if cut:
+            frames = frames[:-cut]
+        return b"".join(frames)